@@ -1,10 +1,13 @@
+import os
+import sys
+
 from vercel_wsgi import handle
 
-# Import Flask app from lab
-from app.app import app as flask_app
+# Модули приложения (app.py, post_store.py) импортируют друг друга как модули верхнего уровня
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from app import app as flask_app
 
 
 def handler(request, response):
     return handle(request, response, flask_app)
-
-
@@ -1,13 +1,36 @@
+import math
+import os
 import random
-from functools import lru_cache
-from flask import Flask, render_template
-from faker import Faker
-
-fake = Faker()
+import threading
+from datetime import datetime, timedelta
+import click
+from flask import Flask, render_template, request, abort, jsonify, url_for
+from images import DEFAULT_WIDTHS, ResponsiveImages, build_images, load_manifest
+from comment_tree import CommentTree, as_comment_tree
+from post_store import GeneratedPostStore, file_version, load_post_store, page_summaries, write_post_file
+from response_cache import ResponseCache
 
 app = Flask(__name__)
 application = app
 
+# Посты генерируются детерминированно: пост с индексом i зависит только от seed и i,
+# поэтому все процессы отдают одно и то же. Собранный заранее файл (flask build-posts)
+# избавляет процессы от генерации совсем
+app.config['POSTS_SEED'] = 42
+app.config['POSTS_COUNT'] = 5
+app.config['POSTS_PER_PAGE'] = 10
+app.config['COMMENT_THREADS_PER_PAGE'] = 20
+app.config['POSTS_FILE'] = os.path.join(app.root_path, 'posts.bin')
+app.config['RESPONSE_CACHE_SIZE'] = 1024
+app.config['CACHE_STATS_ALLOWED'] = {'127.0.0.1', '::1'}
+app.config['IMAGES_DIR'] = os.path.join(app.static_folder, 'images')
+POSTS_BASE_DATE = datetime(2025, 1, 1)
+POSTS_PERIOD = timedelta(days=730)
+
+# Faker хранит состояние генератора в экземпляре, пересев и генерация должны идти под замком
+fake = None
+fake_lock = threading.Lock()
+
 images_ids = ['web-dev',
               'js-frameworks', 
               'database',
@@ -22,57 +45,174 @@ post_titles = [
     'Искусственный интеллект в программировании'
 ]
 
-def generate_comments(replies=True):
+programming_texts = [
+    "Веб-разработка — это увлекательная область программирования, которая включает в себя создание веб-сайтов и веб-приложений. Современные технологии позволяют создавать интерактивные и динамические веб-страницы, используя HTML, CSS и JavaScript. Фреймворки и библиотеки значительно упрощают процесс разработки и повышают производительность.",
+    
+    "JavaScript остается одним из самых популярных языков программирования. В 2024 году появились новые фреймворки и инструменты, которые делают разработку еще более эффективной. React, Vue.js, Angular продолжают развиваться, предлагая разработчикам мощные инструменты для создания современных пользовательских интерфейсов.",
+    
+    "Базы данных являются основой большинства современных приложений. Понимание принципов работы с реляционными и NoSQL базами данных критически важно для любого разработчика. SQL остается стандартом для работы с данными, а новые технологии, такие как MongoDB и Redis, открывают новые возможности.",
+    
+    "DevOps — это культура и набор практик, которые объединяют разработку программного обеспечения и IT-операции. Автоматизация процессов, непрерывная интеграция и развертывание (CI/CD), контейнеризация с Docker и оркестрация с Kubernetes стали неотъемлемой частью современной разработки.",
+    
+    "Искусственный интеллект и машинное обучение революционизируют программирование. От автоматической генерации кода до интеллектуальных помощников разработчика — ИИ становится неотъемлемой частью процесса создания программного обеспечения. Понимание основ ИИ становится все более важным для современных программистов."
+]
+
+def generate_comments(fake, rng, replies=True):
     comments = []
-    for _ in range(random.randint(1, 3)):
+    for _ in range(rng.randint(1, 3)):
         comment = { 'author': fake.name(), 'text': fake.text() }
         if replies:
-            comment['replies'] = generate_comments(replies=False)
+            comment['replies'] = generate_comments(fake, rng, replies=False)
         comments.append(comment)
     return comments
 
-def generate_post(i):
-    programming_texts = [
-        "Веб-разработка — это увлекательная область программирования, которая включает в себя создание веб-сайтов и веб-приложений. Современные технологии позволяют создавать интерактивные и динамические веб-страницы, используя HTML, CSS и JavaScript. Фреймворки и библиотеки значительно упрощают процесс разработки и повышают производительность.",
-        
-        "JavaScript остается одним из самых популярных языков программирования. В 2024 году появились новые фреймворки и инструменты, которые делают разработку еще более эффективной. React, Vue.js, Angular продолжают развиваться, предлагая разработчикам мощные инструменты для создания современных пользовательских интерфейсов.",
-        
-        "Базы данных являются основой большинства современных приложений. Понимание принципов работы с реляционными и NoSQL базами данных критически важно для любого разработчика. SQL остается стандартом для работы с данными, а новые технологии, такие как MongoDB и Redis, открывают новые возможности.",
-        
-        "DevOps — это культура и набор практик, которые объединяют разработку программного обеспечения и IT-операции. Автоматизация процессов, непрерывная интеграция и развертывание (CI/CD), контейнеризация с Docker и оркестрация с Kubernetes стали неотъемлемой частью современной разработки.",
-        
-        "Искусственный интеллект и машинное обучение революционизируют программирование. От автоматической генерации кода до интеллектуальных помощников разработчика — ИИ становится неотъемлемой частью процесса создания программного обеспечения. Понимание основ ИИ становится все более важным для современных программистов."
-    ]
-    
+def get_fake():
+    """Faker создается при первой генерации поста, вызывается под fake_lock.
+
+    Импорт и загрузка провайдеров локалей заметно замедляют холодный старт,
+    а /about и посты из собранного файла обходятся без Faker
+    """
+    global fake
+    if fake is None:
+        from faker import Faker
+        fake = Faker()
+    return fake
+
+def generate_post_summary(seed, count, i):
+    rng = random.Random(f'{seed}:{i}:post')
+    with fake_lock:
+        fake = get_fake()
+        fake.seed_instance(rng.getrandbits(64))
+        author = fake.name()
+        if i < len(post_titles):
+            title, text = post_titles[i], programming_texts[i]
+        else:
+            title, text = fake.sentence(nb_words=6).rstrip('.'), fake.paragraph(nb_sentences=8)
+    # Индекс совпадает с порядком «сначала новые»: даты строго убывают с ростом индекса
+    interval = POSTS_PERIOD / count
     return {
-        'title': post_titles[i],
-        'text': programming_texts[i],
-        'author': fake.name(),
-        'date': fake.date_time_between(start_date='-2y', end_date='now'),
-        'image_id': f'{images_ids[i]}.svg',
-        'comments': generate_comments()
+        'title': title,
+        'text': text,
+        'author': author,
+        'date': POSTS_BASE_DATE - interval * (i + rng.random()),
+        'image_id': f'{images_ids[i % len(images_ids)]}.svg',
     }
 
-@lru_cache
+def generate_post_comments(seed, i):
+    rng = random.Random(f'{seed}:{i}:comments')
+    with fake_lock:
+        fake = get_fake()
+        fake.seed_instance(rng.getrandbits(64))
+        return CommentTree.from_nested(generate_comments(fake, rng))
+
+def generate_post(seed, count, i):
+    return dict(generate_post_summary(seed, count, i), comments=generate_post_comments(seed, i))
+
+def build_posts(seed, count=5):
+    return [generate_post(seed, count, i) for i in range(count)]
+
+def generated_store():
+    seed, count = app.config['POSTS_SEED'], app.config['POSTS_COUNT']
+    return GeneratedPostStore(count,
+                              lambda i: generate_post_summary(seed, count, i),
+                              lambda i: generate_post_comments(seed, i))
+
+post_store = load_post_store(app.config['POSTS_FILE'], generated_store)
+post_store_version = file_version(app.config['POSTS_FILE'])
+post_store_lock = threading.Lock()
+
 def posts_list():
-    return sorted([generate_post(i) for i in range(5)], key=lambda p: p['date'], reverse=True)
+    return post_store
+
+def refresh_post_store():
+    """Переоткрывает хранилище, если файл постов пересобрали, и возвращает его версию"""
+    global post_store, post_store_version
+    version = file_version(app.config['POSTS_FILE'])
+    if version != post_store_version:
+        with post_store_lock:
+            if version != post_store_version:
+                # Старое хранилище не закрывается явно: запросы, которые уже его читают,
+                # дочитают посты, а отображение снимется, когда на него не останется ссылок
+                post_store = load_post_store(app.config['POSTS_FILE'], generated_store)
+                post_store_version = version
+    return version
+
+# Страницы зависят только от адреса и хранилища постов, поэтому ответы кешируются целиком
+# вместе с gzip/brotli-вариантами; смена версии файла постов сбрасывает кеш
+response_cache = ResponseCache(refresh_post_store, app.config['RESPONSE_CACHE_SIZE'])
+
+@app.cli.command('build-posts')
+@click.option('--seed', default=app.config['POSTS_SEED'], show_default=True)
+@click.option('--count', default=app.config['POSTS_COUNT'], show_default=True)
+@click.option('--output', default=app.config['POSTS_FILE'], show_default=True)
+def build_posts_command(seed, count, output):
+    """Собирает файл постов, который разделяют все процессы сервера."""
+    posts = (generate_post(seed, count, i) for i in range(count))
+    write_post_file(output, posts, count)
+    click.echo(f'Посты ({count}) сохранены в {output}')
+
+# Картинки из манифеста flask build-images отдаются через <picture> с srcset/sizes
+app.jinja_env.globals['responsive_image'] = ResponsiveImages(
+    load_manifest(app.config['IMAGES_DIR']),
+    lambda file_name: url_for('static', filename='images/' + file_name),
+)
+
+@app.cli.command('build-images')
+@click.option('--width', 'widths', multiple=True, type=int, default=DEFAULT_WIDTHS, show_default=True)
+@click.option('--quality', default=80, show_default=True)
+def build_images_command(widths, quality):
+    """Собирает уменьшенные копии, WebP/AVIF и оптимизированные SVG картинок static/images."""
+    manifest = build_images(app.config['IMAGES_DIR'], widths, quality, echo=click.echo)
+    click.echo(f'Картинки ({len(manifest)}) собраны, манифест обновлен')
 
 @app.route('/')
+@response_cache.cached
 def index():
     return render_template('index.html')
 
 @app.route('/posts')
+@response_cache.cached
 def posts():
-    return render_template('posts.html', title='Посты', posts=posts_list())
+    store = posts_list()
+    per_page = app.config['POSTS_PER_PAGE']
+    pages = max(1, math.ceil(len(store) / per_page))
+    page = request.args.get('page', 1, type=int)
+    if page < 1 or page > pages:
+        abort(404)
+    start = (page - 1) * per_page
+    return render_template('posts.html', title='Посты',
+                           posts=page_summaries(store, start, start + per_page),
+                           first_index=start, page=page, pages=pages)
 
 @app.route('/posts/<int:index>')
+@response_cache.cached
 def post(index):
-    p = posts_list()[index]
-    return render_template('post.html', title=p['title'], post=p)
+    store = posts_list()
+    if index >= len(store):
+        abort(404)
+    p = store[index]
+    comments = as_comment_tree(p['comments'])
+    per_page = app.config['COMMENT_THREADS_PER_PAGE']
+    comments_pages = comments.pages(per_page)
+    comments_page = request.args.get('comments_page', 1, type=int)
+    if comments_page < 1 or comments_page > comments_pages:
+        abort(404)
+    return render_template('post.html', title=p['title'], post=p, index=index,
+                           comments_total=len(comments),
+                           comments=comments.thread_page(comments_page, per_page),
+                           comments_page=comments_page, comments_pages=comments_pages)
 
 @app.route('/about')
+@response_cache.cached
 def about():
     return render_template('about.html', title='Об авторе')
 
+@app.route('/cache-stats')
+def cache_stats():
+    # Служебная статистика доступна только с адресов из CACHE_STATS_ALLOWED (по умолчанию локальных)
+    if request.remote_addr not in app.config['CACHE_STATS_ALLOWED']:
+        abort(404)
+    return jsonify(response_cache.stats())
+
 if __name__ == '__main__':
     app.run(debug=True, host='127.0.0.1', port=5000)
@@ -0,0 +1,103 @@
+import math
+from array import array
+
+ROOT = -1
+
+
+class Comment:
+    """Комментарий при обходе дерева; сами данные хранятся в массивах CommentTree"""
+
+    __slots__ = ('index', 'author', 'text', 'depth', 'parent')
+
+    def __init__(self, index, author, text, depth, parent):
+        self.index = index
+        self.author = author
+        self.text = text
+        self.depth = depth
+        self.parent = parent
+
+
+class CommentTree:
+    """Дерево комментариев в параллельных массивах.
+
+    Комментарии лежат в порядке прямого обхода (родитель, затем его ответы),
+    parents[i] — индекс родителя или -1 для комментария верхнего уровня.
+    Глубина и начала веток верхнего уровня вычисляются один раз при создании,
+    поэтому обход и постраничный вывод веток не требуют рекурсии.
+    """
+
+    __slots__ = ('authors', 'texts', 'parents', 'depths', 'thread_starts')
+
+    def __init__(self, authors, texts, parents):
+        self.authors = list(authors)
+        self.texts = list(texts)
+        self.parents = array('i', parents)
+        self.depths = array('H')
+        self.thread_starts = array('I')
+        for index, parent in enumerate(self.parents):
+            if parent == ROOT:
+                self.depths.append(0)
+                self.thread_starts.append(index)
+            elif 0 <= parent < index:
+                self.depths.append(self.depths[parent] + 1)
+            else:
+                raise ValueError(f'комментарий {index}: родитель {parent} должен идти раньше ответа')
+
+    @classmethod
+    def from_nested(cls, comments):
+        """Строит дерево из вложенных словарей {'author', 'text', 'replies'}"""
+        authors, texts, parents = [], [], []
+        stack = [(comment, ROOT) for comment in reversed(comments)]
+        while stack:
+            comment, parent = stack.pop()
+            index = len(authors)
+            authors.append(comment['author'])
+            texts.append(comment['text'])
+            parents.append(parent)
+            for reply in reversed(comment.get('replies') or []):
+                stack.append((reply, index))
+        return cls(authors, texts, parents)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['authors'], data['texts'], data['parents'])
+
+    def to_dict(self):
+        return {'authors': self.authors, 'texts': self.texts, 'parents': self.parents.tolist()}
+
+    def __len__(self):
+        return len(self.authors)
+
+    def __eq__(self, other):
+        if not isinstance(other, CommentTree):
+            return NotImplemented
+        return (self.authors, self.texts, self.parents) == (other.authors, other.texts, other.parents)
+
+    @property
+    def thread_count(self):
+        return len(self.thread_starts)
+
+    def walk(self, start=0, stop=None):
+        """Итеративный обход комментариев [start, stop) в порядке отображения"""
+        stop = len(self) if stop is None else stop
+        authors, texts, depths, parents = self.authors, self.texts, self.depths, self.parents
+        for index in range(start, stop):
+            yield Comment(index, authors[index], texts[index], depths[index], parents[index])
+
+    def pages(self, per_page):
+        return max(1, math.ceil(self.thread_count / per_page))
+
+    def thread_page(self, page, per_page):
+        """Комментарии веток верхнего уровня с номерами ((page - 1) * per_page, page * per_page]"""
+        first = (page - 1) * per_page
+        if first >= self.thread_count:
+            return iter(())
+        last = first + per_page
+        stop = self.thread_starts[last] if last < self.thread_count else len(self)
+        return self.walk(self.thread_starts[first], stop)
+
+
+def as_comment_tree(comments):
+    if isinstance(comments, CommentTree):
+        return comments
+    return CommentTree.from_nested(comments or [])
@@ -0,0 +1,152 @@
+import json
+import os
+import re
+from markupsafe import Markup, escape
+
+RASTER_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+DEFAULT_WIDTHS = (320, 640, 960, 1280)
+# Форматы в порядке предпочтения: первый поддерживаемый браузером <source> и будет выбран
+FORMATS = (('avif', 'image/avif', 'AVIF'), ('webp', 'image/webp', 'WEBP'))
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+
+SVG_COMMENT = re.compile(r'<!--.*?-->', re.S)
+SVG_BETWEEN_TAGS = re.compile(r'>\s+<')
+SVG_SPACES = re.compile(r'\s+')
+
+
+def optimize_svg(source):
+    """Убирает комментарии и лишние пробелы; разметка и атрибуты не меняются"""
+    source = SVG_COMMENT.sub('', source)
+    source = SVG_BETWEEN_TAGS.sub('><', source.strip())
+    source = SVG_SPACES.sub(' ', source)
+    return source.replace(' />', '/>').replace(' >', '>')
+
+
+def target_widths(width, widths):
+    """Ширины не больше исходной; сама исходная ширина тоже попадает в набор"""
+    return sorted({w for w in widths if w < width} | {width})
+
+
+def is_fresh(target, source):
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def build_raster(images_dir, name, widths, quality, formats, echo):
+    from PIL import Image
+
+    source = os.path.join(images_dir, name)
+    stem, ext = os.path.splitext(name)
+    fallback = 'png' if ext.lower() == '.png' else 'jpeg'
+    with Image.open(source) as image:
+        width, height = image.size
+        entry = {'width': width, 'height': height, 'fallback': fallback, 'variants': {}}
+        for fmt in (fallback,) + formats:
+            files = []
+            for w in target_widths(width, widths):
+                extension = 'jpg' if fmt == 'jpeg' else fmt
+                file_name = f'{BUILD_DIR}/{stem}-{w}.{extension}'
+                target = os.path.join(images_dir, file_name)
+                if not is_fresh(target, source):
+                    resized = image if w == width else image.resize(
+                        (w, round(height * w / width)), Image.Resampling.LANCZOS)
+                    if fmt == 'jpeg' and resized.mode not in ('RGB', 'L'):
+                        resized = resized.convert('RGB')
+                    options = {'optimize': True} if fmt == 'png' else {'quality': quality}
+                    resized.save(target, format=fmt.upper(), **options)
+                files.append({'width': w, 'file': file_name})
+            entry['variants'][fmt] = files
+    echo(f'{name}: {width}x{height}, ширины {", ".join(str(f["width"]) for f in files)}')
+    return entry
+
+
+def build_svg(images_dir, name, echo):
+    source = os.path.join(images_dir, name)
+    file_name = f'{BUILD_DIR}/{name}'
+    target = os.path.join(images_dir, file_name)
+    with open(source, encoding='utf-8') as f:
+        original = f.read()
+    optimized = optimize_svg(original)
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write(optimized)
+    echo(f'{name}: {len(original.encode())} → {len(optimized.encode())} байт')
+    return {'file': file_name}
+
+
+def supported_formats():
+    from PIL import features
+    return tuple(fmt for fmt, _, feature in FORMATS if features.check(feature.lower()))
+
+
+def build_images(images_dir, widths=DEFAULT_WIDTHS, quality=80, echo=print):
+    """Собирает уменьшенные копии и WebP/AVIF всех картинок и пишет манифест.
+
+    Уже собранные файлы, которые новее исходников, не пересоздаются.
+    """
+    from PIL import UnidentifiedImageError
+
+    os.makedirs(os.path.join(images_dir, BUILD_DIR), exist_ok=True)
+    formats = supported_formats()
+    for fmt, _, _ in FORMATS:
+        if fmt not in formats:
+            echo(f'Pillow собран без поддержки {fmt}, этот формат пропущен')
+    manifest = {}
+    for name in sorted(os.listdir(images_dir)):
+        extension = os.path.splitext(name)[1].lower()
+        if extension in RASTER_EXTENSIONS:
+            try:
+                manifest[name] = build_raster(images_dir, name, widths, quality, formats, echo)
+            except UnidentifiedImageError:
+                echo(f'{name}: не удалось прочитать картинку, файл пропущен')
+        elif extension == '.svg':
+            manifest[name] = build_svg(images_dir, name, echo)
+    with open(os.path.join(images_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def load_manifest(images_dir):
+    path = os.path.join(images_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def render_attrs(attrs):
+    return ''.join(f' {key.rstrip("_").replace("_", "-")}="{escape(value)}"'
+                   for key, value in attrs.items() if value is not None)
+
+
+class ResponsiveImages:
+    """Помощник шаблонов: <picture> с srcset/sizes по манифесту собранных картинок.
+
+    Если картинки нет в манифесте (сборку не запускали), выводится обычный <img>.
+    """
+
+    def __init__(self, manifest, url):
+        self.manifest = manifest
+        self.url = url
+
+    def srcset(self, files):
+        return ', '.join(f'{self.url(item["file"])} {item["width"]}w' for item in files)
+
+    def __call__(self, name, sizes='100vw', **attrs):
+        entry = self.manifest.get(name)
+        if entry is None:
+            return Markup(f'<img src="{escape(self.url(name))}"{render_attrs(attrs)}>')
+        if 'variants' not in entry:
+            return Markup(f'<img src="{escape(self.url(entry["file"]))}"{render_attrs(attrs)}>')
+
+        sources = []
+        for fmt, mimetype, _ in FORMATS:
+            files = entry['variants'].get(fmt)
+            if files:
+                sources.append(f'<source type="{mimetype}" srcset="{escape(self.srcset(files))}" '
+                               f'sizes="{escape(sizes)}">')
+        fallback = entry['variants'][entry['fallback']]
+        img_attrs = dict(attrs, width=entry['width'], height=entry['height'])
+        img = (f'<img src="{escape(self.url(fallback[-1]["file"]))}" '
+               f'srcset="{escape(self.srcset(fallback))}" sizes="{escape(sizes)}"'
+               f'{render_attrs(img_attrs)}>')
+        return Markup(f'<picture>{"".join(sources)}{img}</picture>')
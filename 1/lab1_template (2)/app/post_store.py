@@ -0,0 +1,189 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from comment_tree import CommentTree, as_comment_tree
+
+# Формат файла: сигнатура, число постов, таблица смещений (2 * count + 1 чисел),
+# затем для каждого поста две записи в JSON: заголовок поста и массивы его
+# дерева комментариев (CommentTree).
+# Файл отображается в память, поэтому все процессы сервера делят одни и те же
+# страницы, пост читается по индексу, а список постов не декодирует комментарии
+MAGIC = b'POSTS\x00\x00\x03'
+HEADER = struct.Struct('<8sQ')
+OFFSET = struct.Struct('<Q')
+
+
+def encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def split_post(post):
+    summary = {k: v for k, v in post.items() if k != 'comments'}
+    summary['date'] = post['date'].isoformat()
+    return encode(summary), encode(as_comment_tree(post['comments']).to_dict())
+
+
+def decode_summary(raw):
+    summary = json.loads(raw)
+    summary['date'] = datetime.fromisoformat(summary['date'])
+    return summary
+
+
+def write_post_file(path, posts, count):
+    """Потоково записывает count постов в файл и атомарно подменяет им старый"""
+    tmp_path = path + '.tmp'
+    offsets = [0]
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, count))
+        # Таблица смещений известна только после записи постов, место под нее резервируется
+        table_start = f.tell()
+        f.write(b'\x00' * OFFSET.size * (2 * count + 1))
+        written = 0
+        for post in posts:
+            for record in split_post(post):
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+            written += 1
+        if written != count:
+            raise ValueError(f'ожидалось {count} постов, получено {written}')
+        f.seek(table_start)
+        f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+    os.replace(tmp_path, path)
+
+
+class MappedPostStore:
+    """Посты из файла, отображенного в память; записи декодируются при обращении"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path}: неизвестный формат файла постов')
+        self._offsets_start = HEADER.size
+        self._data_start = HEADER.size + OFFSET.size * (2 * self._count + 1)
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Снимает отображение файла; дескриптор закрывается сразу после mmap"""
+        self._mmap.close()
+
+    @property
+    def closed(self):
+        return self._mmap.closed
+
+    def _record(self, number):
+        start, end = struct.unpack_from('<2Q', self._mmap, self._offsets_start + OFFSET.size * number)
+        return self._mmap[self._data_start + start:self._data_start + end]
+
+    def _check(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('post index out of range')
+        return index
+
+    def summary(self, index):
+        return decode_summary(self._record(2 * self._check(index)))
+
+    def summaries(self, start, stop):
+        return [self.summary(i) for i in range(start, min(stop, self._count))]
+
+    def __getitem__(self, index):
+        index = self._check(index)
+        post = decode_summary(self._record(2 * index))
+        post['comments'] = CommentTree.from_dict(json.loads(self._record(2 * index + 1)))
+        return post
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+
+class GeneratedPostStore:
+    """Посты, которые генерируются по индексу при первом обращении.
+
+    make_summary(i) и make_comments(i) должны быть чистыми функциями индекса,
+    тогда содержимое не зависит ни от процесса, ни от порядка запросов.
+    Последние сгенерированные посты хранятся в ограниченном LRU-кеше.
+    """
+
+    def __init__(self, count, make_summary, make_comments, cache_size=1024):
+        self._count = count
+        self._make_summary = make_summary
+        self._make_comments = make_comments
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _check(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('post index out of range')
+        return index
+
+    def _cached(self, key, make):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = make()
+        with self._lock:
+            self._cache[key] = value
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def summary(self, index):
+        index = self._check(index)
+        return dict(self._cached(('summary', index), lambda: self._make_summary(index)))
+
+    def summaries(self, start, stop):
+        return [self.summary(i) for i in range(start, min(stop, self._count))]
+
+    def __getitem__(self, index):
+        index = self._check(index)
+        post = self.summary(index)
+        post['comments'] = self._cached(('comments', index), lambda: self._make_comments(index))
+        return post
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+
+def page_summaries(posts, start, stop):
+    """Посты страницы без комментариев; обычный список тоже поддерживается"""
+    if hasattr(posts, 'summaries'):
+        return posts.summaries(start, stop)
+    return [posts[i] for i in range(start, min(stop, len(posts)))]
+
+
+def file_version(path):
+    """Идентификатор версии файла постов; write_post_file подменяет файл, поэтому меняется inode"""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def load_post_store(path, fallback):
+    """Открывает собранный файл постов, а если его нет — создает хранилище fallback()"""
+    if path and os.path.exists(path):
+        return MappedPostStore(path)
+    return fallback()
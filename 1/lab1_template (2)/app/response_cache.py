@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаются gzip и исходное тело
+    brotli = None
+
+# Кодировки в порядке предпочтения при равном q в Accept-Encoding
+ENCODINGS = ('br', 'gzip')
+# Слишком короткие ответы не сжимаются: заголовки сжатия съедят выигрыш
+MIN_COMPRESS_SIZE = 256
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        # mtime=0 делает результат, а значит и ETag, одинаковым во всех процессах
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=11)
+    return None
+
+
+class CachedResponse:
+    """Отрендеренная страница со всеми заранее сжатыми вариантами"""
+
+    __slots__ = ('mimetype', 'variants')
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        # Каждое представление получает свой сильный ETag
+        self.variants = {None: (body, etag)}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            for encoding in ENCODINGS:
+                encoded = compress(body, encoding)
+                if encoded is not None and len(encoded) < len(body):
+                    self.variants[encoding] = (encoded, f'{etag}-{encoding}')
+
+    def matching_etag(self, if_none_match):
+        for _, etag in self.variants.values():
+            if if_none_match.contains(etag):
+                return etag
+        return None
+
+    def choose(self, accept_encodings):
+        best, best_quality = None, 0
+        for encoding in ENCODINGS:
+            quality = accept_encodings[encoding]
+            if encoding in self.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+
+class ResponseCache:
+    """Кеш целых ответов для страниц, которые зависят только от адреса и хранилища постов.
+
+    version() вызывается при каждом запросе; когда значение меняется
+    (например, пересобрали файл постов), кеш очищается целиком.
+    Хранит не больше max_size страниц, вытесняя давно запрошенные.
+    """
+
+    def __init__(self, version=lambda: None, max_size=1024):
+        self.version = version
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._current_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.not_modified = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
+
+    def _key(self):
+        return (request.endpoint,
+                tuple(sorted((request.view_args or {}).items())),
+                tuple(sorted(request.args.items(multi=True))))
+
+    def _get(self, key):
+        version = self.version()
+        with self._lock:
+            if version != self._current_version:
+                self._entries.clear()
+                self._current_version = version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def cached(self, view):
+        """Декоратор представления: кешируются только ответы 200"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = self._key()
+            entry = self._get(key)
+            if entry is None:
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response):
+                    response = Response(response)
+                if response.status_code != 200:
+                    return response
+                entry = CachedResponse(response.get_data(), response.mimetype)
+                self._put(key, entry)
+            return self.respond(entry)
+        return wrapper
+
+    def respond(self, entry):
+        etag = entry.matching_etag(request.if_none_match)
+        if etag is not None:
+            with self._lock:
+                self.not_modified += 1
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            return response
+        encoding = entry.choose(request.accept_encodings)
+        body, etag = entry.variants[encoding]
+        response = Response(body, mimetype=entry.mimetype)
+        if encoding is not None:
+            response.content_encoding = encoding
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response
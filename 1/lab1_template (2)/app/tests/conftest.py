@@ -2,10 +2,13 @@ from datetime import datetime
 import pytest
 from flask import template_rendered
 from contextlib import contextmanager
-from app import app as application
+from app import app as application, response_cache
 
 @pytest.fixture
 def app():
+    # Моки posts_list меняют содержимое страниц, кеш ответов не должен переживать тест
+    response_cache.clear()
+    response_cache.reset_stats()
     return application
 
 @pytest.fixture
@@ -1,3 +1,4 @@
+import pytest
 def test_posts_index(client):
     response = client.get("/posts")
     assert response.status_code == 200
@@ -17,3 +18,217 @@ def test_posts_index_template(client, captured_templates, mocker, posts_list):
         assert template.name == 'posts.html'
         assert context['title'] == 'Посты'
         assert len(context['posts']) == 1
+
+def test_posts_are_deterministic():
+    from app import build_posts
+    assert build_posts(42) == build_posts(42)
+    assert build_posts(42) != build_posts(43)
+
+def test_posts_sorted_by_date():
+    from app import build_posts
+    dates = [p['date'] for p in build_posts(42, count=50)]
+    assert dates == sorted(dates, reverse=True)
+
+def test_generated_post_does_not_depend_on_access_order():
+    from app import generate_post
+    later = generate_post(42, 100000, 99999)
+    generate_post(42, 100000, 5)
+    assert generate_post(42, 100000, 99999) == later
+
+def test_post_store_file_roundtrip(tmp_path):
+    from app import build_posts
+    from post_store import MappedPostStore, load_post_store, write_post_file
+    posts = build_posts(42, count=12)
+    path = str(tmp_path / 'posts.bin')
+    write_post_file(path, iter(posts), len(posts))
+    store = load_post_store(path, fallback=list)
+    assert isinstance(store, MappedPostStore)
+    assert len(store) == len(posts)
+    assert list(store) == posts
+    assert store[-1] == posts[-1]
+    assert 'comments' not in store.summary(3)
+    assert store.summaries(10, 20) == [store.summary(10), store.summary(11)]
+
+def test_generated_store_is_lazy():
+    from post_store import GeneratedPostStore
+    calls = []
+    def make_summary(i):
+        calls.append(i)
+        return {'title': str(i)}
+    store = GeneratedPostStore(100000, make_summary, lambda i: [], cache_size=2)
+    assert len(store) == 100000
+    assert store.summaries(20, 22) == [{'title': '20'}, {'title': '21'}]
+    assert calls == [20, 21]
+    with pytest.raises(IndexError):
+        store[100000]
+
+def test_post_page_is_stable(client):
+    first = client.get('/posts/0')
+    second = client.get('/posts/0')
+    assert first.status_code == 200
+    assert first.data == second.data
+
+def test_post_not_found(client):
+    response = client.get('/posts/100500')
+    assert response.status_code == 404
+
+def test_posts_page_not_found(client):
+    assert client.get('/posts?page=0').status_code == 404
+    assert client.get('/posts?page=2').status_code == 404
+
+def test_posts_pagination(client, captured_templates, mocker, posts_list):
+    mocker.patch("app.posts_list", return_value=posts_list * 25, autospec=True)
+    mocker.patch.dict("app.app.config", {'POSTS_PER_PAGE': 10})
+    with captured_templates as templates:
+        response = client.get('/posts?page=3')
+        assert response.status_code == 200
+        _, context = templates[0]
+        assert len(context['posts']) == 5
+        assert context['first_index'] == 20
+        assert context['pages'] == 3
+        assert 'href="/posts/20"' in response.text
+
+def test_comment_tree_preserves_nesting():
+    from comment_tree import CommentTree
+    nested = [
+        {'author': 'A', 'text': '1', 'replies': [{'author': 'B', 'text': '1.1'},
+                                                 {'author': 'C', 'text': '1.2'}]},
+        {'author': 'D', 'text': '2', 'replies': []},
+    ]
+    tree = CommentTree.from_nested(nested)
+    assert len(tree) == 4
+    assert tree.thread_count == 2
+    assert [(c.text, c.depth, c.parent) for c in tree.walk()] == [
+        ('1', 0, -1), ('1.1', 1, 0), ('1.2', 1, 0), ('2', 0, -1)]
+    assert CommentTree.from_dict(tree.to_dict()) == tree
+
+def test_comment_tree_thread_pages():
+    from comment_tree import CommentTree
+    nested = [{'author': 'A', 'text': str(i), 'replies': [{'author': 'B', 'text': f'{i}.1'}]}
+              for i in range(5)]
+    tree = CommentTree.from_nested(nested)
+    assert tree.pages(2) == 3
+    assert [c.text for c in tree.thread_page(2, 2)] == ['2', '2.1', '3', '3.1']
+    assert [c.text for c in tree.thread_page(3, 2)] == ['4', '4.1']
+    assert list(tree.thread_page(4, 2)) == []
+
+def test_comment_tree_rejects_forward_parent():
+    from comment_tree import CommentTree
+    with pytest.raises(ValueError):
+        CommentTree(['A', 'B'], ['1', '2'], [1, -1])
+
+def test_post_comments_pagination(client, captured_templates, mocker, posts_list):
+    post = dict(posts_list[0], comments=[{'author': 'A', 'text': f'Комментарий {i}', 'replies': []}
+                                          for i in range(5)])
+    mocker.patch("app.posts_list", return_value=[post], autospec=True)
+    mocker.patch.dict("app.app.config", {'COMMENT_THREADS_PER_PAGE': 2})
+    with captured_templates as templates:
+        response = client.get('/posts/0?comments_page=3')
+        assert response.status_code == 200
+        _, context = templates[0]
+        assert context['comments_total'] == 5
+        assert context['comments_pages'] == 3
+        assert 'Комментарий 4' in response.text
+        assert 'Комментарий 3' not in response.text
+    assert client.get('/posts/0?comments_page=4').status_code == 404
+
+def test_response_cache_hit_skips_rendering(client, captured_templates):
+    from app import response_cache
+    with captured_templates as templates:
+        first = client.get('/about')
+        second = client.get('/about')
+        assert len(templates) == 1
+    assert first.data == second.data
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert response_cache.stats()['hits'] == 1
+    assert client.get('/cache-stats').json['hit_rate'] == 0.5
+
+def test_cache_stats_only_local(client):
+    assert client.get('/cache-stats').status_code == 200
+    response = client.get('/cache-stats', environ_base={'REMOTE_ADDR': '203.0.113.5'})
+    assert response.status_code == 404
+
+def test_response_cache_not_modified(client):
+    etag = client.get('/posts').headers['ETag'].strip('"')
+    response = client.get('/posts', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_response_cache_gzip(client):
+    import gzip
+    plain = client.get('/posts/0')
+    response = client.get('/posts/0', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == plain.data
+
+def test_response_cache_invalidated_on_rebuild(client, mocker, tmp_path):
+    import app as app_module
+    from post_store import write_post_file
+    path = str(tmp_path / 'posts.bin')
+    mocker.patch.dict('app.app.config', {'POSTS_FILE': path})
+    mocker.patch('app.post_store', app_module.post_store)
+    mocker.patch('app.post_store_version', None)
+    before = client.get('/posts/0').data
+    posts = [app_module.generate_post(7, 1, 0)]
+    write_post_file(path, iter(posts), 1)
+    after = client.get('/posts/0')
+    assert after.status_code == 200
+    assert after.data != before
+    assert posts[0]['author'] in after.text
+
+def test_old_post_store_released_after_readers(mocker, monkeypatch, tmp_path):
+    import gc
+    import weakref
+    import app as app_module
+    from post_store import MappedPostStore, write_post_file
+    path = str(tmp_path / 'posts.bin')
+    write_post_file(path, iter([app_module.generate_post(7, 1, 0)]), 1)
+    old_store = MappedPostStore(path)
+    mocker.patch.dict('app.app.config', {'POSTS_FILE': path})
+    # monkeypatch, в отличие от mocker.patch, не держит ссылку на подставленное значение
+    monkeypatch.setattr(app_module, 'post_store', old_store)
+    mocker.patch('app.post_store_version', app_module.file_version(path))
+    write_post_file(path, iter([app_module.generate_post(8, 1, 0)]), 1)
+    app_module.refresh_post_store()
+    assert app_module.post_store is not old_store
+    # Запрос, начавший читать до пересборки, дочитывает старое хранилище
+    assert not old_store.closed
+    assert old_store[0]['author'] == app_module.generate_post(7, 1, 0)['author']
+    released = weakref.ref(old_store)
+    del old_store
+    gc.collect()
+    assert released() is None
+    app_module.post_store.close()
+
+def test_optimize_svg():
+    from images import optimize_svg
+    source = '<svg width="4">\n  <!-- фон -->\n  <rect  x="1"\n   fill="#fff" />\n</svg>\n'
+    assert optimize_svg(source) == '<svg width="4"><rect x="1" fill="#fff"/></svg>'
+
+def test_build_images_manifest_and_srcset(tmp_path):
+    from PIL import Image
+    from images import ResponsiveImages, build_images
+    Image.new('RGB', (800, 400), 'red').save(tmp_path / 'photo.jpg')
+    (tmp_path / 'icon.svg').write_text('<svg>\n  <rect/>\n</svg>', encoding='utf-8')
+    manifest = build_images(str(tmp_path), widths=(320, 1280), echo=lambda message: None)
+    photo = manifest['photo.jpg']
+    assert [f['width'] for f in photo['variants']['jpeg']] == [320, 800]
+    assert 'webp' in photo['variants']
+    with Image.open(tmp_path / photo['variants']['jpeg'][0]['file']) as small:
+        assert small.size == (320, 160)
+    helper = ResponsiveImages(manifest, lambda name: '/img/' + name)
+    html = helper('photo.jpg', sizes='50vw', class_='card-img-top', alt='Фото')
+    assert '<source type="image/webp" srcset="/img/build/photo-320.webp 320w, /img/build/photo-800.webp 800w"' in html
+    assert 'sizes="50vw"' in html
+    assert 'class="card-img-top"' in html
+    assert helper('icon.svg') == '<img src="/img/build/icon.svg">'
+    assert helper('missing.png', alt='x') == '<img src="/img/missing.png" alt="x">'
+
+def test_faker_is_not_loaded_for_about():
+    import subprocess, sys
+    code = ("import sys; from app import app; app.test_client().get('/about'); "
+            "print('faker' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == 'False'
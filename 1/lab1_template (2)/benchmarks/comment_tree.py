@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Сравнение дерева комментариев из вложенных словарей и CommentTree:
+память (tracemalloc) и время рендера шаблона
+
+Запуск из каталога лабораторной:
+    python -m benchmarks.comment_tree --comments 10000 --replies 3
+"""
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from jinja2 import Environment
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from comment_tree import CommentTree
+
+# Разметка комментариев из post.html до перехода на CommentTree
+NESTED_TEMPLATE = '''
+{% for comment in comments %}
+    <div class="media mb-3">
+        <div class="media-body">
+            <h6 class="mt-0 mb-1">{{ comment.author }}</h6>
+            <p class="mb-2">{{ comment.text }}</p>
+            {% if comment.replies %}
+                <div class="ms-4">
+                    {% for reply in comment.replies %}
+                        <div class="media mb-2">
+                            <div class="media-body">
+                                <h6 class="mt-0 mb-1">{{ reply.author }}</h6>
+                                <p class="mb-1">{{ reply.text }}</p>
+                            </div>
+                        </div>
+                    {% endfor %}
+                </div>
+            {% endif %}
+        </div>
+    </div>
+{% endfor %}
+'''
+
+FLAT_TEMPLATE = '''
+{% for comment in comments %}
+    <div class="media {{ 'mb-3' if comment.depth == 0 else 'mb-2' }}" style="margin-left: {{ comment.depth * 1.5 }}rem">
+        <div class="media-body">
+            <h6 class="mt-0 mb-1">{{ comment.author }}</h6>
+            <p class="{{ 'mb-2' if comment.depth == 0 else 'mb-1' }}">{{ comment.text }}</p>
+        </div>
+    </div>
+{% endfor %}
+'''
+
+
+def make_nested(total, max_replies, seed):
+    """Вложенные словари как в generate_comments: ответы только на первом уровне"""
+    rng = random.Random(seed)
+    authors = [f'Автор {i}' for i in range(100)]
+    texts = [f'Текст комментария номер {i}' for i in range(100)]
+    comments = []
+    made = 0
+    while made < total:
+        replies = []
+        for _ in range(min(rng.randint(0, max_replies), total - made - 1)):
+            replies.append({'author': rng.choice(authors), 'text': rng.choice(texts)})
+        comments.append({'author': rng.choice(authors), 'text': rng.choice(texts), 'replies': replies})
+        made += 1 + len(replies)
+    return comments
+
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def measure_render(template, comments, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        template.render(comments=comments)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def run(args):
+    # Строки лежат в пулах и не попадают в замер: сравнивается только сама структура
+    nested_source = make_nested(args.comments, args.replies, args.seed)
+    nested, nested_size = measure_memory(lambda: make_nested(args.comments, args.replies, args.seed))
+    tree, tree_size = measure_memory(lambda: CommentTree.from_nested(nested_source))
+    assert len(tree) == args.comments
+
+    env = Environment(autoescape=True)
+    nested_ms = measure_render(env.from_string(NESTED_TEMPLATE), nested, args.repeat)
+    flat_ms = statistics.median([measure_render(env.from_string(FLAT_TEMPLATE), tree.walk(), 1)
+                                 for _ in range(args.repeat)])
+    page_ms = statistics.median([measure_render(env.from_string(FLAT_TEMPLATE),
+                                                tree.thread_page(1, args.per_page), 1)
+                                 for _ in range(args.repeat)])
+
+    print(f'Комментариев: {len(tree)}, веток верхнего уровня: {tree.thread_count}')
+    print(f'{"структура":<28} {"память, КБ":>12} {"рендер, мс":>12}')
+    print(f'{"вложенные словари":<28} {nested_size / 1024:>12.1f} {nested_ms:>12.2f}')
+    print(f'{"CommentTree":<28} {tree_size / 1024:>12.1f} {flat_ms:>12.2f}')
+    print(f'{"CommentTree, 1 страница":<28} {"":>12} {page_ms:>12.2f}')
+    return {'nested_bytes': nested_size, 'tree_bytes': tree_size,
+            'nested_ms': nested_ms, 'tree_ms': flat_ms, 'page_ms': page_ms}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк дерева комментариев лабораторной работы №1')
+    parser.add_argument('--comments', type=int, default=10000)
+    parser.add_argument('--replies', type=int, default=3, help='максимум ответов на комментарий')
+    parser.add_argument('--per-page', type=int, default=20, help='веток на странице')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    run(parse_args())
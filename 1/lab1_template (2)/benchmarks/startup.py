@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Время холодного старта приложения: импорт модуля и первый запрос в новом процессе
+
+Запуск из каталога лабораторной:
+    python -m benchmarks.startup --paths /about /posts /posts/0 --output startup.json
+    python -m benchmarks.startup --baseline startup.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+METRICS = ('process_ms', 'import_ms', 'first_request_ms')
+
+# Код дочернего процесса: каждый замер начинается с чистого интерпретатора
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {app_dir!r})
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get({path!r})
+response.get_data()
+finished = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'status': response.status_code,
+    'faker_loaded': 'faker' in sys.modules,
+}}))
+'''
+
+
+def measure(path):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD.format(app_dir=APP_DIR, path=path)],
+                            cwd=APP_DIR, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def run(args):
+    results = {}
+    for path in args.paths:
+        samples = [measure(path) for _ in range(args.repeat)]
+        result = {metric: statistics.median(s[metric] for s in samples) for metric in METRICS}
+        result['status'] = samples[-1]['status']
+        result['faker_loaded'] = samples[-1]['faker_loaded']
+        results[path] = result
+        print(f"{path:<16} процесс {result['process_ms']:>8.1f} ms  импорт {result['import_ms']:>8.1f} ms  "
+              f"первый запрос {result['first_request_ms']:>8.1f} ms  "
+              f"Faker {'загружен' if result['faker_loaded'] else 'не загружен'}  [{result['status']}]")
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def compare_reports(baseline, current, threshold):
+    """Регрессии: рост медианы больше порога относительно базового прогона"""
+    regressions = []
+    for path, new in current['results'].items():
+        old = baseline['results'].get(path)
+        if old is None:
+            continue
+        for metric in METRICS:
+            if old[metric] > 0 and new[metric] > old[metric] * (1 + threshold):
+                regressions.append((path, metric, old[metric], new[metric]))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Время холодного старта лабораторной работы №1')
+    parser.add_argument('--paths', nargs='+', default=['/about', '/posts', '/posts/0'])
+    parser.add_argument('--repeat', type=int, default=5, help='количество запусков процесса на адрес')
+    parser.add_argument('--output', help='файл для сохранения результатов в JSON')
+    parser.add_argument('--baseline', help='предыдущий прогон для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимый относительный рост времени (0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'\n✓ Результаты сохранены в {args.output}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_reports(json.load(f), report, args.threshold)
+        if regressions:
+            print(f'\n❌ Найдены регрессии (порог {args.threshold:.0%}):')
+            for path, metric, old, new in regressions:
+                print(f'  {path}: {metric} {old:.1f} → {new:.1f}')
+            return 1
+        print('\n✓ Регрессий не найдено')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
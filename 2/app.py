@@ -1,8 +1,16 @@
-from flask import Flask, render_template, request, redirect, url_for, make_response
+from flask import Flask, render_template, request, redirect, url_for, make_response, jsonify, Response
+import codecs
+import csv
+import io
 import re
+import tempfile
+import time
+import zipfile
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
+app.config['PHONE_BATCH_LIMIT'] = 10000
+app.config['PHONE_CSV_CHUNK_ROWS'] = 10000
 
 @app.route('/')
 def index():
@@ -72,40 +80,214 @@ def phone_validation():
     
     return render_template('phone_validation.html')
 
+PHONE_COUNT_ERROR = 'Недопустимый ввод. Неверное количество цифр.'
+PHONE_CHARS_ERROR = 'Недопустимый ввод. В номере телефона встречаются недопустимые символы.'
+
+# Таблица удаляет разрешенные разделители за один проход str.translate;
+# если после этого остались не только цифры, номер проверяется регулярным выражением
+PHONE_SEPARATORS = str.maketrans('', '', ' \t\n\r\f\v()-+.')
+PHONE_ALLOWED_CHARS = re.compile(r'^[\d\s\(\)\-\+\.]+$')
+PHONE_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(phone):
+    """Возвращает пару (10 цифр номера без кода страны, None) или (None, текст ошибки)"""
+    if not phone:
+        return None, PHONE_COUNT_ERROR
+    digits = phone.translate(PHONE_SEPARATORS)
+    if not digits.isdecimal():
+        # Редкий случай: пробельные символы Unicode или недопустимые символы
+        if not PHONE_ALLOWED_CHARS.match(phone):
+            return None, PHONE_CHARS_ERROR
+        digits = PHONE_NON_DIGITS.sub('', phone)
+
+    if len(digits) == 11 and digits[0] in '78':
+        return digits[1:], None
+    if len(digits) == 10:
+        return digits, None
+    return None, PHONE_COUNT_ERROR
+
+
 def validate_phone(phone):
     """Валидация и форматирование номера телефона"""
-    if not phone:
-        return {'is_valid': False, 'error': 'Недопустимый ввод. Неверное количество цифр.'}
-    
-    # Удаляем все символы кроме цифр и +
-    digits_only = re.sub(r'[^\d+]', '', phone)
-    
-    # Проверяем на недопустимые символы
-    allowed_chars = re.compile(r'^[\d\s\(\)\-\+\.]+$')
-    if not allowed_chars.match(phone):
-        return {'is_valid': False, 'error': 'Недопустимый ввод. В номере телефона встречаются недопустимые символы.'}
-    
-    # Извлекаем только цифры
-    digits = re.sub(r'[^\d]', '', phone)
-    
-    # Проверяем длину
-    if len(digits) == 11:
-        if digits.startswith('7'):
-            # +7 формат
-            formatted = '8-' + digits[1:4] + '-' + digits[4:7] + '-' + digits[7:9] + '-' + digits[9:11]
-            return {'is_valid': True, 'formatted': formatted}
-        elif digits.startswith('8'):
-            # 8 формат
-            formatted = '8-' + digits[1:4] + '-' + digits[4:7] + '-' + digits[7:9] + '-' + digits[9:11]
-            return {'is_valid': True, 'formatted': formatted}
-        else:
-            return {'is_valid': False, 'error': 'Недопустимый ввод. Неверное количество цифр.'}
-    elif len(digits) == 10:
-        # 10 цифр
-        formatted = '8-' + digits[0:3] + '-' + digits[3:6] + '-' + digits[6:8] + '-' + digits[8:10]
-        return {'is_valid': True, 'formatted': formatted}
+    national, error = normalize_phone(phone)
+    if error:
+        return {'is_valid': False, 'error': error}
+    return {
+        'is_valid': True,
+        'formatted': f'8-{national[:3]}-{national[3:6]}-{national[6:8]}-{national[8:]}',
+        'e164': '+7' + national,
+    }
+
+
+@app.route('/api/phone_validation', methods=['POST'])
+def phone_validation_batch():
+    """Пакетная валидация: {"phones": [...]} → результат для каждого номера в том же порядке"""
+    data = request.get_json(silent=True)
+    phones = data.get('phones') if isinstance(data, dict) else None
+    if not isinstance(phones, list):
+        return jsonify({'error': 'Ожидается JSON вида {"phones": [...]}'}), 400
+    limit = app.config['PHONE_BATCH_LIMIT']
+    if len(phones) > limit:
+        return jsonify({'error': f'Слишком много номеров, максимум {limit}'}), 413
+
+    results = []
+    valid = 0
+    for phone in phones:
+        if not isinstance(phone, str):
+            results.append({'input': phone, 'is_valid': False, 'error': 'Номер должен быть строкой'})
+            continue
+        result = validate_phone(phone.strip())
+        result['input'] = phone
+        valid += result['is_valid']
+        results.append(result)
+    return jsonify({'results': results, 'valid': valid, 'invalid': len(results) - valid})
+
+class ZipStream(io.RawIOBase):
+    """Приемник для ZipFile: записанные байты забираются генератором ответа"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def read_chunks(reader, size):
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def is_utf8(stream, chunk_size=1 << 20):
+    """Проверяет кодировку загрузки порциями, не читая файл в память, и возвращает поток в начало"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            decoder.decode(data, final=not data)
+            if not data:
+                return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        stream.seek(0)
+
+
+def clean_phone_rows(reader, header, column, output_format, chunk_size):
+    """Потоково собирает zip-архив: cleaned.csv, errors.csv и summary.csv.
+
+    Входной CSV читается порциями по chunk_size строк, в памяти держится
+    только текущая порция; ошибки копятся во временном файле на диске.
+    """
+    started = time.perf_counter()
+    sink = ZipStream()
+    rows = valid = 0
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as errors_file:
+        errors = csv.writer(errors_file)
+        errors.writerow(['line', 'value', 'error'])
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with io.TextIOWrapper(archive.open('cleaned.csv', 'w', force_zip64=True),
+                                  encoding='utf-8', newline='') as cleaned_file:
+                cleaned = csv.writer(cleaned_file)
+                cleaned.writerow(header)
+                for chunk in read_chunks(reader, chunk_size):
+                    for row in chunk:
+                        rows += 1
+                        value = row[column] if column < len(row) else ''
+                        national, error = normalize_phone(value.strip())
+                        if error:
+                            # Строка 1 — заголовок, поэтому номера строк данных начинаются с 2
+                            errors.writerow([rows + 1, value, error])
+                            continue
+                        valid += 1
+                        row[column] = ('+7' + national if output_format == 'e164' else
+                                       f'8-{national[:3]}-{national[3:6]}-{national[6:8]}-{national[8:]}')
+                        cleaned.writerow(row)
+                    cleaned_file.flush()
+                    yield sink.drain()
+
+            errors_file.seek(0)
+            with archive.open('errors.csv', 'w', force_zip64=True) as errors_entry:
+                while True:
+                    data = errors_file.read(1 << 20)
+                    if not data:
+                        break
+                    errors_entry.write(data.encode('utf-8'))
+                    yield sink.drain()
+
+            seconds = time.perf_counter() - started
+            rows_per_second = rows / seconds if seconds else 0.0
+            app.logger.info('Очистка телефонов: %d строк, %.0f строк/с', rows, rows_per_second)
+            summary = (f'rows,valid,invalid,seconds,rows_per_second\r\n'
+                       f'{rows},{valid},{rows - valid},{seconds:.3f},{rows_per_second:.0f}\r\n')
+            archive.writestr('summary.csv', summary)
+    yield sink.drain()
+
+
+@app.route('/phone_cleaning', methods=['GET', 'POST'])
+def phone_cleaning():
+    """Очистка столбца телефонов в загруженном CSV, результат отдается потоком в zip"""
+    if request.method == 'GET':
+        return render_template('phone_cleaning.html')
+
+    upload = request.files.get('file')
+    column_name = request.form.get('column', 'phone').strip()
+    output_format = request.form.get('format', 'formatted')
+    error_message = None
+    text = None
+    if upload is None or not upload.filename:
+        error_message = 'Выберите CSV-файл.'
     else:
-        return {'is_valid': False, 'error': 'Недопустимый ввод. Неверное количество цифр.'}
+        # Werkzeug сохраняет большие загрузки во временный файл, здесь он читается построчно.
+        # Файлы запроса закрываются при его завершении, а тело ответа читается позже,
+        # поэтому поток забирается у запроса и закрывается генератором
+        stream, upload.stream = upload.stream, io.BytesIO()
+        # Ответ уходит потоком, поэтому кодировка проверяется до первой строки архива:
+        # ошибка декодирования посреди файла оборвала бы уже начатый ответ
+        if not is_utf8(stream):
+            stream.close()
+            error_message = 'Файл должен быть в кодировке UTF-8.'
+        else:
+            text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+            reader = csv.reader(text)
+            header = next(reader, None)
+            if header is None:
+                error_message = 'Файл пуст.'
+            elif column_name in header:
+                column = header.index(column_name)
+            elif column_name.isdigit() and int(column_name) < len(header):
+                column = int(column_name)
+            else:
+                error_message = f'В заголовке CSV нет столбца «{column_name}».'
+    if error_message:
+        if text is not None:
+            text.close()
+        return render_template('phone_cleaning.html', error_message=error_message,
+                               column=column_name), 400
+
+    def body():
+        with text:
+            yield from clean_phone_rows(reader, header, column, output_format,
+                                        app.config['PHONE_CSV_CHUNK_ROWS'])
+
+    response = Response(body(), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=cleaned_phones.zip'
+    return response
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Скорость валидации номеров телефона: прежняя реализация на регулярных выражениях
+против normalize_phone, а также пакетный эндпоинт /api/phone_validation
+
+Запуск из каталога лабораторной:
+    python -m benchmarks.phones --count 100000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, validate_phone
+
+
+def legacy_validate_phone(phone):
+    """Реализация validate_phone до перехода на однопроходную нормализацию"""
+    if not phone:
+        return {'is_valid': False, 'error': 'Недопустимый ввод. Неверное количество цифр.'}
+    digits_only = re.sub(r'[^\d+]', '', phone)
+    allowed_chars = re.compile(r'^[\d\s\(\)\-\+\.]+$')
+    if not allowed_chars.match(phone):
+        return {'is_valid': False, 'error': 'Недопустимый ввод. В номере телефона встречаются недопустимые символы.'}
+    digits = re.sub(r'[^\d]', '', phone)
+    if len(digits) == 11:
+        if digits.startswith('7'):
+            formatted = '8-' + digits[1:4] + '-' + digits[4:7] + '-' + digits[7:9] + '-' + digits[9:11]
+            return {'is_valid': True, 'formatted': formatted}
+        elif digits.startswith('8'):
+            formatted = '8-' + digits[1:4] + '-' + digits[4:7] + '-' + digits[7:9] + '-' + digits[9:11]
+            return {'is_valid': True, 'formatted': formatted}
+        else:
+            return {'is_valid': False, 'error': 'Недопустимый ввод. Неверное количество цифр.'}
+    elif len(digits) == 10:
+        formatted = '8-' + digits[0:3] + '-' + digits[3:6] + '-' + digits[6:8] + '-' + digits[8:10]
+        return {'is_valid': True, 'formatted': formatted}
+    else:
+        return {'is_valid': False, 'error': 'Недопустимый ввод. Неверное количество цифр.'}
+
+
+TEMPLATES = ['+7 ({0}) {1}-{2}-{3}', '8({0}){1}{2}{3}', '{0}.{1}.{2}.{3}', '8 {0} {1} {2} {3}',
+             '+7-{0}-{1}-{2}-{3}', '{0}{1}{2}{3}', '8 ({0}) {1}-{2}-{3}x', '{0}-{1}-{2}']
+
+
+def make_phones(count, seed):
+    """Типичная смесь форматов, включая некорректные номера"""
+    rng = random.Random(seed)
+    phones = []
+    for _ in range(count):
+        parts = (f'{rng.randrange(1000):03}', f'{rng.randrange(1000):03}',
+                 f'{rng.randrange(100):02}', f'{rng.randrange(100):02}')
+        phones.append(rng.choice(TEMPLATES).format(*parts))
+    return phones
+
+
+def numbers_per_second(validate, phones, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for phone in phones:
+            validate(phone)
+        best = min(best, time.perf_counter() - started)
+    return len(phones) / best
+
+
+def run(args):
+    phones = make_phones(args.count, args.seed)
+    mismatches = [p for p in phones[:10000]
+                  if {k: v for k, v in validate_phone(p).items() if k != 'e164'} != legacy_validate_phone(p)]
+    if mismatches:
+        print(f'❌ Результаты расходятся, например: {mismatches[0]!r}')
+        return 1
+
+    before = numbers_per_second(legacy_validate_phone, phones, args.repeat)
+    after = numbers_per_second(validate_phone, phones, args.repeat)
+    print(f'{"до (регулярные выражения)":<32} {before:>12,.0f} номеров/с')
+    print(f'{"после (normalize_phone)":<32} {after:>12,.0f} номеров/с  (x{after / before:.1f})')
+
+    client = app.test_client()
+    batch = phones[:app.config['PHONE_BATCH_LIMIT']]
+    started = time.perf_counter()
+    response = client.post('/api/phone_validation', json={'phones': batch})
+    elapsed = time.perf_counter() - started
+    print(f'{"пакетный эндпоинт":<32} {len(batch) / elapsed:>12,.0f} номеров/с  '
+          f'({len(batch)} номеров за запрос, статус {response.status_code})')
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк валидации номеров телефона')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
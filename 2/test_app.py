@@ -1,4 +1,8 @@
+import csv
+import io
 import unittest
+import zipfile
+from unittest.mock import patch
 from app import app, validate_phone
 
 class FlaskAppTestCase(unittest.TestCase):
@@ -232,5 +236,111 @@ class PhoneValidationTestCase(unittest.TestCase):
         self.assertFalse(result['is_valid'])
         self.assertIn('Неверное количество цифр', result['error'])
 
+    def test_validate_phone_e164(self):
+        """Тест формата E.164 для корректного номера"""
+        self.assertEqual(validate_phone('+7 (123) 456-75-90')['e164'], '+71234567590')
+        self.assertEqual(validate_phone('123.456.75.90')['e164'], '+71234567590')
+
+    def test_validate_phone_unicode_whitespace(self):
+        """Тест номера с неразрывными пробелами"""
+        result = validate_phone('8\u00a0123\u00a0456\u00a075\u00a090')
+        self.assertTrue(result['is_valid'])
+        self.assertEqual(result['formatted'], '8-123-456-75-90')
+
+class PhoneBatchValidationTestCase(unittest.TestCase):
+    """Тесты для пакетной валидации номеров телефона"""
+
+    def setUp(self):
+        """Настройка тестового клиента"""
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_batch_results_in_order(self):
+        """Тест результатов для каждого номера в исходном порядке"""
+        response = self.app.post('/api/phone_validation',
+                                 json={'phones': ['8(123)4567590', '123abc456', ' 123.456.75.90 ', 42]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['valid'], 2)
+        self.assertEqual(data['invalid'], 2)
+        results = data['results']
+        self.assertEqual(results[0]['formatted'], '8-123-456-75-90')
+        self.assertIn('недопустимые символы', results[1]['error'])
+        self.assertEqual(results[2]['input'], ' 123.456.75.90 ')
+        self.assertEqual(results[2]['e164'], '+71234567590')
+        self.assertFalse(results[3]['is_valid'])
+
+    def test_batch_invalid_payload(self):
+        """Тест запроса без списка номеров"""
+        response = self.app.post('/api/phone_validation', json={'phone': '8(123)4567590'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_limit(self):
+        """Тест ограничения размера пакета"""
+        limit = app.config['PHONE_BATCH_LIMIT']
+        response = self.app.post('/api/phone_validation', json={'phones': ['1'] * (limit + 1)})
+        self.assertEqual(response.status_code, 413)
+
+class PhoneCleaningTestCase(unittest.TestCase):
+    """Тесты для очистки телефонов в CSV-файле"""
+
+    def setUp(self):
+        """Настройка тестового клиента"""
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def upload(self, content, **form):
+        data = dict(form, file=(io.BytesIO(content.encode('utf-8')), 'contacts.csv'))
+        return self.app.post('/phone_cleaning', data=data, content_type='multipart/form-data')
+
+    def test_phone_cleaning_get(self):
+        """Тест страницы загрузки CSV"""
+        response = self.app.get('/phone_cleaning')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Очистка списка телефонов', response.data.decode('utf-8'))
+
+    def test_phone_cleaning_archive(self):
+        """Тест очищенного CSV и отчета об ошибках"""
+        content = 'name,phone\nИван,+7 (123) 456-75-90\nПетр,123abc456\n"Анна, мл.",123.456.75.90\n'
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        cleaned = list(csv.reader(io.StringIO(archive.read('cleaned.csv').decode('utf-8'))))
+        self.assertEqual(cleaned, [['name', 'phone'], ['Иван', '8-123-456-75-90'],
+                                   ['Анна, мл.', '8-123-456-75-90']])
+        errors = list(csv.reader(io.StringIO(archive.read('errors.csv').decode('utf-8'))))
+        self.assertEqual(errors[1][:2], ['3', '123abc456'])
+        self.assertIn('недопустимые символы', errors[1][2])
+        summary = list(csv.DictReader(io.StringIO(archive.read('summary.csv').decode('utf-8'))))[0]
+        self.assertEqual((summary['rows'], summary['valid'], summary['invalid']), ('3', '2', '1'))
+
+    def test_phone_cleaning_e164_by_column_index(self):
+        """Тест выбора столбца по номеру и формата E.164"""
+        with patch.dict(app.config, {'PHONE_CSV_CHUNK_ROWS': 1}):
+            response = self.upload('tel\n8(123)4567590\n8 123 456 75 91\n', column='0', format='e164')
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(archive.read('cleaned.csv').decode('utf-8'),
+                         'tel\r\n+71234567590\r\n+71234567591\r\n')
+
+    def test_phone_cleaning_missing_column(self):
+        """Тест файла без столбца телефона"""
+        response = self.upload('name,email\nИван,ivan@example.com\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('нет столбца', response.data.decode('utf-8'))
+
+    def test_phone_cleaning_not_utf8(self):
+        """Тест файла не в UTF-8: ошибка формы вместо оборванного архива"""
+        content = 'name,phone\nИван,+7 (123) 456-75-90\n'.encode('cp1251')
+        data = {'file': (io.BytesIO(content), 'contacts.csv')}
+        response = self.app.post('/phone_cleaning', data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('кодировке UTF-8', response.data.decode('utf-8'))
+
+    def test_phone_cleaning_without_file(self):
+        """Тест отправки формы без файла"""
+        response = self.app.post('/phone_cleaning', data={'column': 'phone'})
+        self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,12 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from werkzeug.security import generate_password_hash
 from datetime import timedelta
 import os
+from user_store import create_user_store, load_users
+from password_hasher import PasswordHasher
+from login_throttle import LoginThrottle
+from session_store import init_session_store
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
@@ -14,21 +18,36 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Для доступа к запрашиваемой странице необходимо пройти процедуру аутентификации.'
 login_manager.login_message_category = 'info'
 
-# Простой класс пользователя
-class User(UserMixin):
-    def __init__(self, id, username, password_hash):
-        self.id = id
-        self.username = username
-        self.password_hash = password_hash
+# Пользователи хранятся в памяти или в SQLite (FLASK_USERS_DATABASE); пустое
+# хранилище при старте заполняется из файла (FLASK_USERS_FILE, CSV или JSON Lines)
+app.config['USERS_DATABASE'] = None
+app.config['USERS_FILE'] = None
+# Параметры хеширования паролей: FLASK_PASSWORD_HASH_METHOD, FLASK_PASSWORD_HASH_WORKERS,
+# FLASK_PASSWORD_HASH_QUEUE, FLASK_PASSWORD_HASH_TIMEOUT; ограничение попыток входа:
+# FLASK_LOGIN_THROTTLE_* (см. README); серверные сессии: FLASK_SESSION_DATABASE,
+# FLASK_SESSION_REDIS_URL, FLASK_SESSION_FLUSH_INTERVAL, FLASK_SESSION_SWEEP_INTERVAL
+app.config.from_prefixed_env()
+init_session_store(app)
+
+password_hasher = PasswordHasher()
+password_hasher.init_app(app)
+login_throttle = LoginThrottle()
+login_throttle.init_app(app)
+
+users = create_user_store(app.config['USERS_DATABASE'])
+if app.config['USERS_FILE'] and not len(users):
+    load_users(users, app.config['USERS_FILE'])
 
 # Создаем тестового пользователя
-users = {
-    1: User(1, 'user', generate_password_hash('qwerty'))
-}
+if users.get_by_username('user') is None:
+    users.add('user', generate_password_hash('qwerty'))
 
 @login_manager.user_loader
 def load_user(user_id):
-    return users.get(int(user_id))
+    try:
+        return users.get_by_id(int(user_id))
+    except ValueError:
+        return None
 
 @app.route('/')
 def index():
@@ -36,12 +55,10 @@ def index():
 
 @app.route('/counter')
 def counter():
-    # Увеличиваем счетчик посещений в сессии
-    if 'visit_count' not in session:
-        session['visit_count'] = 0
-    session['visit_count'] += 1
+    # Счетчик посещений увеличивается атомарно в хранилище сессий
+    count = session.increment('visit_count')
     
-    return render_template('counter.html', count=session['visit_count'])
+    return render_template('counter.html', count=count)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -49,15 +66,17 @@ def login():
         username = request.form['username']
         password = request.form['password']
         remember = request.form.get('remember') == 'on'
+        # Лишние попытки отклоняются с 429 еще до поиска пользователя и хеширования
+        login_throttle.check(username, request.remote_addr)
         
-        # Ищем пользователя
-        user = None
-        for u in users.values():
-            if u.username == username:
-                user = u
-                break
+        user = users.get_by_username(username)
+        valid, new_hash = password_hasher.verify(user.password_hash, password) if user else (False, None)
         
-        if user and check_password_hash(user.password_hash, password):
+        if valid:
+            # Хеш со старыми параметрами пересчитывается при успешном входе
+            if new_hash:
+                users.update_password_hash(user.id, new_hash)
+            session.regenerate()
             login_user(user, remember=remember)
             flash('Вы успешно вошли в систему!', 'success')
             
@@ -76,6 +95,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    session.regenerate()
     flash('Вы вышли из системы!', 'info')
     return redirect(url_for('index'))
 
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Задержка обычных страниц во время шквала входов: хеширование в потоке запроса,
+ограниченный пул процессов и пул вместе с ограничением попыток входа
+
+Запуск из каталога лабораторной (нужен waitress из loadtest/requirements.txt):
+    python -m benchmarks.login_storm --threads 4 --storm 16 --duration 5
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from waitress.server import create_server
+
+from app import app, password_hasher, login_throttle
+
+
+def request(url, data=None):
+    body = urllib.parse.urlencode(data).encode() if data else None
+    try:
+        with urllib.request.urlopen(url, data=body, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as err:
+        return err.code
+
+
+def run_mode(args, workers, throttle):
+    password_hasher.configure(app.config['PASSWORD_HASH_METHOD'], workers, args.queue)
+    login_throttle.reset()
+    login_throttle.enabled = throttle
+    if workers:
+        password_hasher.check('', '')  # прогрев: запуск процессов пула не входит в замер
+    server = create_server(app, host='127.0.0.1', port=0, threads=args.threads)
+    base_url = f'http://127.0.0.1:{server.effective_port}'
+    loop = threading.Thread(target=server.run, daemon=True)
+    loop.start()
+
+    deadline = time.monotonic() + args.duration
+    statuses = {}
+    latencies = []
+
+    def storm():
+        while time.monotonic() < deadline:
+            status = request(base_url + '/login', {'username': 'user', 'password': 'qwerty'})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def probe():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            request(base_url + '/')
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=storm) for _ in range(args.storm)]
+    threads.append(threading.Thread(target=probe))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Необработанные входы из очереди сервера не должны занимать процессор в следующем режиме
+    server.task_dispatcher.shutdown(cancel_pending=True)
+    # Сокеты закрываются в потоке цикла сервера, иначе select может получить закрытый дескриптор
+    server.trigger.pull_trigger(server.close)
+    loop.join(timeout=5)
+    password_hasher.shutdown()
+
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'p50_ms': cuts[49], 'p95_ms': cuts[94], 'p99_ms': cuts[98],
+            'probes': len(latencies), 'logins': statuses}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Задержка страниц во время шквала входов')
+    parser.add_argument('--threads', type=int, default=4, help='потоков сервера')
+    parser.add_argument('--storm', type=int, default=16, help='одновременных входов')
+    parser.add_argument('--workers', type=int, default=2, help='процессов пула хеширования')
+    parser.add_argument('--queue', type=int, default=2, help='ожидающих задач хеширования')
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args(argv)
+    logging.getLogger('waitress').setLevel(logging.ERROR)
+
+    modes = (
+        ('в потоке запроса', 0, False),
+        (f'пул из {args.workers} процессов', args.workers, False),
+        ('пул и ограничение входов', args.workers, True),
+    )
+    for name, workers, throttle in modes:
+        result = run_mode(args, workers, throttle)
+        print(f"{name:<26} GET /: p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+              f"p99 {result['p99_ms']:>8.1f} ms  входы {result['logins']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Подписанная cookie-сессия против серверной: размер cookie, задержка /counter
+и потерянные посещения при параллельных запросах одной сессии
+
+Запуск из каталога лабораторной:
+    python -m benchmarks.sessions --requests 2000 --parallel 8
+"""
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
+
+from app import app
+from session_store import ServerSessionInterface, SQLiteSessionStore
+
+
+COUNT = re.compile(r'<strong>(\d+)</strong>')
+
+
+class LegacyCookieSession(SecureCookieSession):
+    """Прежний счетчик: прочитать значение из cookie, увеличить и подписать cookie заново"""
+
+    def increment(self, key, amount=1):
+        self[key] = self.get(key, 0) + amount
+        return self[key]
+
+
+class LegacyCookieSessionInterface(SecureCookieSessionInterface):
+    session_class = LegacyCookieSession
+
+
+def visit_counter(client):
+    return int(COUNT.search(client.get('/counter').get_data(as_text=True)).group(1))
+
+
+def counter_cookie(client):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return cookie.value if cookie else ''
+
+
+def run_mode(interface, args):
+    app.session_interface = interface
+    client = app.test_client()
+    # Сессия вошедшего пользователя: в cookie-сессии все эти ключи едут в каждом запросе
+    client.post('/login', data={'username': 'user', 'password': 'qwerty'})
+    latencies = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        client.get('/counter')
+        latencies.append((time.perf_counter() - started) * 1000)
+    cookie = counter_cookie(client)
+
+    def visit(_):
+        other = app.test_client()
+        other.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+        other.get('/counter')
+
+    with ThreadPoolExecutor(args.parallel) as pool:
+        list(pool.map(visit, range(args.parallel * 10)))
+    client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+    final = visit_counter(client)
+    return {
+        'cookie_bytes': len(cookie),
+        'p50_ms': statistics.median(latencies),
+        'expected': args.requests + args.parallel * 10 + 1,
+        'final': final,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cookie-сессии против серверных')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--parallel', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = (
+            ('cookie-сессия', LegacyCookieSessionInterface()),
+            ('SQLite, запись сразу', ServerSessionInterface(
+                SQLiteSessionStore(os.path.join(tmp, 'write_through.db')))),
+            ('SQLite, отложенная запись', ServerSessionInterface(
+                SQLiteSessionStore(os.path.join(tmp, 'write_back.db'), flush_interval=5))),
+        )
+        for name, interface in modes:
+            result = run_mode(interface, args)
+            print(f"{name:<26} cookie {result['cookie_bytes']:>4} байт  /counter p50 {result['p50_ms']:>6.2f} ms  "
+                  f"посещений {result['final']} из {result['expected']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Поиск пользователя при входе: перебор словаря users против индексированных хранилищ
+
+Запуск из каталога лабораторной:
+    python -m benchmarks.user_store --users 100000
+"""
+
+import argparse
+import csv
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_store import MemoryUserStore, SQLiteUserStore, User, load_users
+
+# Хеш не вычисляется: измеряется только поиск пользователя
+PASSWORD_HASH = 'scrypt:32768:8:1$bench$0'
+
+
+def write_users_file(path, count):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'username', 'password_hash'])
+        for user_id in range(1, count + 1):
+            writer.writerow([user_id, f'user{user_id}', PASSWORD_HASH])
+
+
+def scan_lookup(users):
+    """Поиск как в прежнем представлении login"""
+    def lookup(username):
+        for u in users.values():
+            if u.username == username:
+                return u
+        return None
+    return lookup
+
+
+def measure(lookup, usernames):
+    latencies = []
+    for username in usernames:
+        started = time.perf_counter()
+        lookup(username)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return len(usernames) / (sum(latencies) / 1e6), statistics.median(latencies)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    # Каждый десятый вход — с несуществующим именем, это худший случай для перебора
+    usernames = [f'user{rng.randint(1, args.users * 11 // 10)}' for _ in range(args.lookups)]
+    work_dir = tempfile.mkdtemp()
+    users_file = os.path.join(work_dir, 'users.csv')
+    write_users_file(users_file, args.users)
+
+    try:
+        report(args, usernames, work_dir, users_file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def report(args, usernames, work_dir, users_file):
+    results = []
+    legacy = {i: User(i, f'user{i}', PASSWORD_HASH) for i in range(1, args.users + 1)}
+    results.append(('перебор словаря', 0.0, scan_lookup(legacy), usernames[:args.scan_lookups]))
+
+    for name, store in (('MemoryUserStore', MemoryUserStore()),
+                        ('SQLiteUserStore', SQLiteUserStore(os.path.join(work_dir, 'users.db')))):
+        started = time.perf_counter()
+        load_users(store, users_file)
+        results.append((name, time.perf_counter() - started, store.get_by_username, usernames))
+
+    print(f'Пользователей: {args.users}')
+    for name, load_seconds, lookup, sample in results:
+        per_second, p50 = measure(lookup, sample)
+        load = f'загрузка {load_seconds:6.2f} с' if load_seconds else ' ' * 15
+        print(f'{name:<18} {load}  {per_second:>12,.0f} поисков/с  p50 {p50:>9.1f} мкс')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска пользователя при входе')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--scan-lookups', type=int, default=200,
+                        help='поисков для перебора словаря (он в тысячи раз медленнее)')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    run(parse_args())
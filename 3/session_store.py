@@ -0,0 +1,415 @@
+import atexit
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask.sessions import SessionInterface, SessionMixin
+
+try:
+    import redis
+except ImportError:  # Redis необязателен, по умолчанию сессии хранятся в SQLite
+    redis = None
+
+# Идентификатор сессии из cookie: secrets.token_urlsafe(32)
+SID_PATTERN = re.compile(r'[A-Za-z0-9_-]{43}')
+
+
+def encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class SessionStore(ABC):
+    """Хранилище данных сессий по идентификатору; ttl — время жизни записи в секундах"""
+
+    @abstractmethod
+    def load(self, sid):
+        """Данные сессии или None, если сессии нет или она истекла"""
+
+    @abstractmethod
+    def update(self, sid, changes, removed, ttl, replace=False):
+        """Записывает измененные ключи и удаляет removed; replace=True заменяет данные целиком"""
+
+    @abstractmethod
+    def increment(self, sid, key, amount, ttl):
+        """Атомарно увеличивает числовое значение ключа и возвращает новое значение"""
+
+    @abstractmethod
+    def delete(self, sid):
+        pass
+
+    @abstractmethod
+    def sweep(self):
+        """Удаляет истекшие сессии и возвращает их количество"""
+
+    def flush(self):
+        """Записывает отложенные изменения; у хранилищ без буфера ничего не делает"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Сессии в SQLite.
+
+    При flush_interval=0 каждое изменение сразу пишется в базу в транзакции
+    BEGIN IMMEDIATE, поэтому базу могут делить несколько процессов сервера.
+    При flush_interval > 0 сессии держатся в памяти (не больше max_cached),
+    а измененные записываются в базу одной транзакцией раз в flush_interval
+    секунд: так быстрее, но только для сервера из одного процесса.
+    """
+
+    def __init__(self, path, flush_interval=0, max_cached=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires);
+        ''')
+        self._lock = threading.RLock()
+        # sid -> [данные, срок истечения]; None — сессия удалена, но удаление еще не записано
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._flushed_at = time.monotonic()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            if self.flush_interval:
+                yield
+                self._maybe_flush()
+                return
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _fetch(self, sid, now):
+        if self.flush_interval and sid in self._cache:
+            self._cache.move_to_end(sid)
+            entry = self._cache[sid]
+            return entry if entry is not None and entry[1] > now else None
+        row = self._conn.execute('SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?',
+                                 (sid, now)).fetchone()
+        entry = [json.loads(row[0]), row[1]] if row else None
+        if entry is not None and self.flush_interval:
+            self._remember(sid, entry)
+        return entry
+
+    def _store(self, sid, entry):
+        if not self.flush_interval:
+            if entry is None:
+                self._conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            else:
+                self._conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                                   (sid, encode(entry[0]), entry[1]))
+            return
+        self._remember(sid, entry)
+        self._dirty.add(sid)
+
+    def _remember(self, sid, entry):
+        self._cache[sid] = entry
+        self._cache.move_to_end(sid)
+        if len(self._cache) > self.max_cached:
+            # Вытеснять можно только записанные в базу сессии
+            if len(self._dirty) >= self.max_cached:
+                self._flush()
+            for old in list(self._cache):
+                if len(self._cache) <= self.max_cached:
+                    break
+                if old not in self._dirty:
+                    del self._cache[old]
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        upserts, deletes = [], []
+        for sid in self._dirty:
+            entry = self._cache.get(sid)
+            if entry is None:
+                deletes.append((sid,))
+                self._cache.pop(sid, None)
+            else:
+                upserts.append((sid, encode(entry[0]), entry[1]))
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.executemany('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                                   upserts)
+            self._conn.executemany('DELETE FROM sessions WHERE sid = ?', deletes)
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+        self._dirty.clear()
+        self._flushed_at = time.monotonic()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._fetch(sid, time.time())
+            return dict(entry[0]) if entry is not None else None
+
+    def update(self, sid, changes, removed, ttl, replace=False):
+        now = time.time()
+        with self._transaction():
+            entry = None if replace else self._fetch(sid, now)
+            data = dict(entry[0]) if entry is not None else {}
+            data.update(changes)
+            for key in removed:
+                data.pop(key, None)
+            self._store(sid, [data, now + ttl] if data else None)
+
+    def increment(self, sid, key, amount, ttl):
+        now = time.time()
+        with self._transaction():
+            entry = self._fetch(sid, now)
+            data = dict(entry[0]) if entry is not None else {}
+            data[key] = data.get(key, 0) + amount
+            self._store(sid, [data, now + ttl])
+            return data[key]
+
+    def delete(self, sid):
+        with self._transaction():
+            self._store(sid, None)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, entry in self._cache.items()
+                       if entry is not None and entry[1] <= now and sid not in self._dirty]
+            for sid in expired:
+                del self._cache[sid]
+            cursor = self._conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+            return cursor.rowcount
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._flush()
+
+
+class RedisSessionStore(SessionStore):
+    """Сессии в Redis (или совместимом сервере): хеш на сессию, срок жизни задается EXPIRE.
+
+    Значения хранятся в JSON, поэтому целые числа совместимы с HINCRBY.
+    """
+
+    def __init__(self, url, prefix='session:'):
+        if redis is None:
+            raise RuntimeError('Для SESSION_REDIS_URL нужен пакет redis')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def load(self, sid):
+        raw = self._client.hgetall(self.prefix + sid)
+        if not raw:
+            return None
+        return {key.decode(): json.loads(value) for key, value in raw.items()}
+
+    def update(self, sid, changes, removed, ttl, replace=False):
+        key = self.prefix + sid
+        pipe = self._client.pipeline(transaction=True)
+        if replace:
+            pipe.delete(key)
+        elif removed:
+            pipe.hdel(key, *removed)
+        if changes:
+            pipe.hset(key, mapping={name: encode(value) for name, value in changes.items()})
+            pipe.expire(key, int(ttl))
+        pipe.execute()
+
+    def increment(self, sid, key, amount, ttl):
+        pipe = self._client.pipeline(transaction=True)
+        pipe.hincrby(self.prefix + sid, key, amount)
+        pipe.expire(self.prefix + sid, int(ttl))
+        return pipe.execute()[0]
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+    def sweep(self):
+        # Истекшие ключи Redis удаляет сам
+        return 0
+
+
+class ServerSession(SessionMixin):
+    """Сессия, данные которой загружаются из хранилища при первом обращении.
+
+    Запоминаются только измененные и удаленные ключи, поэтому параллельные
+    запросы одной сессии не затирают чужие изменения, а счетчики меняются
+    атомарно через increment().
+    """
+
+    def __init__(self, store, sid, ttl):
+        self.store = store
+        self.sid = sid
+        self.ttl = ttl
+        self.new = sid is None
+        self.had_cookie = sid is not None
+        self.modified = False
+        self.accessed = False
+        self.cleared = False
+        self.changed = set()
+        self.removed = set()
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.accessed = True
+            data = self.store.load(self.sid) if self.sid else None
+            if data is None and self.sid:
+                # Неизвестный или истекший идентификатор не принимается, чтобы его нельзя было навязать
+                self.sid = None
+                self.new = True
+            self._data = data or {}
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.changed.add(key)
+        self.removed.discard(key)
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.removed.add(key)
+        self.changed.discard(key)
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self._data = {}
+        self.regenerate()
+
+    def regenerate(self):
+        """Переносит данные под новый идентификатор, а старую запись удаляет.
+
+        Вызывается при входе и выходе: идентификатор, известный до входа
+        (например, навязанный через cookie), не дает доступа к сессии после него.
+        """
+        data = self.data
+        if self.sid:
+            self.store.delete(self.sid)
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.cleared = True
+        self.changed = set(data)
+        self.removed.clear()
+        self.modified = True
+
+    def increment(self, key, amount=1):
+        """Атомарно увеличивает счетчик в хранилище и возвращает новое значение"""
+        self.data  # загрузка отбрасывает неизвестный идентификатор из cookie
+        if self.sid is None:
+            self.sid = secrets.token_urlsafe(32)
+        value = self.store.increment(self.sid, key, amount, self.ttl)
+        self._data[key] = value
+        self.changed.discard(key)
+        return value
+
+
+class ServerSessionInterface(SessionInterface):
+    """Сессии на сервере: в cookie лежит только случайный идентификатор.
+
+    Запросы, которые не обращаются к session, не читают хранилище и не
+    меняют cookie. Истекшие сессии удаляются не чаще раза в sweep_interval
+    секунд во время сохранения сессии.
+    """
+
+    def __init__(self, store, sweep_interval=600):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._swept_at = time.monotonic()
+        self._sweep_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid is not None and not SID_PATTERN.fullmatch(sid):
+            sid = None
+        return ServerSession(self.store, sid, app.permanent_session_lifetime.total_seconds())
+
+    def save_session(self, app, session, response):
+        self._maybe_sweep()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.modified and not session:
+            # Пустая сессия не хранится, а cookie удаляется
+            if session.sid:
+                self.store.delete(session.sid)
+            if session.had_cookie:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+        if session.modified:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            if not session.changed and not session.removed and not session.cleared:
+                # modified выставлен вручную после изменения вложенного значения
+                session.changed.update(session.data)
+            self.store.update(session.sid, {key: session[key] for key in session.changed},
+                              session.removed, session.ttl, replace=session.cleared)
+        if session.sid is None:
+            return
+        if session.new or session.modified:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+            response.vary.add('Cookie')
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._swept_at < self.sweep_interval:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._swept_at = time.monotonic()
+            self.store.sweep()
+        finally:
+            self._sweep_lock.release()
+
+
+def init_session_store(app):
+    """Подключает серверные сессии по настройкам SESSION_* приложения"""
+    app.config.setdefault('SESSION_DATABASE', os.path.join(app.instance_path, 'sessions.db'))
+    app.config.setdefault('SESSION_REDIS_URL', None)
+    app.config.setdefault('SESSION_FLUSH_INTERVAL', 0)
+    app.config.setdefault('SESSION_SWEEP_INTERVAL', 600)
+    if app.config['SESSION_REDIS_URL']:
+        store = RedisSessionStore(app.config['SESSION_REDIS_URL'])
+    else:
+        if app.config['SESSION_DATABASE'] != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(app.config['SESSION_DATABASE'])), exist_ok=True)
+        store = SQLiteSessionStore(app.config['SESSION_DATABASE'], app.config['SESSION_FLUSH_INTERVAL'])
+        # Отложенные изменения не должны теряться при остановке сервера
+        atexit.register(store.flush)
+    app.session_interface = ServerSessionInterface(store, app.config['SESSION_SWEEP_INTERVAL'])
+    return store
@@ -1,7 +1,15 @@
 import unittest
+import unittest.mock
 import os
 import sys
-from app import app, users, User
+import tempfile
+from app import app, users, password_hasher, login_throttle
+from login_throttle import LoginThrottle, MemoryBucketStore, TooManyAttempts
+from session_store import ServerSessionInterface, SQLiteSessionStore
+from concurrent.futures import Future, ThreadPoolExecutor
+from password_hasher import HasherBusy, PasswordHasher
+from werkzeug.security import generate_password_hash
+from user_store import MemoryUserStore, SQLiteUserStore, load_users
 from werkzeug.security import check_password_hash
 
 class FlaskAppTestCase(unittest.TestCase):
@@ -14,6 +22,7 @@ class FlaskAppTestCase(unittest.TestCase):
         self.client = self.app.test_client()
         self.app_context = self.app.app_context()
         self.app_context.push()
+        login_throttle.reset()
     
     def tearDown(self):
         """Очистка после тестов"""
@@ -187,5 +196,239 @@ class FlaskAppTestCase(unittest.TestCase):
         self.assertIn('user', response.get_data(as_text=True))  # Имя пользователя
         self.assertIn('1', response.get_data(as_text=True))     # ID пользователя
 
+class UserStoreTestCase(unittest.TestCase):
+    """Тесты хранилищ пользователей"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stores = [MemoryUserStore(), SQLiteUserStore(os.path.join(self.tmp.name, 'users.db'))]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_13_lookup_by_username_and_id(self):
+        """Тест 13: Пользователь находится по имени и по id"""
+        for store in self.stores:
+            user = store.add('alice', 'hash')
+            self.assertEqual(store.get_by_username('alice').id, user.id)
+            self.assertEqual(store.get_by_id(user.id).username, 'alice')
+            self.assertIsNone(store.get_by_username('bob'))
+            self.assertIsNone(store.get_by_id(user.id + 1))
+
+    def test_14_duplicate_username_rejected(self):
+        """Тест 14: Повторное имя пользователя не добавляется"""
+        for store in self.stores:
+            store.add('alice', 'hash')
+            with self.assertRaises(ValueError):
+                store.add('alice', 'other')
+            self.assertEqual(len(store), 1)
+
+    def test_14a_failed_batch_leaves_store_unchanged(self):
+        """Тест 14a: Пачка с повтором в середине не добавляет ни одной строки"""
+        for store in self.stores:
+            store.add('alice', 'hash')
+            rows = [{'username': 'bob', 'password_hash': 'hash'},
+                    {'username': 'alice', 'password_hash': 'other'},
+                    {'username': 'carol', 'password_hash': 'hash'}]
+            with self.assertRaises(ValueError):
+                store.add_many(rows)
+            self.assertEqual(len(store), 1)
+            self.assertIsNone(store.get_by_username('bob'))
+            self.assertEqual(store.add('bob', 'hash').id, 2)
+
+    def test_15_load_users_from_file(self):
+        """Тест 15: Пользователи загружаются из CSV-файла"""
+        path = os.path.join(self.tmp.name, 'users.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('id,username,password_hash\n')
+            for i in range(1, 2501):
+                f.write(f'{i},user{i},hash{i}\n')
+        for store in self.stores:
+            self.assertEqual(load_users(store, path, batch_size=1000), 2500)
+            self.assertEqual(len(store), 2500)
+            self.assertEqual(store.get_by_username('user1234').password_hash, 'hash1234')
+            self.assertEqual(store.add('new', 'hash').id, 2501)
+
+class PasswordHasherTestCase(unittest.TestCase):
+    """Тесты хеширования паролей"""
+
+    def setUp(self):
+        login_throttle.reset()
+
+    def test_16_busy_hasher_rejects_without_hashing(self):
+        """Тест 16: При заполненной очереди хеширования вход сразу получает 503"""
+        hasher = PasswordHasher(workers=1, max_pending=1)
+        hasher._slots.acquire()
+        with self.assertRaises(HasherBusy):
+            hasher.check('hash', 'password')
+        hasher._slots.release()
+
+        client = app.test_client()
+        with unittest.mock.patch.object(password_hasher, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = client.post('/login', data={'username': 'user', 'password': 'qwerty'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_16a_timed_out_hash_keeps_slot(self):
+        """Тест 16a: После таймаута слот занят, пока пул не досчитает хеш"""
+        hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.01)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with unittest.mock.patch.object(hasher, '_executor') as executor:
+            executor.return_value.submit.return_value = future
+            with self.assertRaises(HasherBusy):
+                hasher.check('hash', 'password')
+            with self.assertRaises(HasherBusy):
+                hasher.check('hash', 'password')
+            self.assertEqual(executor.return_value.submit.call_count, 1)
+            future.set_result(True)
+            self.assertTrue(hasher.check('hash', 'password'))
+
+    def test_17_outdated_hash_upgraded_on_login(self):
+        """Тест 17: Хеш со старыми параметрами пересчитывается при успешном входе"""
+        user = users.get_by_username('user')
+        original = user.password_hash
+        try:
+            users.update_password_hash(user.id, generate_password_hash('qwerty', 'pbkdf2:sha256:1000'))
+            response = app.test_client().post('/login', data={'username': 'user', 'password': 'qwerty'})
+            self.assertEqual(response.status_code, 302)
+            upgraded = users.get_by_id(user.id).password_hash
+            self.assertFalse(password_hasher.needs_rehash(upgraded))
+            self.assertTrue(password_hasher.check(upgraded, 'qwerty'))
+        finally:
+            users.update_password_hash(user.id, original)
+
+class LoginThrottleTestCase(unittest.TestCase):
+    """Тесты ограничения попыток входа"""
+
+    def setUp(self):
+        login_throttle.reset()
+
+    def tearDown(self):
+        login_throttle.reset()
+
+    def test_18_login_throttled_before_hashing(self):
+        """Тест 18: Лишние попытки входа получают 429 без проверки пароля"""
+        client = app.test_client()
+        burst = app.config['LOGIN_THROTTLE_LOGIN_BURST']
+        for _ in range(burst):
+            response = client.post('/login', data={'username': 'user', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+
+        with unittest.mock.patch.object(password_hasher, 'verify') as verify:
+            response = client.post('/login', data={'username': 'user', 'password': 'qwerty'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        verify.assert_not_called()
+
+        # Чужой логин с того же адреса еще не ограничен
+        response = client.post('/login', data={'username': 'other', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+
+        stats = client.get('/login-throttle-stats').get_json()
+        self.assertEqual(stats['allowed'], burst + 1)
+        self.assertEqual(stats['throttled_login'], 1)
+        self.assertEqual(stats['throttled_ip'], 0)
+        response = client.get('/login-throttle-stats', environ_base={'REMOTE_ADDR': '203.0.113.5'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_19_buckets_refill_and_evict(self):
+        """Тест 19: Корзина пополняется со временем, а число ключей ограничено"""
+        throttle = LoginThrottle(login_burst=2, login_per_minute=60, ip_burst=100, ip_per_minute=100,
+                                 max_keys=3)
+        with unittest.mock.patch('login_throttle.time.time', return_value=1000.0):
+            throttle.check('alice', '10.0.0.1')
+            throttle.check('alice', '10.0.0.1')
+            with self.assertRaises(TooManyAttempts) as ctx:
+                throttle.check('alice', '10.0.0.1')
+            self.assertAlmostEqual(ctx.exception.retry_after, 1.0)
+        with unittest.mock.patch('login_throttle.time.time', return_value=1001.0):
+            throttle.check('alice', '10.0.0.1')
+
+        store = MemoryBucketStore(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            store.take(key, 1, 1, 0)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.take('a', 1, 1, 0), (True, 0))
+
+class SessionStoreTestCase(unittest.TestCase):
+    """Тесты серверных сессий"""
+
+    def test_20_counter_increments_are_not_lost(self):
+        """Тест 20: Параллельные запросы одной сессии не теряют посещения, а в cookie лежит только id"""
+        client = app.test_client()
+        client.get('/counter')
+        sid = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.assertEqual(len(sid), 43)
+
+        def visit(_):
+            other = app.test_client()
+            other.set_cookie(app.config['SESSION_COOKIE_NAME'], sid)
+            return other.get('/counter').status_code
+
+        with ThreadPoolExecutor(8) as pool:
+            self.assertEqual(set(pool.map(visit, range(40))), {200})
+        response = client.get('/counter')
+        self.assertIn('42', response.get_data(as_text=True))
+        self.assertEqual(client.get_cookie(app.config['SESSION_COOKIE_NAME']).value, sid)
+
+    def test_21_session_loaded_lazily(self):
+        """Тест 21: Запрос, не обращающийся к сессии, не читает хранилище и не меняет cookie"""
+        store = unittest.mock.Mock()
+        interface = ServerSessionInterface(store)
+        cookie_name = app.config['SESSION_COOKIE_NAME']
+        with app.test_request_context('/', headers={'Cookie': f'{cookie_name}={"a" * 43}'}) as ctx:
+            session = interface.open_session(app, ctx.request)
+            response = app.response_class()
+            interface.save_session(app, session, response)
+        store.load.assert_not_called()
+        store.update.assert_not_called()
+        self.assertNotIn('Set-Cookie', response.headers)
+
+        # Чужой идентификатор, которого нет в хранилище, заменяется новым
+        store.load.return_value = None
+        with app.test_request_context('/', headers={'Cookie': f'{cookie_name}={"a" * 43}'}) as ctx:
+            session = interface.open_session(app, ctx.request)
+            session['key'] = 'value'
+            response = app.response_class()
+            interface.save_session(app, session, response)
+        self.assertNotEqual(session.sid, 'a' * 43)
+        store.update.assert_called_once()
+
+    def test_22_write_back_flush_and_expiry_sweep(self):
+        """Тест 22: Отложенные изменения записываются при flush, истекшие сессии удаляются"""
+        store = SQLiteSessionStore(':memory:', flush_interval=3600)
+        store.update('a' * 43, {'user': 1}, set(), ttl=60)
+        self.assertEqual(store.increment('a' * 43, 'visit_count', 1, ttl=60), 1)
+        count = 'SELECT COUNT(*) FROM sessions'
+        self.assertEqual(store._conn.execute(count).fetchone()[0], 0)
+        store.flush()
+        self.assertEqual(store._conn.execute(count).fetchone()[0], 1)
+        self.assertEqual(store.load('a' * 43), {'user': 1, 'visit_count': 1})
+
+        store.update('b' * 43, {'user': 2}, set(), ttl=-1)
+        store.flush()
+        self.assertIsNone(store.load('b' * 43))
+        self.assertEqual(store.sweep(), 1)
+        self.assertEqual(store._conn.execute(count).fetchone()[0], 1)
+
+    def test_23_session_id_regenerated_on_login_and_logout(self):
+        """Тест 23: Вход и выход выдают новый идентификатор сессии, данные переносятся"""
+        client = app.test_client()
+        client.get('/counter')
+        before = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        client.post('/login', data={'username': 'user', 'password': 'qwerty'})
+        after_login = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.assertNotEqual(before, after_login)
+        store = app.session_interface.store
+        self.assertIsNone(store.load(before))
+        self.assertEqual(store.load(after_login)['visit_count'], 1)
+
+        client.get('/logout')
+        after_logout = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.assertNotEqual(after_login, after_logout)
+        self.assertIsNone(store.load(after_login))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from flask_login import UserMixin
+
+
+class User(UserMixin):
+    def __init__(self, id, username, password_hash):
+        self.id = id
+        self.username = username
+        self.password_hash = password_hash
+
+
+class UserStore(ABC):
+    """Хранилище пользователей с поиском по id и по имени пользователя"""
+
+    @abstractmethod
+    def get_by_id(self, user_id):
+        """Пользователь с данным id или None"""
+
+    @abstractmethod
+    def get_by_username(self, username):
+        """Пользователь с данным именем или None"""
+
+    @abstractmethod
+    def add_many(self, rows):
+        """Добавляет пользователей из словарей {'id'?, 'username', 'password_hash'}"""
+
+    @abstractmethod
+    def update_password_hash(self, user_id, password_hash):
+        """Заменяет хеш пароля пользователя"""
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    def add(self, username, password_hash, id=None):
+        self.add_many([{'id': id, 'username': username, 'password_hash': password_hash}])
+        return self.get_by_username(username)
+
+
+class MemoryUserStore(UserStore):
+    """Пользователи в словарях: индекс по id и индекс по имени"""
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_username = {}
+        self._max_id = 0
+        self._lock = threading.Lock()
+
+    def get_by_id(self, user_id):
+        return self._by_id.get(user_id)
+
+    def get_by_username(self, username):
+        return self._by_username.get(username)
+
+    def add_many(self, rows):
+        # Пачка собирается отдельно и добавляется целиком, как транзакция в SQLiteUserStore:
+        # ошибка в середине не оставляет в хранилище часть строк
+        with self._lock:
+            by_id, by_username, max_id = {}, {}, self._max_id
+            for row in rows:
+                if row['username'] in self._by_username or row['username'] in by_username:
+                    raise ValueError(f'пользователь {row["username"]} уже существует')
+                user_id = row.get('id') or max_id + 1
+                if user_id in self._by_id or user_id in by_id:
+                    raise ValueError(f'пользователь с id {user_id} уже существует')
+                user = User(user_id, row['username'], row['password_hash'])
+                by_id[user_id] = user
+                by_username[user.username] = user
+                max_id = max(max_id, user_id)
+            self._by_id.update(by_id)
+            self._by_username.update(by_username)
+            self._max_id = max_id
+
+    def update_password_hash(self, user_id, password_hash):
+        self._by_id[user_id].password_hash = password_hash
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+class SQLiteUserStore(UserStore):
+    """Пользователи в SQLite: поиск по первичному ключу и уникальному индексу имени"""
+
+    def __init__(self, path):
+        # Одно соединение на процесс; sqlite3 сериализует обращения, блокировка защищает курсоры
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS users ('
+                             'id INTEGER PRIMARY KEY, '
+                             'username TEXT NOT NULL UNIQUE, '
+                             'password_hash TEXT NOT NULL)')
+
+    def _one(self, sql, value):
+        with self._lock:
+            row = self._db.execute(sql, (value,)).fetchone()
+        return User(*row) if row else None
+
+    def get_by_id(self, user_id):
+        return self._one('SELECT id, username, password_hash FROM users WHERE id = ?', user_id)
+
+    def get_by_username(self, username):
+        return self._one('SELECT id, username, password_hash FROM users WHERE username = ?', username)
+
+    def add_many(self, rows):
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.executemany(
+                        'INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                        ((row.get('id'), row['username'], row['password_hash']) for row in rows)
+                    )
+            except sqlite3.IntegrityError as err:
+                raise ValueError(f'пользователь уже существует: {err}') from err
+
+    def update_password_hash(self, user_id, password_hash):
+        with self._lock, self._db:
+            self._db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+
+def read_users(path):
+    """Читает пользователей из CSV (id, username, password_hash) или JSON Lines"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            user_id = row.get('id')
+            yield {
+                'id': int(user_id) if user_id not in (None, '') else None,
+                'username': row['username'],
+                'password_hash': row['password_hash'],
+            }
+
+
+def load_users(store, path, batch_size=10000):
+    """Загружает пользователей из файла порциями, возвращает количество"""
+    count = 0
+    batch = []
+    for row in read_users(path):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            store.add_many(batch)
+            count += len(batch)
+            batch = []
+    store.add_many(batch)
+    return count + len(batch)
+
+
+def create_user_store(database=None):
+    """MemoryUserStore по умолчанию или SQLiteUserStore, если указан путь к базе"""
+    if database:
+        directory = os.path.dirname(database)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteUserStore(database)
+    return MemoryUserStore()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Проверка записей пользователя: прежние функции validate_* по полям против
+схемы с заранее скомпилированными правилами (записей в секунду)
+
+Запуск из каталога лабораторной:
+    python -m benchmarks.validation --records 200000
+"""
+
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation import USER_SCHEMA
+
+
+# Прежняя проверка: выражения разбираются через кеш модуля re при каждом вызове
+def legacy_validate_login(login):
+    if not login:
+        return False, "Поле не может быть пустым"
+    if len(login) < 5:
+        return False, "Логин должен содержать не менее 5 символов"
+    if not re.match(r'^[a-zA-Z0-9]+$', login):
+        return False, "Логин должен состоять только из латинских букв и цифр"
+    return True, ""
+
+
+def legacy_validate_password(password):
+    if not password:
+        return False, "Поле не может быть пустым"
+    if len(password) < 8:
+        return False, "Пароль должен содержать не менее 8 символов"
+    if len(password) > 128:
+        return False, "Пароль должен содержать не более 128 символов"
+    if ' ' in password:
+        return False, "Пароль не должен содержать пробелы"
+    if not re.search(r'[A-Z]', password):
+        return False, "Пароль должен содержать хотя бы одну заглавную букву"
+    if not re.search(r'[a-z]', password):
+        return False, "Пароль должен содержать хотя бы одну строчную букву"
+    if not re.search(r'[0-9]', password):
+        return False, "Пароль должен содержать хотя бы одну цифру"
+    if not re.match(r'^[a-zA-Zа-яА-Я0-9~!?@#$%^&*_\-+()\[\]{}></\\|"\'.,:;]+$', password):
+        return False, "Пароль содержит недопустимые символы"
+    return True, ""
+
+
+def legacy_validate_name(name, field_name):
+    if not name:
+        return False, f"Поле {field_name} не может быть пустым"
+    return True, ""
+
+
+def legacy_validate(form):
+    """Как прежние представления: по вызову на поле и сборка словаря ошибок"""
+    errors = {}
+    valid, error = legacy_validate_login(form.get('login'))
+    if not valid:
+        errors['login'] = error
+    valid, error = legacy_validate_password(form.get('password'))
+    if not valid:
+        errors['password'] = error
+    valid, error = legacy_validate_name(form.get('name'), 'Имя')
+    if not valid:
+        errors['name'] = error
+    valid, error = legacy_validate_name(form.get('surname'), 'Фамилия')
+    if not valid:
+        errors['surname'] = error
+    return errors
+
+
+def make_records(count, invalid_share, seed=1):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {
+            'login': f'user{i:06d}',
+            'password': 'Pass' + ''.join(rng.choices(string.ascii_letters + string.digits, k=8)) + '1',
+            'surname': 'Иванов',
+            'name': 'Иван',
+        }
+        if rng.random() < invalid_share:
+            record[rng.choice(['login', 'password', 'name'])] = rng.choice(['', 'ab', 'с пробелом'])
+        records.append(record)
+    return records
+
+
+def measure(validate, records):
+    started = time.perf_counter()
+    failed = sum(1 for record in records if validate(record))
+    return len(records) / (time.perf_counter() - started), failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Скорость проверки записей пользователя')
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--invalid', type=float, default=0.1, help='Доля записей с ошибками')
+    args = parser.parse_args(argv)
+
+    records = make_records(args.records, args.invalid)
+    if any(legacy_validate(record) != USER_SCHEMA.validate(record) for record in records):
+        raise SystemExit('Схема и прежние функции дают разные ошибки')
+    for name, validate in (('validate_* по полям', legacy_validate), ('схема', USER_SCHEMA.validate)):
+        rate, failed = measure(validate, records)
+        print(f'{name:<22} {rate:>10,.0f} записей/с  с ошибками {failed}')
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,19 @@
 import unittest
 import os
+import io
+import json
 import tempfile
-from app import app, db, User, Role, validate_login, validate_password, validate_name
+
+# Движок базы создается при импорте app, поэтому тестовая база задается до импорта,
+# иначе тесты создают и удаляют таблицы в instance/users.db
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+from app import app, db, database_upgraded, password_hasher, login_throttle, role_cache, user_page, make_user_importer, User, Role, validate_login, validate_password, validate_name
+from unittest.mock import patch
 from werkzeug.security import generate_password_hash
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from bulk_users import read_rows
+from validation import USER_SCHEMA, USER_EDIT_SCHEMA
 
 class UserManagementTestCase(unittest.TestCase):
     
@@ -12,6 +23,7 @@ class UserManagementTestCase(unittest.TestCase):
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         app.config['TESTING'] = True
         self.app = app.test_client()
+        login_throttle.reset()
         
         with app.app_context():
             db.create_all()
@@ -100,12 +112,126 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertFalse(valid)
         self.assertIn('пустым', error)
     
+    def test_user_schema_collects_all_errors(self):
+        """Тест: схема проверяет всю форму за один проход и возвращает ошибки всех полей"""
+        self.assertEqual(USER_SCHEMA.validate({
+            'login': 'user1', 'password': 'ValidPass123', 'surname': 'Иванов', 'name': 'Иван'
+        }), {})
+        self.assertEqual(USER_SCHEMA.validate({'login': 'ab', 'password': 'Test 123', 'surname': ''}), {
+            'login': 'Логин должен содержать не менее 5 символов',
+            'password': 'Пароль не должен содержать пробелы',
+            'surname': 'Поле Фамилия не может быть пустым',
+            'name': 'Поле Имя не может быть пустым',
+        })
+        # Выражение должно совпадать со всей строкой, включая перевод строки в конце
+        self.assertIn('login', USER_SCHEMA.validate({'login': 'user1\n'}))
+        self.assertEqual(USER_EDIT_SCHEMA.validate({'surname': 'Иванов', 'name': ''}),
+                         {'name': 'Поле Имя не может быть пустым'})
+    
     def test_index_page(self):
         """Тест главной страницы"""
         response = self.app.get('/')
         self.assertEqual(response.status_code, 200)
         self.assertIn('Список пользователей', response.data.decode('utf-8'))
     
+    def add_users(self, count):
+        with app.app_context():
+            role = Role.query.first()
+            started = datetime(2024, 1, 1)
+            for i in range(count):
+                # Одинаковое время у соседних пользователей: порядок задает id
+                db.session.add(User(login=f'user{i:03d}', password_hash='hash', name=f'Имя{i}',
+                                    surname=f'Фамилия{i:03d}', role_id=role.id,
+                                    created_at=started + timedelta(minutes=i // 2)))
+            db.session.commit()
+    
+    def test_index_keyset_pagination(self):
+        """Тест постраничного вывода пользователей по ключу (created_at, id)"""
+        self.add_users(45)
+        with app.app_context():
+            seen = []
+            page = user_page(per_page=20)
+            pages = [page]
+            while page.has_next:
+                after = (page.users[-1].created_at, page.users[-1].id)
+                page = user_page(after=after, per_page=20)
+                pages.append(page)
+            for page in pages:
+                seen.extend(user.id for user in page.users)
+            total = User.query.count()
+            self.assertEqual([len(page.users) for page in pages[:-1]], [20, 20])
+            self.assertEqual(len(seen), total)
+            self.assertEqual(len(set(seen)), total)
+            
+            last = pages[-1].users[0]
+            previous = user_page(before=(last.created_at, last.id), per_page=20)
+            self.assertEqual([u.id for u in previous.users], [u.id for u in pages[1].users])
+            self.assertTrue(previous.has_prev)
+        
+        response = self.app.get('/')
+        self.assertIn('Вперед', response.data.decode('utf-8'))
+        with app.app_context():
+            cursor = user_page(per_page=20).next_cursor
+        response = self.app.get(f'/?after={cursor}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Фамилия020', response.data.decode('utf-8'))
+        self.assertNotIn('Фамилия019', response.data.decode('utf-8'))
+        self.assertEqual(self.app.get('/?after=broken').status_code, 400)
+    
+    def test_startup_upgrade_fills_created_at_and_indexes(self):
+        """Тест: первый запрос обновляет старую базу — NULL в created_at и недостающие индексы"""
+        with app.app_context():
+            User.__table__.drop(db.engine)
+            with db.engine.begin() as connection:
+                # Таблица в том виде, в каком ее создавали прежние версии: без индексов, created_at допускает NULL
+                connection.exec_driver_sql(
+                    'CREATE TABLE user (id INTEGER PRIMARY KEY, login VARCHAR(50) NOT NULL UNIQUE, '
+                    'password_hash VARCHAR(255) NOT NULL, surname VARCHAR(50), name VARCHAR(50) NOT NULL, '
+                    'patronymic VARCHAR(50), role_id INTEGER REFERENCES role (id), created_at DATETIME)')
+                connection.exec_driver_sql(
+                    "INSERT INTO user (login, password_hash, name, surname, role_id, created_at) VALUES "
+                    "('old1', 'hash', 'Старый', 'Первый', 1, NULL), ('old2', 'hash', 'Старый', 'Второй', 1, NULL)")
+        database_upgraded.clear()
+        
+        response = self.app.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Первый', response.data.decode('utf-8'))
+        with app.app_context():
+            self.assertEqual(User.query.filter(User.created_at.is_(None)).count(), 0)
+            indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('user')}
+            self.assertLessEqual({'ix_user_created_at_id', 'ix_user_login'}, indexes)
+            cursor = user_page(per_page=1).next_cursor
+        self.assertEqual(self.app.get(f'/?after={cursor}').status_code, 200)
+    
+    def test_index_single_query_with_roles(self):
+        """Тест: страница пользователей с ролями загружается одним запросом"""
+        self.add_users(30)
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                page = user_page(per_page=20)
+                roles = [user.role_name for user in page.users]
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual(len(statements), 1)
+            self.assertEqual(set(roles), {'Администратор'})
+            self.assertNotIsInstance(page.users[0], User)
+            self.assertIsInstance(user_page(per_page=20, projection=False).users[0], User)
+    
+    def test_index_search(self):
+        """Тест поиска пользователей по началу фамилии, имени или логина"""
+        self.add_users(30)
+        response = self.app.get('/?q=Фамилия01')
+        html = response.data.decode('utf-8')
+        self.assertIn('Фамилия010', html)
+        self.assertNotIn('Фамилия020', html)
+        with app.app_context():
+            self.assertEqual(len(user_page(search='user02').users), 10)
+            self.assertEqual(len(user_page(search='test').users), 1)
+            self.assertEqual(user_page(search='%').users, [])
+    
     def test_login_page(self):
         """Тест страницы входа"""
         response = self.app.get('/login')
@@ -138,6 +264,79 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Неверный логин или пароль', response.data.decode('utf-8'))
     
+    def test_login_upgrades_outdated_hash(self):
+        """Тест пересчета хеша со старыми параметрами при входе"""
+        with app.app_context():
+            user = User.query.filter_by(login='testuser').first()
+            user.password_hash = generate_password_hash('testpassword', 'pbkdf2:sha256:1000')
+            db.session.commit()
+        
+        response = self.app.post('/login', data={
+            'login': 'testuser',
+            'password': 'testpassword'
+        })
+        self.assertEqual(response.status_code, 302)
+        
+        with app.app_context():
+            user = User.query.filter_by(login='testuser').first()
+            self.assertFalse(password_hasher.needs_rehash(user.password_hash))
+            self.assertTrue(password_hasher.check(user.password_hash, 'testpassword'))
+    
+    def test_login_rejected_when_hasher_busy(self):
+        """Тест ответа 503 при заполненной очереди хеширования"""
+        with patch.object(password_hasher, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = self.app.post('/login', data={
+                'login': 'testuser',
+                'password': 'testpassword'
+            })
+        self.assertEqual(response.status_code, 503)
+    
+    def test_login_throttled(self):
+        """Тест ответа 429 после исчерпания попыток входа без проверки пароля"""
+        for _ in range(app.config['LOGIN_THROTTLE_LOGIN_BURST']):
+            response = self.app.post('/login', data={
+                'login': 'testuser',
+                'password': 'wrongpassword'
+            })
+            self.assertEqual(response.status_code, 200)
+        
+        with patch.object(password_hasher, 'verify') as verify:
+            response = self.app.post('/login', data={
+                'login': 'testuser',
+                'password': 'testpassword'
+            })
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        verify.assert_not_called()
+        
+        stats = self.app.get('/login-throttle-stats').get_json()
+        self.assertEqual(stats['throttled_login'], 1)
+        response = self.app.get('/login-throttle-stats', environ_base={'REMOTE_ADDR': '203.0.113.5'})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_session_stored_on_server(self):
+        """Тест серверной сессии: в cookie только идентификатор, выход удаляет запись"""
+        with app.app_context():
+            user = User.query.filter_by(login='testuser').first()
+            user.password_hash = generate_password_hash('testpassword')
+            db.session.commit()
+        
+        # Идентификатор, полученный до входа, после входа недействителен
+        self.app.get('/login')
+        with self.app.session_transaction() as sess:
+            sess['before_login'] = True
+        before = self.app.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.app.post('/login', data={'login': 'testuser', 'password': 'testpassword'})
+        sid = self.app.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.assertNotIn('testuser', sid)
+        self.assertNotEqual(before, sid)
+        self.assertIsNone(app.session_interface.store.load(before))
+        self.assertEqual(app.session_interface.store.load(sid)['user_login'], 'testuser')
+        
+        self.app.get('/logout')
+        self.assertIsNone(app.session_interface.store.load(sid))
+    
     def test_logout(self):
         """Тест выхода из системы"""
         # Сначала входим в систему
@@ -179,6 +378,27 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Создание пользователя', response.data.decode('utf-8'))
     
+    def test_create_user_rejected_when_hasher_busy(self):
+        """Тест ответа 503 при создании пользователя с заполненной очередью хеширования"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        with patch.object(password_hasher, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = self.app.post('/user/create', data={
+                'login': 'newuser',
+                'password': 'NewPass123',
+                'surname': 'Новый',
+                'name': 'Пользователь',
+                'patronymic': 'Тестовый',
+                'role_id': '1'
+            })
+        self.assertEqual(response.status_code, 503)
+        
+        with app.app_context():
+            self.assertIsNone(User.query.filter_by(login='newuser').first())
+    
     def test_create_user_success(self):
         """Тест успешного создания пользователя"""
         with self.app.session_transaction() as sess:
@@ -222,6 +442,78 @@ class UserManagementTestCase(unittest.TestCase):
         if response.status_code == 200:
             self.assertIn('is-invalid', response.data.decode('utf-8'))
     
+    def count_statements(self, request):
+        """SQL-запросы, выполненные за время запроса к приложению"""
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                response = request()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        return response, statements
+    
+    def test_create_user_query_count(self):
+        """Тест: форма берет роли из кеша, а создание пользователя — один INSERT"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        self.app.get('/user/create')
+        
+        response, statements = self.count_statements(lambda: self.app.get('/user/create'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Пользователь', response.data.decode('utf-8'))
+        self.assertEqual(statements, [])
+        
+        response, statements = self.count_statements(lambda: self.app.post('/user/create', data={
+            'login': 'newuser',
+            'password': 'NewPass123',
+            'surname': 'Новый',
+            'name': 'Пользователь',
+            'patronymic': '',
+            'role_id': '2'
+        }))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT INTO user'))
+    
+    def test_create_user_duplicate_login(self):
+        """Тест: повторный логин отклоняется по ограничению уникальности в БД"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        response = self.app.post('/user/create', data={
+            'login': 'testuser',
+            'password': 'NewPass123',
+            'surname': 'Новый',
+            'name': 'Пользователь',
+            'patronymic': '',
+            'role_id': '1'
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Пользователь с таким логином уже существует', response.data.decode('utf-8'))
+        with app.app_context():
+            self.assertEqual(User.query.filter_by(login='testuser').count(), 1)
+    
+    def test_role_cache_invalidated_on_change(self):
+        """Тест: кеш ролей сбрасывается после фиксации изменения ролей"""
+        with app.app_context():
+            self.assertEqual([role.name for role in role_cache.all()], ['Администратор', 'Пользователь'])
+            role = db.session.get(Role, 2)
+            role.name = 'Читатель'
+            db.session.add(Role(name='Модератор'))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(role_cache.get(2).name, 'Пользователь')
+            
+            db.session.get(Role, 2).name = 'Читатель'
+            db.session.commit()
+            self.assertEqual(role_cache.get(2).name, 'Читатель')
+            self.assertIsNone(role_cache.get(3))
+    
     def test_edit_user_requires_auth(self):
         """Тест, что редактирование требует аутентификации"""
         response = self.app.get('/user/1/edit', follow_redirects=True)
@@ -283,6 +575,71 @@ class UserManagementTestCase(unittest.TestCase):
             user = User.query.get(user_id)
             self.assertIsNone(user)
     
+    def test_import_users_csv(self):
+        """Тест импорта пользователей из CSV с отчетом об ошибках по строкам"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        data = ('login,password,surname,name,patronymic,role\n'
+                'importuser1,NewPass123,Первый,Иван,,Пользователь\n'
+                'importuser2,NewPass123,Второй,Петр,Петрович,\n'
+                'ab,123,,Имя,,Гость\n'
+                'testuser,NewPass123,Фамилия,Имя,,\n'
+                'importuser1,NewPass123,Повтор,Иван,,\n')
+        response = self.app.post('/users/import', data={
+            'file': (io.BytesIO(data.encode('utf-8-sig')), 'users.csv')
+        }, content_type='multipart/form-data')
+        
+        html = response.data.decode('utf-8')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('создано пользователей: 2', html)
+        self.assertIn('Логин должен содержать не менее 5 символов', html)
+        self.assertIn('Роль «Гость» не найдена', html)
+        self.assertIn('Пользователь с таким логином уже существует', html)
+        self.assertIn('Логин повторяется в файле', html)
+        with app.app_context():
+            user = User.query.filter_by(login='importuser1').first()
+            self.assertEqual(user.role.name, 'Пользователь')
+            self.assertTrue(password_hasher.check(user.password_hash, 'NewPass123'))
+            self.assertIsNone(User.query.filter_by(login='importuser2').first().role_id)
+    
+    def test_import_users_in_batches(self):
+        """Тест: каждый пакет импорта вставляется одним executemany"""
+        lines = [json.dumps({'login': f'batchuser{i}', 'password_hash': 'pbkdf2:sha256:1$salt$hash',
+                             'surname': 'Фамилия', 'name': 'Имя', 'role_id': 2})
+                 for i in range(5)]
+        with app.app_context():
+            importer = make_user_importer(batch_size=2)
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                report = importer.run(read_rows(io.StringIO('\n'.join(lines)), 'jsonl'))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual((report.processed, report.created, report.failed), (5, 5, 0))
+            self.assertEqual(len([s for s in statements if s.startswith('INSERT INTO user')]), 3)
+            self.assertEqual(User.query.filter(User.login.like('batchuser%')).count(), 5)
+    
+    def test_export_users(self):
+        """Тест потоковой выгрузки пользователей в CSV и JSON Lines"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        response = self.app.get('/users/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'login,surname,name,patronymic,role,created_at')
+        self.assertIn('testuser,Пользователь,Тест,,Администратор,', response.data.decode('utf-8'))
+        
+        response = self.app.get('/users/export?format=jsonl')
+        rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertIn({'login': 'testuser', 'role': 'Администратор'},
+                      [{'login': row['login'], 'role': row['role']} for row in rows])
+    
     def test_change_password_requires_auth(self):
         """Тест, что смена пароля требует аутентификации"""
         response = self.app.get('/change_password', follow_redirects=True)
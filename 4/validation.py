@@ -0,0 +1,118 @@
+import re
+from functools import lru_cache
+
+REQUIRED_MESSAGE = "Поле не может быть пустым"
+
+
+def min_length(limit, message):
+    return lambda value: len(value) >= limit, message
+
+
+def max_length(limit, message):
+    return lambda value: len(value) <= limit, message
+
+
+def matches(pattern, message):
+    """Значение целиком соответствует выражению"""
+    return re.compile(pattern).fullmatch, message
+
+
+def contains(pattern, message):
+    """В значении есть хотя бы одно совпадение с выражением"""
+    return re.compile(pattern).search, message
+
+
+def excludes(chars, message):
+    return lambda value: not any(char in value for char in chars), message
+
+
+class Field:
+    """Правила одного поля: обязательность и проверки в порядке объявления.
+
+    Проверка — пара (предикат, сообщение); ошибкой поля становится сообщение
+    первой не прошедшей проверки, как в прежних функциях validate_*.
+    """
+
+    def __init__(self, *rules, label=None, required=True, required_message=REQUIRED_MESSAGE):
+        self.rules = tuple(rules)
+        self.label = label
+        self.required = required
+        # {label} подставляется один раз при построении поля, а не при каждой проверке
+        self.required_message = required_message.format(label=label)
+
+    def result(self, value):
+        """Проверка в прежнем виде: (валидно ли, сообщение)"""
+        error = self.check(value)
+        return error is None, error or ""
+
+    def check(self, value):
+        """Сообщение об ошибке или None"""
+        if value is None or value == '':
+            return self.required_message if self.required else None
+        for predicate, message in self.rules:
+            if not predicate(value):
+                return message
+        return None
+
+
+class Schema:
+    """Схема формы: все поля проверяются за один проход, ошибки собираются по всем полям.
+
+    Выражения компилируются при построении схемы (при импорте модуля), поэтому
+    проверка записи — только вызовы предикатов. Подходит и для request.form,
+    и для словарей из JSON или строк массового импорта.
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self._checks = tuple((name, field.check) for name, field in fields.items())
+
+    def validate(self, data):
+        """Словарь {поле: сообщение}; пустой, если запись корректна"""
+        errors = {}
+        get = data.get
+        for name, check in self._checks:
+            error = check(get(name))
+            if error is not None:
+                errors[name] = error
+        return errors
+
+    def only(self, *names):
+        return Schema(**{name: self.fields[name] for name in names})
+
+
+@lru_cache(maxsize=None)
+def name_field(label):
+    return Field(label=label, required_message="Поле {label} не может быть пустым")
+
+
+LOGIN = Field(
+    min_length(5, "Логин должен содержать не менее 5 символов"),
+    matches(r'[a-zA-Z0-9]+', "Логин должен состоять только из латинских букв и цифр"),
+    label='Логин',
+)
+
+PASSWORD = Field(
+    min_length(8, "Пароль должен содержать не менее 8 символов"),
+    max_length(128, "Пароль должен содержать не более 128 символов"),
+    excludes(' ', "Пароль не должен содержать пробелы"),
+    contains(r'[A-Z]', "Пароль должен содержать хотя бы одну заглавную букву"),
+    contains(r'[a-z]', "Пароль должен содержать хотя бы одну строчную букву"),
+    contains(r'[0-9]', "Пароль должен содержать хотя бы одну цифру"),
+    matches(r'[a-zA-Zа-яА-Я0-9~!?@#$%^&*_\-+()\[\]{}></\\|"\'.,:;]+', "Пароль содержит недопустимые символы"),
+    label='Пароль',
+)
+
+PASSWORD_HASH = Field(
+    matches(r'[^$]+\$[^$]*\$[^$]+', "Хеш пароля должен быть в формате метод$соль$хеш"),
+    label='Хеш пароля',
+)
+
+SURNAME = name_field('Фамилия')
+NAME = name_field('Имя')
+
+USER_SCHEMA = Schema(login=LOGIN, password=PASSWORD, surname=SURNAME, name=NAME)
+USER_EDIT_SCHEMA = USER_SCHEMA.only('surname', 'name')
+# Перенос из другой системы: вместо пароля приходит готовый хеш
+USER_HASH_IMPORT_SCHEMA = Schema(login=LOGIN, password_hash=PASSWORD_HASH, surname=SURNAME, name=NAME)
+PASSWORD_SCHEMA = Schema(new_password=PASSWORD)
@@ -1,16 +1,63 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, Response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as SQLAlchemySession
+from werkzeug.security import generate_password_hash
 from datetime import datetime
-import re
 import os
+import io
+import click
+import random
+import sys
+import threading
+import time
+from password_hasher import PasswordHasher
+from login_throttle import LoginThrottle
+from visit_sketches import VisitSketches
+from visit_rules import VisitRules
+from session_store import init_session_store
+from bulk_users import UserImporter, detect_format, export_rows, read_rows
+from validation import (LOGIN, PASSWORD, PASSWORD_SCHEMA, USER_EDIT_SCHEMA, USER_HASH_IMPORT_SCHEMA,
+                        USER_SCHEMA, name_field)
+
+# reports.py и visit_partitions.py импортируют объекты из app: при запуске python app.py
+# модуль должен быть известен под этим именем, иначе он выполнится второй раз
+if __name__ == '__main__':
+    sys.modules.setdefault('app', sys.modules[__name__])
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['USERS_PER_PAGE'] = 20
+app.config['ROLE_CACHE_TTL'] = 60
+app.config['USER_IMPORT_BATCH_SIZE'] = 1000
+# Журнал посещений: сколько месяцев (считая текущий) хранится в таблице visit_log
+# и сколько месяцев (тоже считая текущий) хранятся архивные сегменты, 0 — бессрочно
+app.config['VISIT_LOG_HOT_MONTHS'] = 3
+app.config['VISIT_LOG_ARCHIVE_MONTHS'] = 24
+
+# Параметры хеширования паролей: FLASK_PASSWORD_HASH_METHOD, FLASK_PASSWORD_HASH_WORKERS,
+# FLASK_PASSWORD_HASH_QUEUE, FLASK_PASSWORD_HASH_TIMEOUT; ограничение попыток входа:
+# FLASK_LOGIN_THROTTLE_* (см. README); серверные сессии: FLASK_SESSION_DATABASE,
+# FLASK_SESSION_REDIS_URL, FLASK_SESSION_FLUSH_INTERVAL, FLASK_SESSION_SWEEP_INTERVAL;
+# время жизни кеша ролей: FLASK_ROLE_CACHE_TTL; журнал посещений: FLASK_VISIT_LOG_HOT_MONTHS,
+# FLASK_VISIT_LOG_ARCHIVE_MONTHS, FLASK_VISIT_LOG_ARCHIVE_DIR (по умолчанию instance/visit_archive);
+# живая статистика посещений: FLASK_VISIT_SKETCH_*; правила журнала: FLASK_VISIT_LOG_INCLUDE,
+# FLASK_VISIT_LOG_EXCLUDE, FLASK_VISIT_LOG_SAMPLE_RATES (JSON), FLASK_VISIT_LOG_SKIP_BOTS (см. README_LR5)
+app.config.from_prefixed_env()
+init_session_store(app)
 
 db = SQLAlchemy(app)
+password_hasher = PasswordHasher()
+password_hasher.init_app(app)
+login_throttle = LoginThrottle()
+login_throttle.init_app(app)
+visit_sketches = VisitSketches()
+visit_sketches.init_app(app)
+visit_rules = VisitRules()
+visit_rules.init_app(app)
 
 # Модели базы данных
 class Role(db.Model):
@@ -27,49 +74,268 @@ class User(db.Model):
     name = db.Column(db.String(50), nullable=False)
     patronymic = db.Column(db.String(50))
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def role_name(self):
+        return self.role.name if self.role else None
+
+class VisitEndpoint(db.Model):
+    """Маршрут приложения (шаблон URL и endpoint), на который ссылаются записи журнала"""
+    id = db.Column(db.Integer, primary_key=True)
+    rule = db.Column(db.String(100), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('rule', 'endpoint'),)
 
 class VisitLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     path = db.Column(db.String(100), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    # NULL — запись, сделанная до появления маршрутов; в отчетах она учитывается по path
+    endpoint_id = db.Column(db.Integer, db.ForeignKey('visit_endpoint.id'), nullable=True)
+    # Сколько посещений представляет запись: 1 / доля выборки, отчеты суммируют веса
+    weight = db.Column(db.Float, nullable=False, default=1.0, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='visit_logs')
+    endpoint = db.relationship('VisitEndpoint')
+
+class VisitArchive(db.Model):
+    """Месяц журнала, перенесенный из visit_log в сжатый файл сегмента"""
+    month = db.Column(db.String(7), primary_key=True)
+    file_name = db.Column(db.String(255), nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class VisitArchivePage(db.Model):
+    """Число посещений страницы за архивный месяц"""
+    month = db.Column(db.String(7), db.ForeignKey('visit_archive.month'), primary_key=True)
+    path = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+class VisitArchiveRoute(db.Model):
+    """Число посещений маршрута (шаблона URL) за архивный месяц"""
+    month = db.Column(db.String(7), db.ForeignKey('visit_archive.month'), primary_key=True)
+    rule = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+class VisitArchiveUser(db.Model):
+    """Число посещений пользователя за архивный месяц; user_id NULL — анонимные посещения"""
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), db.ForeignKey('visit_archive.month'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    count = db.Column(db.Integer, nullable=False)
+
+# Журнал по диапазону дат (и перенос в архив), отчеты по маршрутам и страницам, фильтр по пользователю
+db.Index('ix_visit_log_created_at', VisitLog.created_at)
+# (вес в конце индексов — чтобы суммы посещений считались по индексу, без чтения таблицы)
+db.Index('ix_visit_log_endpoint_id_created_at', VisitLog.endpoint_id, VisitLog.created_at, VisitLog.weight)
+db.Index('ix_visit_log_path_created_at', VisitLog.path, VisitLog.created_at, VisitLog.weight)
+db.Index('ix_visit_log_user_id_created_at', VisitLog.user_id, VisitLog.created_at, VisitLog.weight)
+
+# Ключ постраничного вывода и индексы префиксного поиска: LIKE без учета регистра
+# использует индекс только с сортировкой NOCASE
+db.Index('ix_user_created_at_id', User.created_at, User.id)
+db.Index('ix_user_surname', db.collate(User.surname, 'NOCASE'))
+db.Index('ix_user_name', db.collate(User.name, 'NOCASE'))
+db.Index('ix_user_login', db.collate(User.login, 'NOCASE'))
+
+
+class RoleCache:
+    """Роли в памяти процесса: их немного, а нужны они в каждой форме пользователя.
+
+    Записи — неизменяемые строки (id, name, description), не привязанные к сессии
+    БД. Кеш сбрасывается после фиксации транзакции, изменившей роли, а ttl
+    ограничивает время, за которое изменения из других процессов станут видны.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._roles = None
+        self._by_id = {}
+        self._loaded_at = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def all(self):
+        roles = self._roles
+        if roles is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return roles
+        generation = self._generation
+        roles = tuple(db.session.execute(
+            db.select(Role.id, Role.name, Role.description).order_by(Role.id)))
+        with self._lock:
+            # Роли, прочитанные до сброса, могли устареть — такие не запоминаются
+            if generation == self._generation:
+                self._roles = roles
+                self._by_id = {role.id: role for role in roles}
+                self._loaded_at = time.monotonic()
+        return roles
+
+    def get(self, role_id):
+        if role_id is None:
+            return None
+        self.all()
+        return self._by_id.get(role_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._roles = None
+            self._by_id = {}
+
+
+role_cache = RoleCache(app.config['ROLE_CACHE_TTL'])
+
+
+@db.event.listens_for(Role, 'after_insert')
+@db.event.listens_for(Role, 'after_update')
+@db.event.listens_for(Role, 'after_delete')
+def mark_roles_changed(mapper, connection, target):
+    db.inspect(target).session.info['roles_changed'] = True
+
+
+@db.event.listens_for(SQLAlchemySession, 'after_commit')
+def invalidate_role_cache(db_session):
+    if db_session.info.pop('roles_changed', False):
+        role_cache.invalidate()
+
+
+@db.event.listens_for(SQLAlchemySession, 'after_rollback')
+def forget_role_changes(db_session):
+    db_session.info.pop('roles_changed', None)
+
+
+class EndpointCache:
+    """Идентификаторы маршрутов журнала посещений в памяти процесса: (rule, endpoint) -> id.
+
+    Набор маршрутов задан кодом приложения, поэтому кеш только пополняется:
+    строка visit_endpoint создается при первом посещении маршрута, дальше
+    журнал пишет одно целое число вместо повторного поиска.
+    """
+
+    def __init__(self):
+        self._ids = {}
+
+    def get_id(self, rule, endpoint):
+        key = (rule, endpoint)
+        endpoint_id = self._ids.get(key)
+        if endpoint_id is None:
+            endpoint_id = self._ids[key] = self._load(rule, endpoint)
+        return endpoint_id
+
+    def _load(self, rule, endpoint):
+        query = db.session.query(VisitEndpoint.id).filter_by(rule=rule, endpoint=endpoint)
+        endpoint_id = query.scalar()
+        if endpoint_id is None:
+            item = VisitEndpoint(rule=rule, endpoint=endpoint)
+            db.session.add(item)
+            try:
+                db.session.commit()
+                endpoint_id = item.id
+            except IntegrityError:
+                # Маршрут одновременно добавил другой процесс
+                db.session.rollback()
+                endpoint_id = query.scalar()
+        return endpoint_id
+
+    def invalidate(self):
+        self._ids = {}
+
+
+endpoint_cache = EndpointCache()
+
+
+@db.event.listens_for(VisitEndpoint.__table__, 'after_create')
+def reset_endpoint_cache(target, connection, **kw):
+    # Идентификаторы из пересозданной таблицы (например, в тестах) больше не действительны
+    endpoint_cache.invalidate()
+
+# Столбцы списка пользователей: строки без загрузки полных объектов User
+USER_LIST_COLUMNS = (User.id, User.login, User.surname, User.name, User.patronymic,
+                     User.created_at, Role.name.label('role_name'))
+
+
+class UserPage:
+    """Страница списка пользователей и курсоры соседних страниц"""
+
+    def __init__(self, users, has_prev, has_next):
+        self.users = users
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self.users[0]) if self.has_prev and self.users else None
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.users[-1]) if self.has_next and self.users else None
 
-# Функции валидации
+
+def encode_cursor(user):
+    return f'{user.created_at.isoformat()}_{user.id}'
+
+
+def decode_cursor(cursor):
+    """Курсор 'created_at_id' в кортеж ключа; ValueError для испорченного курсора"""
+    created_at, _, user_id = cursor.rpartition('_')
+    return datetime.fromisoformat(created_at), int(user_id)
+
+
+def escape_like(value):
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def user_page(after=None, before=None, search=None, per_page=20, projection=True):
+    """Страница пользователей по ключу (created_at, id) вместе с ролью в одном запросе.
+
+    after/before — ключи последней и первой записей соседних страниц, search —
+    начало фамилии, имени или логина. При projection=False возвращаются
+    объекты User с уже загруженной ролью.
+    """
+    if projection:
+        query = db.session.query(*USER_LIST_COLUMNS).outerjoin(Role, User.role_id == Role.id)
+    else:
+        query = User.query.outerjoin(User.role).options(db.contains_eager(User.role))
+    if search:
+        # Шаблон собирается здесь: выражение вида ? || '%' не использует индекс
+        pattern = escape_like(search) + '%'
+        query = query.filter(or_(User.surname.like(pattern, escape='/'),
+                                 User.name.like(pattern, escape='/'),
+                                 User.login.like(pattern, escape='/')))
+    key = tuple_(User.created_at, User.id)
+    if before is not None:
+        rows = (query.filter(key < before)
+                .order_by(User.created_at.desc(), User.id.desc())
+                .limit(per_page + 1).all())
+        return UserPage(rows[:per_page][::-1], len(rows) > per_page, True)
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(User.created_at, User.id).limit(per_page + 1).all()
+    return UserPage(rows[:per_page], after is not None, len(rows) > per_page)
+
+def is_login_conflict(error):
+    """Нарушено ли ограничение уникальности логина (текст ошибки зависит от СУБД)"""
+    message = str(error.orig).lower()
+    return ('unique' in message or 'duplicate' in message) and 'login' in message
+
+# Функции валидации: правила полей описаны схемами в validation.py
 def validate_login(login):
-    if not login:
-        return False, "Поле не может быть пустым"
-    if len(login) < 5:
-        return False, "Логин должен содержать не менее 5 символов"
-    if not re.match(r'^[a-zA-Z0-9]+$', login):
-        return False, "Логин должен состоять только из латинских букв и цифр"
-    return True, ""
+    return LOGIN.result(login)
 
 def validate_password(password):
-    if not password:
-        return False, "Поле не может быть пустым"
-    if len(password) < 8:
-        return False, "Пароль должен содержать не менее 8 символов"
-    if len(password) > 128:
-        return False, "Пароль должен содержать не более 128 символов"
-    if ' ' in password:
-        return False, "Пароль не должен содержать пробелы"
-    if not re.search(r'[A-Z]', password):
-        return False, "Пароль должен содержать хотя бы одну заглавную букву"
-    if not re.search(r'[a-z]', password):
-        return False, "Пароль должен содержать хотя бы одну строчную букву"
-    if not re.search(r'[0-9]', password):
-        return False, "Пароль должен содержать хотя бы одну цифру"
-    if not re.match(r'^[a-zA-Zа-яА-Я0-9~!?@#$%^&*_\-+()\[\]{}></\\|"\'.,:;]+$', password):
-        return False, "Пароль содержит недопустимые символы"
-    return True, ""
+    return PASSWORD.result(password)
 
 def validate_name(name, field_name):
-    if not name:
-        return False, f"Поле {field_name} не может быть пустым"
-    return True, ""
+    return name_field(field_name).result(name)
+
+def validate_user_row(row):
+    """Ошибки полей записи массового импорта: те же правила, что у формы создания"""
+    if row.get('password_hash'):
+        return USER_HASH_IMPORT_SCHEMA.validate(row)
+    return USER_SCHEMA.validate(row)
 
 # Декоратор для проверки аутентификации
 def login_required(f):
@@ -83,6 +349,13 @@ def login_required(f):
 
 # Декоратор для проверки прав доступа
 def check_rights(required_rights):
+    """Проверка прав по роли.
+
+    Администратору доступно все. Пользователю — edit_own_data и
+    view_own_profile (только для своего user_id) и view_own_visits (отчеты
+    сужаются до его посещений). view_all_visits — сводки по всем посещениям
+    без разбивки по пользователям, только для администратора.
+    """
     def decorator(f):
         def decorated_function(*args, **kwargs):
             if 'user_id' not in session:
@@ -90,18 +363,27 @@ def check_rights(required_rights):
                 return redirect(url_for('login'))
             
             user = User.query.get(session['user_id'])
-            if not user or not user.role:
+            # Роль берется из кеша ролей, а не отдельным запросом на каждую проверку
+            role = role_cache.get(user.role_id) if user else None
+            if not role:
                 flash('У вас недостаточно прав для доступа к данной странице.', 'error')
                 return redirect(url_for('index'))
+            # Представления (например, отчеты) сужают выборку по роли без повторной загрузки
+            g.current_user = user
+            g.current_role = role
             
             # Проверяем права администратора
-            if user.role.name == 'Администратор':
+            if role.name == 'Администратор':
                 # Администратор имеет все права
                 return f(*args, **kwargs)
             
             # Проверяем права обычного пользователя
-            if user.role.name == 'Пользователь':
-                if 'edit_own_data' in required_rights:
+            if role.name == 'Пользователь':
+                if 'view_all_visits' in required_rights:
+                    # Сводки по всем посещениям пользователю не выдаются
+                    flash('У вас недостаточно прав для доступа к данной странице.', 'error')
+                    return redirect(url_for('index'))
+                elif 'edit_own_data' in required_rights:
                     # Пользователь может редактировать только свои данные
                     if 'user_id' in kwargs and kwargs['user_id'] != user.id:
                         flash('У вас недостаточно прав для доступа к данной странице.', 'error')
@@ -122,44 +404,94 @@ def check_rights(required_rights):
         return decorated_function
     return decorator
 
+# Схема существующей базы обновляется при первом запросе процесса, поэтому
+# индексы и столбцы появляются и при запуске через flask run или WSGI-сервер
+database_upgraded = threading.Event()
+database_upgrade_lock = threading.Lock()
+
+@app.before_request
+def ensure_database_upgraded():
+    if database_upgraded.is_set():
+        return
+    with database_upgrade_lock:
+        if not database_upgraded.is_set():
+            upgrade_database()
+            database_upgraded.set()
+
 # Декоратор для логирования посещений
 @app.before_request
 def log_visit():
-    # Исключаем статические файлы и некоторые служебные маршруты
-    if request.endpoint and not request.endpoint.startswith('static'):
-        user_id = session.get('user_id') if 'user_id' in session else None
+    # Исключения, доля выборки и роботы — по правилам visit_rules (без обращения к БД)
+    if not request.endpoint:
+        return
+    rate = visit_rules.rate(request.method, request.endpoint, request.headers.get('User-Agent', ''))
+    if not rate:
+        return
+    user_id = session.get('user_id') if 'user_id' in session else None
+    if rate >= 1 or random.random() < rate:
         visit_log = VisitLog(
             path=request.path,
-            user_id=user_id
+            user_id=user_id,
+            endpoint_id=endpoint_cache.get_id(request.url_rule.rule, request.endpoint),
+            weight=1 / rate
         )
         db.session.add(visit_log)
         db.session.commit()
+    # Сводки в памяти дешевы, поэтому видят все посещения, а не только попавшие в выборку
+    visit_sketches.record(request.path, request.url_rule.rule, visitor_key(user_id))
+
+
+def visitor_key(user_id):
+    """Посетитель для подсчета уникальных: пользователь, иначе сессия, иначе адрес и браузер"""
+    if user_id is not None:
+        return f'user:{user_id}'
+    sid = getattr(session, 'sid', None)
+    if sid:
+        return f'session:{sid}'
+    return f"ip:{request.remote_addr}:{request.headers.get('User-Agent', '')}"
 
 # Маршруты
 @app.route('/')
 def index():
-    users = User.query.all()
-    user_role = None
     if 'user_id' in session:
         user = User.query.get(session['user_id'])
-        if user and user.role:
-            user_role = user.role.name
-            session['user_role'] = user_role
-    return render_template('index.html', users=users, is_authenticated='user_id' in session)
+        role = role_cache.get(user.role_id) if user else None
+        # Сессия хранится на сервере, поэтому роль записывается только при изменении
+        if role and session.get('user_role') != role.name:
+            session['user_role'] = role.name
+    search = request.args.get('q', '').strip()
+    try:
+        after = decode_cursor(request.args['after']) if request.args.get('after') else None
+        before = decode_cursor(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        abort(400)
+    page = user_page(after, before, search, app.config['USERS_PER_PAGE'])
+    return render_template('index.html', users=page.users, page=page, search=search,
+                           is_authenticated='user_id' in session)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         login = request.form['login']
         password = request.form['password']
+        # Лишние попытки отклоняются с 429 еще до поиска пользователя и хеширования
+        login_throttle.check(login, request.remote_addr)
         
         user = User.query.filter_by(login=login).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        valid, new_hash = password_hasher.verify(user.password_hash, password) if user else (False, None)
+        
+        if valid:
+            # Хеш со старыми параметрами пересчитывается при успешном входе
+            if new_hash:
+                user.password_hash = new_hash
+                db.session.commit()
+            session.regenerate()
             session['user_id'] = user.id
             session['user_login'] = user.login
-            if user.role:
-                session['user_role'] = user.role.name
+            role = role_cache.get(user.role_id)
+            if role:
+                session['user_role'] = role.name
             flash('Вы успешно вошли в систему', 'success')
             return redirect(url_for('index'))
         else:
@@ -169,6 +501,7 @@ def login():
 
 @app.route('/logout')
 def logout():
+    # clear() удаляет запись и выдает новый идентификатор (ServerSession.regenerate)
     session.clear()
     flash('Вы вышли из системы', 'info')
     return redirect(url_for('index'))
@@ -190,41 +523,24 @@ def create_user():
         patronymic = request.form['patronymic']
         role_id = request.form.get('role_id')
         
-        errors = {}
-        
-        # Валидация
-        login_valid, login_error = validate_login(login)
-        if not login_valid:
-            errors['login'] = login_error
-        
-        password_valid, password_error = validate_password(password)
-        if not password_valid:
-            errors['password'] = password_error
-        
-        name_valid, name_error = validate_name(name, 'Имя')
-        if not name_valid:
-            errors['name'] = name_error
-        
-        surname_valid, surname_error = validate_name(surname, 'Фамилия')
-        if not surname_valid:
-            errors['surname'] = surname_error
-        
-        # Проверка уникальности логина
-        if User.query.filter_by(login=login).first():
-            errors['login'] = "Пользователь с таким логином уже существует"
+        # Валидация всей формы за один проход
+        errors = USER_SCHEMA.validate(request.form)
         
         if errors:
-            roles = Role.query.all()
+            roles = role_cache.all()
             return render_template('user_form.html', 
                                  errors=errors, 
                                  form_data=request.form, 
                                  roles=roles,
                                  is_edit=False)
         
+        # Хеширование вне try: HasherBusy должен дойти до обработчика с ответом 503,
+        # а не превратиться в общую ошибку формы
+        password_hash = password_hasher.generate(password)
         try:
             user = User(
                 login=login,
-                password_hash=generate_password_hash(password),
+                password_hash=password_hash,
                 surname=surname,
                 name=name,
                 patronymic=patronymic,
@@ -234,17 +550,32 @@ def create_user():
             db.session.commit()
             flash('Пользователь успешно создан', 'success')
             return redirect(url_for('index'))
+        except IntegrityError as e:
+            db.session.rollback()
+            # Уникальность логина проверяет сама БД: без предварительного SELECT
+            # создание пользователя — одна запись, и два одновременных запроса
+            # с одним логином не проходят оба
+            if is_login_conflict(e):
+                errors = {'login': "Пользователь с таким логином уже существует"}
+            else:
+                flash('Ошибка при создании пользователя', 'error')
+                errors = {'general': 'Ошибка при создании пользователя'}
+            return render_template('user_form.html',
+                                 errors=errors,
+                                 form_data=request.form,
+                                 roles=role_cache.all(),
+                                 is_edit=False)
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при создании пользователя', 'error')
-            roles = Role.query.all()
+            roles = role_cache.all()
             return render_template('user_form.html', 
                                  errors={'general': 'Ошибка при создании пользователя'}, 
                                  form_data=request.form, 
                                  roles=roles,
                                  is_edit=False)
     
-    roles = Role.query.all()
+    roles = role_cache.all()
     return render_template('user_form.html', roles=roles, is_edit=False)
 
 @app.route('/user/<int:user_id>/edit', methods=['GET', 'POST'])
@@ -260,22 +591,15 @@ def edit_user(user_id):
         
         # Если пользователь - обычный пользователь, не изменяем роль
         current_user = User.query.get(session['user_id'])
-        if current_user and current_user.role and current_user.role.name == 'Пользователь' and current_user.id == user.id:
+        current_role = role_cache.get(current_user.role_id) if current_user else None
+        if current_role and current_role.name == 'Пользователь' and current_user.id == user.id:
             role_id = user.role_id  # Сохраняем текущую роль
         
-        errors = {}
-        
         # Валидация
-        name_valid, name_error = validate_name(name, 'Имя')
-        if not name_valid:
-            errors['name'] = name_error
-        
-        surname_valid, surname_error = validate_name(surname, 'Фамилия')
-        if not surname_valid:
-            errors['surname'] = surname_error
+        errors = USER_EDIT_SCHEMA.validate(request.form)
         
         if errors:
-            roles = Role.query.all()
+            roles = role_cache.all()
             return render_template('user_form.html', 
                                  errors=errors, 
                                  form_data=request.form, 
@@ -294,7 +618,7 @@ def edit_user(user_id):
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при обновлении пользователя', 'error')
-            roles = Role.query.all()
+            roles = role_cache.all()
             return render_template('user_form.html', 
                                  errors={'general': 'Ошибка при обновлении пользователя'}, 
                                  form_data=request.form, 
@@ -302,7 +626,7 @@ def edit_user(user_id):
                                  user=user,
                                  is_edit=True)
     
-    roles = Role.query.all()
+    roles = role_cache.all()
     return render_template('user_form.html', user=user, roles=roles, is_edit=True)
 
 @app.route('/user/<int:user_id>/delete', methods=['POST'])
@@ -320,6 +644,47 @@ def delete_user(user_id):
     
     return redirect(url_for('index'))
 
+def make_user_importer(batch_size=None):
+    return UserImporter(db, User, validate_user_row, password_hasher, role_cache.all(),
+                        batch_size or app.config['USER_IMPORT_BATCH_SIZE'])
+
+def user_export_rows():
+    """Пользователи для выгрузки: строки читаются из курсора порциями, без объектов User"""
+    query = (db.select(User.login, User.surname, User.name, User.patronymic, Role.name, User.created_at)
+             .outerjoin(Role, User.role_id == Role.id)
+             .order_by(User.id)
+             .execution_options(yield_per=1000))
+    yield from db.session.execute(query)
+
+@app.route('/users/import', methods=['GET', 'POST'])
+@check_rights(['import_users'])
+def import_users():
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Выберите файл для импорта', 'error')
+        else:
+            # utf-8-sig: CSV из Excel начинается с BOM
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            importer = make_user_importer()
+            try:
+                report = importer.run(read_rows(stream, detect_format(upload.filename)))
+            except UnicodeDecodeError:
+                report = importer.report
+                flash('Файл должен быть в кодировке UTF-8, импорт остановлен', 'error')
+    return render_template('import_users.html', report=report)
+
+@app.route('/users/export')
+@check_rights(['export_users'])
+def export_users():
+    fmt = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    response = Response(stream_with_context(export_rows(user_export_rows(), fmt)),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=users.{fmt}'
+    return response
+
 @app.route('/change_password', methods=['GET', 'POST'])
 @login_required
 def change_password():
@@ -329,17 +694,13 @@ def change_password():
         confirm_password = request.form['confirm_password']
         
         user = User.query.get(session['user_id'])
-        errors = {}
+        # Валидация нового пароля
+        errors = PASSWORD_SCHEMA.validate(request.form)
         
         # Проверка старого пароля
-        if not check_password_hash(user.password_hash, old_password):
+        if not password_hasher.check(user.password_hash, old_password):
             errors['old_password'] = "Неверный старый пароль"
         
-        # Валидация нового пароля
-        password_valid, password_error = validate_password(new_password)
-        if not password_valid:
-            errors['new_password'] = password_error
-        
         # Проверка совпадения паролей
         if new_password != confirm_password:
             errors['confirm_password'] = "Пароли не совпадают"
@@ -347,8 +708,9 @@ def change_password():
         if errors:
             return render_template('change_password.html', errors=errors)
         
+        password_hash = password_hasher.generate(new_password)
         try:
-            user.password_hash = generate_password_hash(new_password)
+            user.password_hash = password_hash
             db.session.commit()
             flash('Пароль успешно изменен', 'success')
             return redirect(url_for('index'))
@@ -360,13 +722,62 @@ def change_password():
 
 # Регистрация Blueprint будет выполнена после создания всех объектов
 
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Формат файла (по умолчанию определяется по расширению).')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Количество записей в одной транзакции.')
+def import_users_command(path, fmt, batch_size):
+    """Массовое создание пользователей из CSV/JSON Lines."""
+    def progress(report):
+        click.echo(f'  обработано {report.processed}, создано {report.created}, с ошибками {report.failed}')
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = make_user_importer(batch_size).run(read_rows(f, fmt or detect_format(path)), progress)
+    for number, errors in report.errors:
+        click.echo(f'  строка {number}: ' + '; '.join(f'{field}: {message}' for field, message in errors.items()),
+                   err=True)
+    click.echo(f'✓ Создано пользователей: {report.created}, строк с ошибками: {report.failed}')
+
+@app.cli.command('export-users')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Формат файла (по умолчанию определяется по расширению).')
+def export_users_command(path, fmt):
+    """Выгрузка пользователей в CSV/JSON Lines."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in export_rows(user_export_rows(), fmt or detect_format(path)):
+            f.write(chunk)
+    click.echo(f'✓ Пользователи выгружены в {path}')
+
+# Blueprint отчетов и команды журнала импортируют объекты этого модуля,
+# поэтому подключаются после их создания
+from reports import reports_bp
+from visit_partitions import visits_cli, add_visit_log_columns, fill_visit_endpoints
+app.register_blueprint(reports_bp)
+app.cli.add_command(visits_cli)
+
+# Дата создания для записей, сделанных до того, как created_at стал обязательным
+CREATED_AT_UNKNOWN = datetime(1970, 1, 1)
+
+
+def upgrade_database():
+    """Приводит существующую базу к текущей схеме: create_all не меняет уже созданные таблицы"""
+    db.create_all()
+    if 'endpoint_id' in add_visit_log_columns():
+        fill_visit_endpoints()
+    # Строки с NULL в ключе страниц (created_at, id) выпадали из выборки и ломали курсор
+    User.query.filter(User.created_at.is_(None)).update({User.created_at: CREATED_AT_UNKNOWN},
+                                                        synchronize_session=False)
+    db.session.commit()
+    for index in (*User.__table__.indexes, *VisitLog.__table__.indexes):
+        index.create(db.engine, checkfirst=True)
+
 if __name__ == '__main__':
-    # Регистрация Blueprint после создания всех объектов
-    from reports import reports_bp
-    app.register_blueprint(reports_bp)
-    
     with app.app_context():
-        db.create_all()
+        upgrade_database()
+        database_upgraded.set()
         
         # Создание ролей по умолчанию
         if not Role.query.first():
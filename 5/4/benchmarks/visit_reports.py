@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Отчеты журнала посещений на сгенерированных данных: время типовых запросов
+(«страницы за последние сутки», маршруты, журнал пользователя) без составных индексов
+и с ними, а также план запроса SQLite
+
+Запуск из каталога лабораторной (база создается во временном каталоге):
+    python -m benchmarks.visit_reports --rows 500000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Приложение читает адрес базы из окружения при импорте
+DATABASE = os.path.join(tempfile.mkdtemp(), 'visits.db')
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + DATABASE
+
+from app import app, db, endpoint_cache, VisitLog
+from visit_partitions import page_count_query, route_count_query, user_count_query
+from reports import ReportFilter, journal_query
+
+INDEXES = ('ix_visit_log_path_created_at', 'ix_visit_log_user_id_created_at', 'ix_visit_log_endpoint_id_created_at')
+# Адрес, шаблон URL и endpoint; адреса пользователей дают сотни путей одного маршрута
+PATHS = [('/', '/', 'index'), ('/login', '/login', 'login'), ('/reports/', '/reports/', 'reports.index'),
+         ('/reports/by_pages', '/reports/by_pages', 'reports.by_pages')] + [
+    (f'/user/{i}', '/user/<int:user_id>', 'view_user') for i in range(1, 200)]
+
+
+def fill(rows, users, days, now, seed=1):
+    rng = random.Random(seed)
+    seconds = days * 24 * 3600
+    paths = [(path, endpoint_cache.get_id(rule, endpoint)) for path, rule, endpoint in PATHS]
+    batch = []
+    for _ in range(rows):
+        path, endpoint_id = rng.choice(paths)
+        batch.append({
+            'path': path,
+            'endpoint_id': endpoint_id,
+            'user_id': rng.randint(1, users) if rng.random() < 0.8 else None,
+            'created_at': now - timedelta(seconds=rng.randrange(seconds)),
+        })
+        if len(batch) == 10000:
+            db.session.execute(db.insert(VisitLog), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(VisitLog), batch)
+    db.session.commit()
+
+
+def plan(query):
+    statement = query.statement.compile(db.engine)
+    params = tuple(statement.params[name] for name in statement.positiontup)
+    return [row[-1] for row in db.session.connection().exec_driver_sql(
+        'EXPLAIN QUERY PLAN ' + str(statement), params)]
+
+
+def measure(make_query, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        make_query().all()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Время запросов отчетов журнала посещений')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=90, help='Глубина журнала в днях')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    now = datetime.utcnow()
+    day_ago = now - timedelta(hours=24)
+    cases = {
+        'страницы за 24 часа': lambda: page_count_query(day_ago),
+        'маршруты за 24 часа': lambda: route_count_query(day_ago),
+        'пользователи за 24 часа': lambda: user_count_query(day_ago),
+        'страницы пользователя': lambda: page_count_query(user_id=7),
+        'журнал за 24 часа, стр. 1': lambda: journal_query(ReportFilter(day_ago)).limit(10),
+        'журнал пользователя, стр. 1': lambda: journal_query(ReportFilter(user_id=7)).limit(10),
+    }
+    with app.app_context():
+        db.create_all()
+        fill(args.rows, args.users, args.days, now)
+        print(f'{args.rows:,} записей за {args.days} дней, база {DATABASE}')
+        for name in INDEXES:
+            db.session.execute(db.text(f'DROP INDEX {name}'))
+        db.session.execute(db.text('ANALYZE'))
+        before = {name: measure(make_query, args.repeat) for name, make_query in cases.items()}
+        for index in VisitLog.__table__.indexes:
+            if index.name in INDEXES:
+                index.create(db.session.connection())
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        for name, make_query in cases.items():
+            after = measure(make_query, args.repeat)
+            print(f'{name:<30} {before[name]:>9.1f} мс -> {after:>7.1f} мс  {"; ".join(plan(make_query()))}')
+
+
+if __name__ == '__main__':
+    main()
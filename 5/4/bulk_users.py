@@ -0,0 +1,205 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+# Столбцы выгрузки; такой файл загружается обратно, если добавить password или password_hash
+EXPORT_FIELDS = ('login', 'surname', 'name', 'patronymic', 'role', 'created_at')
+
+
+def detect_format(filename, default='csv'):
+    return FORMATS.get(os.path.splitext(filename or '')[1].lower(), default)
+
+
+def read_rows(stream, fmt):
+    """Построчно читает CSV или JSON Lines из текстового потока, не загружая файл в память.
+
+    Возвращает пары (номер строки файла, запись); нераспознанная строка JSON
+    возвращается как None, чтобы ошибка попала в отчет с номером строки.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+class ImportReport:
+    """Итоги импорта; ошибки хранятся не больше max_errors, счетчик — для всех строк"""
+
+    def __init__(self, max_errors=1000):
+        self.max_errors = max_errors
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((number, errors))
+
+    def to_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': [{'line': number, 'errors': errors} for number, errors in self.errors],
+        }
+
+
+class UserImporter:
+    """Массовое создание пользователей из CSV или JSON Lines.
+
+    Строки читаются потоком и обрабатываются пакетами по batch_size: пакет
+    проверяется целиком (для каждой строки собираются все ошибки полей),
+    занятые логины ищутся одним запросом на пакет, пароли хешируются в пуле
+    процессов, а пакет вставляется одним executemany в одной транзакции.
+    validate(row) возвращает словарь ошибок по полям, как форма создания.
+    """
+
+    def __init__(self, db, model, validate, hasher, roles, batch_size=1000, max_errors=1000):
+        self.db = db
+        self.model = model
+        self.validate = validate
+        self.hasher = hasher
+        self.role_ids = {role.name: role.id for role in roles}
+        self.batch_size = batch_size
+        self.report = ImportReport(max_errors)
+        # Логины из уже прочитанной части файла: дубликаты внутри файла тоже отсекаются
+        self.seen = set()
+
+    def run(self, rows, progress=None):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return self.report
+            self.import_batch(batch)
+            if progress:
+                progress(self.report)
+
+    def convert(self, row):
+        """Значения столбцов пользователя и пароль для хеширования или словарь ошибок"""
+        if not isinstance(row, dict):
+            return None, None, {'row': 'Строка не является объектом JSON'}
+        row = {key: value.strip() if isinstance(value, str) else value
+               for key, value in row.items() if key}
+        row = {key: value for key, value in row.items() if value not in (None, '')}
+        errors = self.validate(row)
+        role_id = None
+        if 'role_id' in row:
+            try:
+                role_id = int(row['role_id'])
+            except (TypeError, ValueError):
+                role_id = None
+            if role_id not in self.role_ids.values():
+                errors['role_id'] = f"Роль {row['role_id']} не найдена"
+        elif 'role' in row:
+            role_id = self.role_ids.get(row['role'])
+            if role_id is None:
+                errors['role'] = f"Роль «{row['role']}» не найдена"
+        if not errors and row['login'] in self.seen:
+            errors['login'] = 'Логин повторяется в файле'
+        if errors:
+            return None, None, errors
+        values = {
+            'login': row['login'],
+            'password_hash': row.get('password_hash'),
+            'surname': row['surname'],
+            'name': row['name'],
+            'patronymic': row.get('patronymic'),
+            'role_id': role_id,
+        }
+        return values, None if values['password_hash'] else row['password'], {}
+
+    def import_batch(self, batch):
+        candidates = []
+        for number, row in batch:
+            self.report.processed += 1
+            values, password, errors = self.convert(row)
+            if errors:
+                self.report.add_error(number, errors)
+                continue
+            self.seen.add(values['login'])
+            candidates.append((number, values, password))
+        candidates = self.drop_existing(candidates)
+        # Пароли хешируются после проверки: на строки с ошибками хеш не тратится
+        pending = [(values, password) for _, values, password in candidates if password is not None]
+        hashes = self.hasher.generate_many([password for _, password in pending])
+        for (values, _), pwhash in zip(pending, hashes):
+            values['password_hash'] = pwhash
+        self.insert(candidates)
+
+    def drop_existing(self, candidates):
+        """Отбрасывает строки с логинами, которые уже есть в базе (один запрос на пакет)"""
+        if not candidates:
+            return candidates
+        logins = [values['login'] for _, values, _ in candidates]
+        existing = set(self.db.session.scalars(
+            select(self.model.login).where(self.model.login.in_(logins))))
+        # Транзакция чтения не держится открытой, пока считаются хеши
+        self.db.session.rollback()
+        kept = []
+        for candidate in candidates:
+            if candidate[1]['login'] in existing:
+                self.report.add_error(candidate[0], {'login': 'Пользователь с таким логином уже существует'})
+            else:
+                kept.append(candidate)
+        return kept
+
+    def insert(self, candidates):
+        while candidates:
+            try:
+                self.db.session.execute(insert(self.model), [values for _, values, _ in candidates])
+                self.db.session.commit()
+            except IntegrityError:
+                self.db.session.rollback()
+                # Логин заняли между проверкой и вставкой: пакет повторяется без занятых логинов
+                kept = self.drop_existing(candidates)
+                if len(kept) == len(candidates):
+                    raise
+                candidates = kept
+                continue
+            self.report.created += len(candidates)
+            return
+
+
+def export_rows(rows, fmt, chunk_size=1000):
+    """Потоковая выгрузка записей (login, surname, name, patronymic, role, created_at) кусками текста"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, 1):
+        values = dict(zip(EXPORT_FIELDS, row))
+        if isinstance(values['created_at'], datetime):
+            values['created_at'] = values['created_at'].isoformat()
+        if writer:
+            writer.writerow(values[field] for field in EXPORT_FIELDS)
+        else:
+            buffer.write(json.dumps(values, ensure_ascii=False) + '\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -1,72 +1,151 @@
-from flask import Blueprint, render_template, request, jsonify, make_response
-from app import db, User, VisitLog, check_rights
-from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, make_response, abort, flash, g
+from app import db, visit_sketches, User, VisitLog, check_rights
+from visit_partitions import hot_query, page_counts, route_counts, user_counts
+from datetime import datetime, timedelta
 import csv
 import io
 
 reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
+
+class ReportFilter:
+    """Фильтры отчетов: диапазон [start, end) в UTC и пользователь.
+
+    args — параметры запроса для ссылок пагинации и экспорта с теми же фильтрами.
+    """
+
+    def __init__(self, start=None, end=None, user_id=None, args=None, by_user=False):
+        self.start = start
+        self.end = end
+        self.user_id = user_id
+        self.args = args or {}
+        # Поле выбора пользователя показывается только тем, кто видит чужие посещения
+        self.by_user = by_user
+
+    def presets(self, now=None):
+        """Быстрые диапазоны для формы: [(название, параметры запроса)]"""
+        now = (now or datetime.utcnow()).replace(second=0, microsecond=0)
+        user = {'user': self.args['user']} if 'user' in self.args else {}
+        return [(label, dict(user, **{'from': (now - delta).isoformat(timespec='minutes')}))
+                for label, delta in PRESETS]
+
+
+PRESETS = (
+    ('За 24 часа', timedelta(hours=24)),
+    ('За 7 дней', timedelta(days=7)),
+    ('За 30 дней', timedelta(days=30)),
+)
+
+
+def parse_moment(value, end=False):
+    """Дата ГГГГ-ММ-ДД или дата и время; дата в поле «по» включает весь день"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment
+
+
+def report_filter():
+    """Фильтры from, to и user (логин) из запроса; 400 для неверной даты.
+
+    Пользователь без роли администратора видит только свои посещения.
+    """
+    args = {key: request.args[key].strip() for key in ('from', 'to', 'user') if request.args.get(key, '').strip()}
+    try:
+        start = parse_moment(args.get('from'))
+        end = parse_moment(args.get('to'), end=True)
+    except ValueError:
+        abort(400)
+    if g.current_role.name != 'Администратор':
+        args.pop('user', None)
+        return ReportFilter(start, end, g.current_user.id, args)
+    user_id = None
+    if 'user' in args:
+        user_id = db.session.query(User.id).filter_by(login=args['user']).scalar()
+        if user_id is None:
+            flash(f"Пользователь {args['user']} не найден", 'error')
+            # Несуществующий id: отчет пустой, а не за всех пользователей
+            user_id = 0
+    return ReportFilter(start, end, user_id, args, by_user=True)
+
+
+def journal_query(filters):
+    """Записи журнала новыми вперед; сортировку обслуживает индекс по created_at"""
+    return hot_query(db.session.query(VisitLog, User).outerjoin(User, VisitLog.user_id == User.id),
+                     filters.start, filters.end, filters.user_id).order_by(VisitLog.created_at.desc())
+
+
+def page_stats(filters, route=None):
+    """Отчет по страницам: по маршрутам (шаблонам URL) или адреса одного маршрута"""
+    if route is None:
+        return route_counts(filters.start, filters.end, filters.user_id)
+    return page_counts(filters.start, filters.end, filters.user_id, route)
+
+
+def user_stats(start=None, end=None, user_id=None):
+    """Строки отчета по пользователям (фамилия, имя, отчество, посещений) по убыванию посещений.
+
+    Посещения считаются по горячей части журнала и архивным месяцам
+    (visit_partitions), пользователи без посещений тоже попадают в отчет.
+    """
+    counts = user_counts(start, end, user_id)
+    users = db.session.query(User.id, User.surname, User.name, User.patronymic).order_by(User.id)
+    if user_id is not None:
+        users = users.filter(User.id == user_id)
+    stats = [(user.surname, user.name, user.patronymic, counts.get(user.id, 0)) for user in users]
+    stats.sort(key=lambda row: row[3], reverse=True)
+    return stats
+
+
 @reports_bp.route('/')
 @check_rights(['view_own_visits'])
 def index():
     """Главная страница журнала посещений"""
     page = request.args.get('page', 1, type=int)
     per_page = 10
+    filters = report_filter()
     
     # Получаем записи с пагинацией
-    visits = db.session.query(VisitLog, User).outerjoin(User, VisitLog.user_id == User.id)\
-        .order_by(VisitLog.created_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
+    visits = journal_query(filters).paginate(page=page, per_page=per_page, error_out=False)
     
-    return render_template('reports/index.html', visits=visits)
+    return render_template('reports/index.html', visits=visits, filters=filters)
 
 @reports_bp.route('/by_pages')
 @check_rights(['view_own_visits'])
 def by_pages():
     """Отчет по посещениям страниц"""
     # Получаем статистику по страницам
-    stats = db.session.query(
-        VisitLog.path,
-        db.func.count(VisitLog.id).label('count')
-    ).group_by(VisitLog.path)\
-     .order_by(db.func.count(VisitLog.id).desc())\
-     .all()
+    filters = report_filter()
+    route = request.args.get('route') or None
+    stats = page_stats(filters, route)
     
-    return render_template('reports/by_pages.html', stats=stats)
+    return render_template('reports/by_pages.html', stats=stats, filters=filters, route=route)
 
 @reports_bp.route('/by_users')
 @check_rights(['view_own_visits'])
 def by_users():
     """Отчет по посещениям пользователей"""
     # Получаем статистику по пользователям
-    stats = db.session.query(
-        User.surname,
-        User.name,
-        User.patronymic,
-        db.func.count(VisitLog.id).label('count')
-    ).outerjoin(VisitLog, User.id == VisitLog.user_id)\
-     .group_by(User.id, User.surname, User.name, User.patronymic)\
-     .order_by(db.func.count(VisitLog.id).desc())\
-     .all()
+    filters = report_filter()
+    stats = user_stats(filters.start, filters.end, filters.user_id)
     
-    return render_template('reports/by_users.html', stats=stats)
+    return render_template('reports/by_users.html', stats=stats, filters=filters)
 
 @reports_bp.route('/by_pages/export')
 @check_rights(['view_own_visits'])
 def export_by_pages():
     """Экспорт отчета по страницам в CSV"""
     # Получаем статистику по страницам
-    stats = db.session.query(
-        VisitLog.path,
-        db.func.count(VisitLog.id).label('count')
-    ).group_by(VisitLog.path)\
-     .order_by(db.func.count(VisitLog.id).desc())\
-     .all()
+    filters = report_filter()
+    route = request.args.get('route') or None
+    stats = page_stats(filters, route)
     
     # Создаем CSV
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(['№', 'Страница', 'Количество посещений'])
+    writer.writerow(['№', 'Страница' if route else 'Маршрут', 'Количество посещений'])
     
     for i, (path, count) in enumerate(stats, 1):
         writer.writerow([i, path, count])
@@ -84,15 +163,8 @@ def export_by_pages():
 def export_by_users():
     """Экспорт отчета по пользователям в CSV"""
     # Получаем статистику по пользователям
-    stats = db.session.query(
-        User.surname,
-        User.name,
-        User.patronymic,
-        db.func.count(VisitLog.id).label('count')
-    ).outerjoin(VisitLog, User.id == VisitLog.user_id)\
-     .group_by(User.id, User.surname, User.name, User.patronymic)\
-     .order_by(db.func.count(VisitLog.id).desc())\
-     .all()
+    filters = report_filter()
+    stats = user_stats(filters.start, filters.end, filters.user_id)
     
     # Создаем CSV
     output = io.StringIO()
@@ -112,3 +184,10 @@ def export_by_users():
     response.headers['Content-Disposition'] = 'attachment; filename=visits_by_users.csv'
     
     return response
+
+@reports_bp.route('/live')
+@check_rights(['view_all_visits'])
+def live():
+    """Живая статистика по сводкам в памяти: частые страницы сейчас и посетители по дням (JSON)"""
+    limit = min(max(request.args.get('n', 10, type=int), 1), visit_sketches.capacity)
+    return jsonify(visit_sketches.stats(limit))
@@ -1,8 +1,24 @@
 import unittest
 import os
+import io
+import json
 import tempfile
-from app import app, db, User, Role, VisitLog, validate_login, validate_password, validate_name
+import shutil
+
+# Движок базы создается при импорте app, поэтому тестовая база задается до импорта,
+# иначе тесты создают и удаляют таблицы в instance/users.db
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+from app import app, db, database_upgraded, password_hasher, login_throttle, role_cache, endpoint_cache, visit_sketches, user_page, make_user_importer, User, Role, VisitLog, VisitEndpoint, validate_login, validate_password, validate_name
+from unittest.mock import patch
 from werkzeug.security import generate_password_hash
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from bulk_users import read_rows
+from validation import USER_SCHEMA, USER_EDIT_SCHEMA
+from visit_sketches import VisitSketches, HyperLogLog, SpaceSaving
+from visit_rules import VisitRules
+from visit_partitions import archive_old_visits, prune_archive, fill_visit_endpoints, page_counts, route_counts, user_counts, page_count_query, route_count_query, user_count_query
+from reports import ReportFilter, journal_query
 
 class UserManagementTestCase(unittest.TestCase):
     
@@ -12,6 +28,7 @@ class UserManagementTestCase(unittest.TestCase):
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         app.config['TESTING'] = True
         self.app = app.test_client()
+        login_throttle.reset()
         
         with app.app_context():
             db.create_all()
@@ -100,12 +117,126 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertFalse(valid)
         self.assertIn('пустым', error)
     
+    def test_user_schema_collects_all_errors(self):
+        """Тест: схема проверяет всю форму за один проход и возвращает ошибки всех полей"""
+        self.assertEqual(USER_SCHEMA.validate({
+            'login': 'user1', 'password': 'ValidPass123', 'surname': 'Иванов', 'name': 'Иван'
+        }), {})
+        self.assertEqual(USER_SCHEMA.validate({'login': 'ab', 'password': 'Test 123', 'surname': ''}), {
+            'login': 'Логин должен содержать не менее 5 символов',
+            'password': 'Пароль не должен содержать пробелы',
+            'surname': 'Поле Фамилия не может быть пустым',
+            'name': 'Поле Имя не может быть пустым',
+        })
+        # Выражение должно совпадать со всей строкой, включая перевод строки в конце
+        self.assertIn('login', USER_SCHEMA.validate({'login': 'user1\n'}))
+        self.assertEqual(USER_EDIT_SCHEMA.validate({'surname': 'Иванов', 'name': ''}),
+                         {'name': 'Поле Имя не может быть пустым'})
+    
     def test_index_page(self):
         """Тест главной страницы"""
         response = self.app.get('/')
         self.assertEqual(response.status_code, 200)
         self.assertIn('Список пользователей', response.data.decode('utf-8'))
     
+    def add_users(self, count):
+        with app.app_context():
+            role = Role.query.first()
+            started = datetime(2024, 1, 1)
+            for i in range(count):
+                # Одинаковое время у соседних пользователей: порядок задает id
+                db.session.add(User(login=f'user{i:03d}', password_hash='hash', name=f'Имя{i}',
+                                    surname=f'Фамилия{i:03d}', role_id=role.id,
+                                    created_at=started + timedelta(minutes=i // 2)))
+            db.session.commit()
+    
+    def test_index_keyset_pagination(self):
+        """Тест постраничного вывода пользователей по ключу (created_at, id)"""
+        self.add_users(45)
+        with app.app_context():
+            seen = []
+            page = user_page(per_page=20)
+            pages = [page]
+            while page.has_next:
+                after = (page.users[-1].created_at, page.users[-1].id)
+                page = user_page(after=after, per_page=20)
+                pages.append(page)
+            for page in pages:
+                seen.extend(user.id for user in page.users)
+            total = User.query.count()
+            self.assertEqual([len(page.users) for page in pages[:-1]], [20, 20])
+            self.assertEqual(len(seen), total)
+            self.assertEqual(len(set(seen)), total)
+            
+            last = pages[-1].users[0]
+            previous = user_page(before=(last.created_at, last.id), per_page=20)
+            self.assertEqual([u.id for u in previous.users], [u.id for u in pages[1].users])
+            self.assertTrue(previous.has_prev)
+        
+        response = self.app.get('/')
+        self.assertIn('Вперед', response.data.decode('utf-8'))
+        with app.app_context():
+            cursor = user_page(per_page=20).next_cursor
+        response = self.app.get(f'/?after={cursor}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Фамилия020', response.data.decode('utf-8'))
+        self.assertNotIn('Фамилия019', response.data.decode('utf-8'))
+        self.assertEqual(self.app.get('/?after=broken').status_code, 400)
+    
+    def test_startup_upgrade_fills_created_at_and_indexes(self):
+        """Тест: первый запрос обновляет старую базу — NULL в created_at и недостающие индексы"""
+        with app.app_context():
+            User.__table__.drop(db.engine)
+            with db.engine.begin() as connection:
+                # Таблица в том виде, в каком ее создавали прежние версии: без индексов, created_at допускает NULL
+                connection.exec_driver_sql(
+                    'CREATE TABLE user (id INTEGER PRIMARY KEY, login VARCHAR(50) NOT NULL UNIQUE, '
+                    'password_hash VARCHAR(255) NOT NULL, surname VARCHAR(50), name VARCHAR(50) NOT NULL, '
+                    'patronymic VARCHAR(50), role_id INTEGER REFERENCES role (id), created_at DATETIME)')
+                connection.exec_driver_sql(
+                    "INSERT INTO user (login, password_hash, name, surname, role_id, created_at) VALUES "
+                    "('old1', 'hash', 'Старый', 'Первый', 1, NULL), ('old2', 'hash', 'Старый', 'Второй', 1, NULL)")
+        database_upgraded.clear()
+        
+        response = self.app.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Первый', response.data.decode('utf-8'))
+        with app.app_context():
+            self.assertEqual(User.query.filter(User.created_at.is_(None)).count(), 0)
+            indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('user')}
+            self.assertLessEqual({'ix_user_created_at_id', 'ix_user_login'}, indexes)
+            cursor = user_page(per_page=1).next_cursor
+        self.assertEqual(self.app.get(f'/?after={cursor}').status_code, 200)
+    
+    def test_index_single_query_with_roles(self):
+        """Тест: страница пользователей с ролями загружается одним запросом"""
+        self.add_users(30)
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                page = user_page(per_page=20)
+                roles = [user.role_name for user in page.users]
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual(len(statements), 1)
+            self.assertEqual(set(roles), {'Администратор'})
+            self.assertNotIsInstance(page.users[0], User)
+            self.assertIsInstance(user_page(per_page=20, projection=False).users[0], User)
+    
+    def test_index_search(self):
+        """Тест поиска пользователей по началу фамилии, имени или логина"""
+        self.add_users(30)
+        response = self.app.get('/?q=Фамилия01')
+        html = response.data.decode('utf-8')
+        self.assertIn('Фамилия010', html)
+        self.assertNotIn('Фамилия020', html)
+        with app.app_context():
+            self.assertEqual(len(user_page(search='user02').users), 10)
+            self.assertEqual(len(user_page(search='test').users), 1)
+            self.assertEqual(user_page(search='%').users, [])
+    
     def test_login_page(self):
         """Тест страницы входа"""
         response = self.app.get('/login')
@@ -138,6 +269,79 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Неверный логин или пароль', response.data.decode('utf-8'))
     
+    def test_login_upgrades_outdated_hash(self):
+        """Тест пересчета хеша со старыми параметрами при входе"""
+        with app.app_context():
+            user = User.query.filter_by(login='testuser').first()
+            user.password_hash = generate_password_hash('testpassword', 'pbkdf2:sha256:1000')
+            db.session.commit()
+        
+        response = self.app.post('/login', data={
+            'login': 'testuser',
+            'password': 'testpassword'
+        })
+        self.assertEqual(response.status_code, 302)
+        
+        with app.app_context():
+            user = User.query.filter_by(login='testuser').first()
+            self.assertFalse(password_hasher.needs_rehash(user.password_hash))
+            self.assertTrue(password_hasher.check(user.password_hash, 'testpassword'))
+    
+    def test_login_rejected_when_hasher_busy(self):
+        """Тест ответа 503 при заполненной очереди хеширования"""
+        with patch.object(password_hasher, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = self.app.post('/login', data={
+                'login': 'testuser',
+                'password': 'testpassword'
+            })
+        self.assertEqual(response.status_code, 503)
+    
+    def test_login_throttled(self):
+        """Тест ответа 429 после исчерпания попыток входа без проверки пароля"""
+        for _ in range(app.config['LOGIN_THROTTLE_LOGIN_BURST']):
+            response = self.app.post('/login', data={
+                'login': 'testuser',
+                'password': 'wrongpassword'
+            })
+            self.assertEqual(response.status_code, 200)
+        
+        with patch.object(password_hasher, 'verify') as verify:
+            response = self.app.post('/login', data={
+                'login': 'testuser',
+                'password': 'testpassword'
+            })
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        verify.assert_not_called()
+        
+        stats = self.app.get('/login-throttle-stats').get_json()
+        self.assertEqual(stats['throttled_login'], 1)
+        response = self.app.get('/login-throttle-stats', environ_base={'REMOTE_ADDR': '203.0.113.5'})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_session_stored_on_server(self):
+        """Тест серверной сессии: в cookie только идентификатор, выход удаляет запись"""
+        with app.app_context():
+            user = User.query.filter_by(login='testuser').first()
+            user.password_hash = generate_password_hash('testpassword')
+            db.session.commit()
+        
+        # Идентификатор, полученный до входа, после входа недействителен
+        self.app.get('/login')
+        with self.app.session_transaction() as sess:
+            sess['before_login'] = True
+        before = self.app.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.app.post('/login', data={'login': 'testuser', 'password': 'testpassword'})
+        sid = self.app.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+        self.assertNotIn('testuser', sid)
+        self.assertNotEqual(before, sid)
+        self.assertIsNone(app.session_interface.store.load(before))
+        self.assertEqual(app.session_interface.store.load(sid)['user_login'], 'testuser')
+        
+        self.app.get('/logout')
+        self.assertIsNone(app.session_interface.store.load(sid))
+    
     def test_logout(self):
         """Тест выхода из системы"""
         # Сначала входим в систему
@@ -189,6 +393,27 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Создание пользователя', response.data.decode('utf-8'))
     
+    def test_create_user_rejected_when_hasher_busy(self):
+        """Тест ответа 503 при создании пользователя с заполненной очередью хеширования"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        with patch.object(password_hasher, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = self.app.post('/user/create', data={
+                'login': 'newuser',
+                'password': 'NewPass123',
+                'surname': 'Новый',
+                'name': 'Пользователь',
+                'patronymic': 'Тестовый',
+                'role_id': '1'
+            })
+        self.assertEqual(response.status_code, 503)
+        
+        with app.app_context():
+            self.assertIsNone(User.query.filter_by(login='newuser').first())
+    
     def test_create_user_success(self):
         """Тест успешного создания пользователя"""
         with self.app.session_transaction() as sess:
@@ -232,6 +457,80 @@ class UserManagementTestCase(unittest.TestCase):
         if response.status_code == 200:
             self.assertIn('is-invalid', response.data.decode('utf-8'))
     
+    def count_statements(self, request):
+        """SQL-запросы, выполненные за время запроса к приложению"""
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                response = request()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        return response, statements
+    
+    def test_create_user_query_count(self):
+        """Тест: роли берутся из кеша, а создание пользователя — один INSERT без проверочного SELECT"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        self.app.get('/user/create')
+        
+        # Запись в журнал посещений и пользователь для проверки прав
+        response, statements = self.count_statements(lambda: self.app.get('/user/create'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(statements), 2)
+        self.assertFalse([s for s in statements if 'FROM role' in s])
+        
+        response, statements = self.count_statements(lambda: self.app.post('/user/create', data={
+            'login': 'newuser',
+            'password': 'NewPass123',
+            'surname': 'Новый',
+            'name': 'Пользователь',
+            'patronymic': '',
+            'role_id': '2'
+        }))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[-1].startswith('INSERT INTO user'))
+        self.assertFalse([s for s in statements if 'FROM role' in s])
+    
+    def test_create_user_duplicate_login(self):
+        """Тест: повторный логин отклоняется по ограничению уникальности в БД"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        response = self.app.post('/user/create', data={
+            'login': 'testuser',
+            'password': 'NewPass123',
+            'surname': 'Новый',
+            'name': 'Пользователь',
+            'patronymic': '',
+            'role_id': '1'
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Пользователь с таким логином уже существует', response.data.decode('utf-8'))
+        with app.app_context():
+            self.assertEqual(User.query.filter_by(login='testuser').count(), 1)
+    
+    def test_role_cache_invalidated_on_change(self):
+        """Тест: кеш ролей сбрасывается после фиксации изменения ролей"""
+        with app.app_context():
+            self.assertEqual([role.name for role in role_cache.all()], ['Администратор', 'Пользователь'])
+            role = db.session.get(Role, 2)
+            role.name = 'Читатель'
+            db.session.add(Role(name='Модератор'))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(role_cache.get(2).name, 'Пользователь')
+            
+            db.session.get(Role, 2).name = 'Читатель'
+            db.session.commit()
+            self.assertEqual(role_cache.get(2).name, 'Читатель')
+            self.assertIsNone(role_cache.get(3))
+    
     def test_edit_user_requires_auth(self):
         """Тест, что редактирование требует аутентификации"""
         response = self.app.get('/user/1/edit', follow_redirects=True)
@@ -293,6 +592,71 @@ class UserManagementTestCase(unittest.TestCase):
             user = User.query.get(user_id)
             self.assertIsNone(user)
     
+    def test_import_users_csv(self):
+        """Тест импорта пользователей из CSV с отчетом об ошибках по строкам"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        data = ('login,password,surname,name,patronymic,role\n'
+                'importuser1,NewPass123,Первый,Иван,,Пользователь\n'
+                'importuser2,NewPass123,Второй,Петр,Петрович,\n'
+                'ab,123,,Имя,,Гость\n'
+                'testuser,NewPass123,Фамилия,Имя,,\n'
+                'importuser1,NewPass123,Повтор,Иван,,\n')
+        response = self.app.post('/users/import', data={
+            'file': (io.BytesIO(data.encode('utf-8-sig')), 'users.csv')
+        }, content_type='multipart/form-data')
+        
+        html = response.data.decode('utf-8')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('создано пользователей: 2', html)
+        self.assertIn('Логин должен содержать не менее 5 символов', html)
+        self.assertIn('Роль «Гость» не найдена', html)
+        self.assertIn('Пользователь с таким логином уже существует', html)
+        self.assertIn('Логин повторяется в файле', html)
+        with app.app_context():
+            user = User.query.filter_by(login='importuser1').first()
+            self.assertEqual(user.role.name, 'Пользователь')
+            self.assertTrue(password_hasher.check(user.password_hash, 'NewPass123'))
+            self.assertIsNone(User.query.filter_by(login='importuser2').first().role_id)
+    
+    def test_import_users_in_batches(self):
+        """Тест: каждый пакет импорта вставляется одним executemany"""
+        lines = [json.dumps({'login': f'batchuser{i}', 'password_hash': 'pbkdf2:sha256:1$salt$hash',
+                             'surname': 'Фамилия', 'name': 'Имя', 'role_id': 2})
+                 for i in range(5)]
+        with app.app_context():
+            importer = make_user_importer(batch_size=2)
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                report = importer.run(read_rows(io.StringIO('\n'.join(lines)), 'jsonl'))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual((report.processed, report.created, report.failed), (5, 5, 0))
+            self.assertEqual(len([s for s in statements if s.startswith('INSERT INTO user')]), 3)
+            self.assertEqual(User.query.filter(User.login.like('batchuser%')).count(), 5)
+    
+    def test_export_users(self):
+        """Тест потоковой выгрузки пользователей в CSV и JSON Lines"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        response = self.app.get('/users/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'login,surname,name,patronymic,role,created_at')
+        self.assertIn('testuser,Пользователь,Тест,,Администратор,', response.data.decode('utf-8'))
+        
+        response = self.app.get('/users/export?format=jsonl')
+        rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertIn({'login': 'testuser', 'role': 'Администратор'},
+                      [{'login': row['login'], 'role': row['role']} for row in rows])
+    
     def test_change_password_requires_auth(self):
         """Тест, что смена пароля требует аутентификации"""
         response = self.app.get('/change_password', follow_redirects=True)
@@ -423,6 +787,335 @@ class UserManagementTestCase(unittest.TestCase):
         self.assertEqual(response.headers['Content-Type'], 'text/csv; charset=utf-8')
         self.assertIn('attachment', response.headers['Content-Disposition'])
     
+    def add_monthly_visits(self):
+        """Посещения за январь, февраль и март 2024 года; возвращает их число по страницам"""
+        visits = [
+            ('/page1', 1, datetime(2024, 1, 5)), ('/page1', None, datetime(2024, 1, 20)),
+            ('/page2', 1, datetime(2024, 2, 10)), ('/page1', 1, datetime(2024, 2, 25)),
+            ('/page2', None, datetime(2024, 3, 1)), ('/page1', 1, datetime(2024, 3, 15)),
+        ]
+        with app.app_context():
+            db.session.add_all(VisitLog(path=path, user_id=user_id, created_at=created_at)
+                               for path, user_id, created_at in visits)
+            db.session.commit()
+        return {'/page1': 4, '/page2': 2}
+    
+    def archive_to_tempdir(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        self.addCleanup(app.config.pop, 'VISIT_LOG_ARCHIVE_DIR', None)
+        app.config['VISIT_LOG_ARCHIVE_DIR'] = archive_dir
+        return archive_dir
+    
+    def test_visit_archive_moves_old_months(self):
+        """Тест: старые месяцы переносятся в сжатые сегменты, отчеты учитывают их прозрачно"""
+        expected = self.add_monthly_visits()
+        archive_dir = self.archive_to_tempdir()
+        with app.app_context():
+            moved = archive_old_visits(hot_months=1, now=datetime(2024, 3, 20))
+            self.assertEqual(moved, {'2024-01': 2, '2024-02': 2})
+            self.assertEqual([name[:14] for name in sorted(os.listdir(archive_dir))],
+                             ['visits-2024-01', 'visits-2024-02'])
+            self.assertEqual(VisitLog.query.count(), 2)
+            
+            self.assertEqual(dict(page_counts()), expected)
+            self.assertEqual(user_counts(), {1: 4, None: 2})
+            # Февраль целиком из итогов, январь частично — из файла сегмента
+            self.assertEqual(dict(page_counts(datetime(2024, 1, 10), datetime(2024, 3, 1))),
+                             {'/page1': 2, '/page2': 1})
+            self.assertEqual(dict(page_counts(datetime(2024, 3, 1))), {'/page1': 1, '/page2': 1})
+            
+            # Запоздавшая запись архивного месяца дописывается к сегменту
+            db.session.add(VisitLog(path='/page3', created_at=datetime(2024, 1, 31)))
+            db.session.commit()
+            # Пока новое поколение сегмента не зафиксировано в базе, отчеты читают прежнее
+            with patch.object(db.session, 'commit', side_effect=OSError('disk full')):
+                with self.assertRaises(OSError):
+                    archive_old_visits(hot_months=1, now=datetime(2024, 3, 20))
+            self.assertEqual(len(os.listdir(archive_dir)), 2)
+            self.assertEqual(dict(page_counts(end=datetime(2024, 2, 1))), {'/page1': 2, '/page3': 1})
+            self.assertEqual(archive_old_visits(hot_months=1, now=datetime(2024, 3, 20)), {'2024-01': 1})
+            self.assertEqual(dict(page_counts(end=datetime(2024, 2, 1))), {'/page1': 2, '/page3': 1})
+            self.assertEqual(len(os.listdir(archive_dir)), 2)
+        
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        response = self.app.get('/reports/by_pages/export')
+        self.assertIn('/page1,4', response.data.decode('utf-8'))
+    
+    def test_visit_archive_prune(self):
+        """Тест: сегменты старше срока хранения удаляются вместе с итогами"""
+        self.add_monthly_visits()
+        archive_dir = self.archive_to_tempdir()
+        with app.app_context():
+            archive_old_visits(hot_months=1, now=datetime(2024, 3, 20))
+            self.assertEqual(prune_archive(archive_months=2, now=datetime(2024, 3, 20)), ['2024-01'])
+            self.assertEqual([name[:14] for name in os.listdir(archive_dir)], ['visits-2024-02'])
+            self.assertEqual(dict(page_counts()), {'/page1': 2, '/page2': 2})
+            self.assertEqual(prune_archive(archive_months=0), [])
+    
+    def test_visits_cli(self):
+        """Тест команд обслуживания журнала"""
+        self.add_monthly_visits()
+        self.archive_to_tempdir()
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['visits', 'archive', '--hot-months', '1'])
+        self.assertIn('2024-01: перенесено 2 записей', result.output)
+        result = runner.invoke(args=['visits', 'status'])
+        self.assertIn('2024-02: 2 записей', result.output)
+        result = runner.invoke(args=['visits', 'compact'])
+        self.assertEqual(result.exit_code, 0, result.output)
+    
+    def add_user_visits(self):
+        """Посещения администратора (id 1) и обычного пользователя за 1–3 марта 2024 года"""
+        with app.app_context():
+            user = User(login='reader', password_hash='hash', name='Читатель', role_id=2)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add_all([
+                VisitLog(path='/page1', user_id=1, created_at=datetime(2024, 3, 1, 10)),
+                VisitLog(path='/page1', user_id=user.id, created_at=datetime(2024, 3, 2, 10)),
+                VisitLog(path='/page2', user_id=user.id, created_at=datetime(2024, 3, 2, 23)),
+                VisitLog(path='/page2', user_id=None, created_at=datetime(2024, 3, 3, 10)),
+            ])
+            db.session.commit()
+            return user.id
+    
+    def test_reports_filters(self):
+        """Тест фильтров отчетов по диапазону дат и пользователю, экспорт с теми же фильтрами"""
+        self.add_user_visits()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        
+        data = self.app.get('/reports/by_pages/export?from=2024-03-02&to=2024-03-02').data.decode('utf-8')
+        self.assertIn('/page1,1', data)
+        self.assertIn('/page2,1', data)
+        data = self.app.get('/reports/by_pages/export?from=2024-03-01&to=2024-03-03&user=reader').data.decode('utf-8')
+        self.assertEqual(data.splitlines()[1:], ['1,/page1,1', '2,/page2,1'])
+        data = self.app.get('/reports/by_users/export?to=2024-03-01T12:00&user=testuser').data.decode('utf-8')
+        self.assertEqual(data.splitlines()[1:], ['1,Пользователь Тест,1'])
+        
+        response = self.app.get('/reports/?from=2024-03-02T12:00&to=2024-03-03')
+        html = response.data.decode('utf-8')
+        self.assertIn('02.03.2024 23:00:00', html)
+        self.assertNotIn('02.03.2024 10:00:00', html)
+        self.assertIn('/reports/by_pages?from=2024-03-02T12:00', html)
+        
+        self.assertEqual(self.app.get('/reports/by_pages?from=вчера').status_code, 400)
+        data = self.app.get('/reports/by_pages/export?user=nobody').data.decode('utf-8')
+        self.assertEqual(data.splitlines()[1:], [])
+    
+    def test_reports_show_only_own_visits(self):
+        """Тест: пользователь без роли администратора видит в отчетах только свои посещения"""
+        user_id = self.add_user_visits()
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['user_login'] = 'reader'
+        
+        data = self.app.get('/reports/by_pages/export?to=2024-03-03&user=testuser').data.decode('utf-8')
+        self.assertEqual(data.splitlines()[1:], ['1,/page1,1', '2,/page2,1'])
+        data = self.app.get('/reports/by_users/export').data.decode('utf-8')
+        self.assertEqual(len(data.splitlines()), 2)
+        self.assertIn('Читатель', data)
+        html = self.app.get('/reports/?to=2024-03-03').data.decode('utf-8')
+        self.assertNotIn('01.03.2024', html)
+        self.assertNotIn('name="user"', html)
+    
+    def query_plan(self, query):
+        """План SQLite для запроса SQLAlchemy: строки EXPLAIN QUERY PLAN"""
+        statement = query.statement.compile(db.engine)
+        params = tuple(statement.params[name] for name in statement.positiontup)
+        return [row[-1] for row in db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + str(statement), params)]
+    
+    def test_report_query_plans_use_indexes(self):
+        """Тест: запросы отчетов с фильтрами читают индексы, а не всю таблицу visit_log"""
+        start = datetime(2024, 3, 1)
+        with app.app_context():
+            cases = [
+                (page_count_query(start), 'ix_visit_log_path_created_at'),
+                (page_count_query(start, user_id=1), 'ix_visit_log_user_id_created_at'),
+                (user_count_query(start), 'ix_visit_log_user_id_created_at'),
+                (route_count_query(start), 'ix_visit_log_endpoint_id_created_at'),
+                (journal_query(ReportFilter(start)), 'ix_visit_log_created_at'),
+                (journal_query(ReportFilter()), 'ix_visit_log_created_at'),
+                (journal_query(ReportFilter(start, user_id=1)), 'ix_visit_log_user_id_created_at'),
+            ]
+            for query, index in cases:
+                plan = ' '.join(self.query_plan(query))
+                self.assertIn(index, plan)
+                self.assertNotRegex(plan, r'SCAN visit_log(?! USING)')
+    
+    def test_reports_group_by_route(self):
+        """Тест: журнал хранит маршрут посещения, отчет по страницам группирует по шаблону URL"""
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        for path in ('/user/1', '/user/1', '/user/2'):
+            self.app.get(path)
+        with app.app_context():
+            visits = VisitLog.query.filter(VisitLog.path.like('/user/%')).all()
+            self.assertEqual({visit.endpoint.rule for visit in visits}, {'/user/<int:user_id>'})
+            self.assertEqual(VisitEndpoint.query.filter_by(endpoint='view_user').count(), 1)
+        
+        data = self.app.get('/reports/by_pages/export').data.decode('utf-8')
+        self.assertIn('Маршрут', data.splitlines()[0])
+        self.assertIn('1,/user/<int:user_id>,3', data.splitlines())
+        self.assertNotIn('/user/1,', data)
+        data = self.app.get('/reports/by_pages/export?route=/user/<int:user_id>').data.decode('utf-8')
+        self.assertEqual(data.splitlines()[1:], ['1,/user/1,2', '2,/user/2,1'])
+        html = self.app.get('/reports/by_pages').data.decode('utf-8')
+        self.assertIn('/reports/by_pages?route=/user/%3Cint:user_id%3E', html)
+    
+    def test_visit_routes_in_archive_and_backfill(self):
+        """Тест: маршруты сохраняются в архивных сегментах, старые записи получают маршрут по пути"""
+        self.add_monthly_visits()
+        self.archive_to_tempdir()
+        with app.app_context():
+            endpoint_id = endpoint_cache.get_id('/user/<int:user_id>', 'view_user')
+            db.session.add_all([
+                VisitLog(path='/user/1', user_id=1, endpoint_id=endpoint_id, created_at=datetime(2024, 1, 10)),
+                VisitLog(path='/user/2', endpoint_id=endpoint_id, created_at=datetime(2024, 3, 10)),
+                VisitLog(path='/user/3', created_at=datetime(2024, 3, 11)),
+            ])
+            db.session.commit()
+            self.assertEqual(fill_visit_endpoints(), 1)
+            self.assertEqual(VisitLog.query.filter_by(path='/user/3').one().endpoint_id, endpoint_id)
+            
+            archive_old_visits(hot_months=1, now=datetime(2024, 3, 20))
+            self.assertEqual(dict(route_counts()), {'/page1': 4, '/page2': 2, '/user/<int:user_id>': 3})
+            self.assertEqual(dict(route_counts(datetime(2024, 1, 6), user_id=1)),
+                             {'/page1': 2, '/page2': 1, '/user/<int:user_id>': 1})
+            self.assertEqual(dict(page_counts(route='/user/<int:user_id>')),
+                             {'/user/1': 1, '/user/2': 1, '/user/3': 1})
+            self.assertEqual(dict(page_counts(route='/page2')), {'/page2': 2})
+    
+    def test_live_stats(self):
+        """Тест: живая статистика считается по сводкам в памяти и доступна администратору в JSON"""
+        visit_sketches.reset()
+        self.addCleanup(visit_sketches.reset)
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        for path in ('/user/1', '/user/1', '/user/2', '/user/1'):
+            self.app.get(path)
+        
+        response, statements = self.count_statements(lambda: self.app.get('/reports/live?n=2'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([s for s in statements if 'FROM visit_log' in s])
+        stats = response.get_json()
+        self.assertEqual(stats['now']['top_pages'], [{'path': '/user/1', 'count': 3, 'error': 0},
+                                                     {'path': '/user/2', 'count': 1, 'error': 0}])
+        today = stats['days'][0]
+        # Сам /reports/live в журнал и сводки не попадает (VISIT_LOG_EXCLUDE)
+        self.assertEqual(today['visits'], 4)
+        self.assertEqual(today['unique_visitors'], 1)
+        self.assertIn({'route': '/user/<int:user_id>', 'unique_visitors': 1}, today['routes'])
+        
+        with app.app_context():
+            user = User(login='reader', password_hash='hash', name='Читатель', role_id=2)
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = user_id
+        # view_all_visits есть только у администратора, у пользователя — только свои посещения
+        self.assertEqual(self.app.get('/reports/live').status_code, 302)
+        self.assertEqual(self.app.get('/reports/').status_code, 200)
+    
+    def test_visit_sketches_error_bounds_and_snapshot(self):
+        """Тест: оценки сводок укладываются в заявленные ошибки и переживают перезапуск через снимок"""
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        sketches = VisitSketches(capacity=20, snapshot_path=os.path.join(snapshot_dir, 'sketches.json'),
+                                 snapshot_interval=0)
+        now = datetime(2024, 3, 1, 12).timestamp()
+        paths = [f'/user/{i % 7 if i % 3 else i}' for i in range(3000)]
+        for i, path in enumerate(paths):
+            sketches.record(path, '/user/<int:user_id>', f'user:{i % 2000}', now + i * 0.1)
+        
+        window, top = sketches.top_now(5, now + 300)
+        exact = {path: paths.count(path) for path in set(paths)}
+        for path, count, error in top:
+            self.assertLessEqual(error, window.total / window.capacity)
+            self.assertTrue(count - error <= exact[path] <= count)
+        self.assertTrue({path for path, count in exact.items() if count > window.total / window.capacity}
+                        <= set(window.counts))
+        stats = sketches.stats(now=now + 300)
+        self.assertLess(abs(stats['days'][0]['unique_visitors'] - 2000), 2000 * 4 * HyperLogLog.error(12))
+        
+        sketches.snapshot()
+        restored = VisitSketches(capacity=20, snapshot_path=sketches.snapshot_path, snapshot_interval=0)
+        self.assertTrue(restored.load())
+        self.assertEqual(restored.stats(now=now + 300), stats)
+        other = VisitSketches(capacity=50, snapshot_path=sketches.snapshot_path)
+        self.assertFalse(other.load())
+        
+        # Снимок работающего процесса не забирается, но входит в статистику; снимок остановленного забирается
+        peer_path = restored._process_path(os.getppid())
+        os.replace(restored._process_path(os.getpid()), peer_path)
+        worker = VisitSketches(capacity=20, snapshot_path=sketches.snapshot_path, snapshot_interval=0)
+        self.assertFalse(worker.load())
+        worker.record('/about', '/about', 'user:new', now + 300)
+        today = worker.stats(now=now + 300)['days'][0]
+        self.assertEqual(today['visits'], len(paths) + 1)
+        os.replace(peer_path, restored._process_path(2 ** 22 + 1))
+        self.assertTrue(worker.load())
+        self.assertEqual(os.listdir(snapshot_dir), [os.path.basename(worker._process_path(os.getpid()))])
+        self.assertEqual(worker.stats(now=now + 300)['days'][0]['visits'], len(paths) + 1)
+        
+        merged = SpaceSaving.merge([window, window], 20)
+        self.assertEqual(merged.total, 2 * window.total)
+    
+    def test_visit_rules(self):
+        """Тест правил журнала: исключения, include, доля выборки по шаблонам и роботы"""
+        rules = VisitRules(include=('*',), exclude=('static', 'reports.*'),
+                           sample_rates={'POST login': 0.1, 'view_*': 0.5})
+        self.assertEqual(rules.rate('GET', 'static'), 0)
+        self.assertEqual(rules.rate('GET', 'reports.by_pages'), 0)
+        self.assertEqual(rules.rate('POST', 'login'), 0.1)
+        self.assertEqual(rules.rate('GET', 'login'), 1)
+        self.assertEqual(rules.rate('GET', 'view_user'), 0.5)
+        self.assertEqual(rules.rate('GET', 'index', 'Mozilla/5.0 (compatible; Googlebot/2.1)'), 0)
+        self.assertEqual(rules.rate('GET', 'index', 'Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0'), 1)
+        self.assertEqual(VisitRules(include=('reports.*',)).rate('GET', 'index'), 0)
+        self.assertEqual(VisitRules(skip_bots=False).rate('GET', 'index', 'curl/8.0'), 1)
+    
+    def test_default_visit_rules(self):
+        """Тест: приложение с настройками по умолчанию не пишет отчеты и служебные адреса, а вход — выборочно"""
+        self.assertEqual(app.config['VISIT_LOG_SAMPLE_RATES'], {'POST login': 0.1})
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        for path in ('/reports/', '/reports/by_pages', '/reports/by_users/export', '/reports/live',
+                     '/login-throttle-stats'):
+            self.app.get(path)
+        with patch('app.random.random', side_effect=[0.05, 0.5]):
+            for _ in range(2):
+                self.app.post('/login', data={'login': 'nobody', 'password': 'wrong'})
+        self.app.get('/user/1')
+        with app.app_context():
+            rows = [(row.path, row.weight) for row in VisitLog.query.order_by(VisitLog.id)]
+        self.assertEqual(rows, [('/login', 10.0), ('/user/1', 1.0)])
+    
+    def test_visit_sampling_weights(self):
+        """Тест: выборка записывает часть посещений с весом, отчеты масштабируют счетчики обратно"""
+        rules = VisitRules(exclude=('static', 'reports.*'), sample_rates={'view_user': 0.25})
+        with self.app.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_login'] = 'testuser'
+        with patch('app.visit_rules', rules), patch('app.random.random', side_effect=[0.1, 0.9, 0.9, 0.9, 0.2]):
+            for _ in range(5):
+                self.app.get('/user/1')
+            self.app.get('/', headers={'User-Agent': 'Googlebot/2.1'})
+            data = self.app.get('/reports/by_pages/export?route=/user/<int:user_id>').data.decode('utf-8')
+        self.assertEqual(data.splitlines()[1:], ['1,/user/1,8'])
+        with app.app_context():
+            self.assertEqual([visit.weight for visit in VisitLog.query], [4.0, 4.0])
+            self.assertEqual(user_counts(), {1: 8})
+    
     def test_user_cannot_edit_other_users(self):
         """Тест, что обычный пользователь не может редактировать других пользователей"""
         # Создаем второго пользователя
@@ -0,0 +1,413 @@
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_
+from werkzeug.exceptions import HTTPException, MethodNotAllowed
+
+from app import (db, endpoint_cache, VisitLog, VisitEndpoint, VisitArchive, VisitArchivePage, VisitArchiveRoute,
+                 VisitArchiveUser)
+
+# Журнал посещений разбит по месяцам: последние VISIT_LOG_HOT_MONTHS месяцев
+# лежат в таблице visit_log (горячая часть), более старые — в сжатых файлах
+# JSON Lines по одному на месяц. Для архивного месяца в базе остаются итоги по
+# маршрутам, страницам и пользователям, поэтому отчеты за полные месяцы не
+# читают файлы. Все даты — в UTC, как VisitLog.created_at; диапазон [start, end).
+# Маршрут — шаблон URL (/user/<int:user_id>); у записей без маршрута им служит path.
+# Запись журнала весит 1 / долю выборки (visit_rules), поэтому посещения — сумма весов.
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(moment, months):
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def month_key(moment):
+    return moment.strftime('%Y-%m')
+
+
+def month_range(key):
+    start = datetime.strptime(key, '%Y-%m')
+    return start, add_months(start, 1)
+
+
+def archive_dir():
+    return current_app.config.get('VISIT_LOG_ARCHIVE_DIR') or os.path.join(current_app.instance_path,
+                                                                          'visit_archive')
+
+
+def segment_path(archive):
+    return os.path.join(archive_dir(), archive.file_name)
+
+
+def overlaps(key, start, end):
+    month_from, month_to = month_range(key)
+    return (start is None or month_to > start) and (end is None or month_from < end)
+
+
+def covers(key, start, end):
+    month_from, month_to = month_range(key)
+    return (start is None or start <= month_from) and (end is None or month_to <= end)
+
+
+def read_segment(archive):
+    """Записи архивного сегмента: словари id, path, route, user_id, weight, created_at (строка ISO)"""
+    with gzip.open(segment_path(archive), 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def segment_rows(archive, start, end, user_id=None):
+    # Даты в файле записаны isoformat(), поэтому сравниваются как строки без разбора
+    low = start.isoformat() if start else ''
+    high = end.isoformat() if end else None
+    for row in read_segment(archive):
+        if (low <= row['created_at'] and (high is None or row['created_at'] < high)
+                and (user_id is None or row['user_id'] == user_id)):
+            yield row
+
+
+def route_key(row):
+    # В сегментах, записанных до появления маршрутов, поля route нет
+    return row.get('route') or row['path']
+
+
+def add_rows(counts, rows, key):
+    # В сегментах, записанных до выборки, поля weight нет: каждая запись — одно посещение
+    for row in rows:
+        counts[key(row)] += row.get('weight', 1)
+
+
+def rounded(counts):
+    """Суммы весов — дробные при долях вроде 0.3; в отчетах посещения целые"""
+    return Counter({key: round(count) for key, count in counts.items()})
+
+
+def archived_segments(start=None, end=None):
+    """Архивные месяцы, пересекающиеся с диапазоном"""
+    return [archive for archive in VisitArchive.query.order_by(VisitArchive.month)
+            if overlaps(archive.month, start, end)]
+
+
+def hot_query(query, start=None, end=None, user_id=None):
+    """Фильтры горячей части; им соответствуют индексы (created_at) и (user_id, created_at)"""
+    if user_id is not None:
+        query = query.filter(VisitLog.user_id == user_id)
+    if start is not None:
+        query = query.filter(VisitLog.created_at >= start)
+    if end is not None:
+        query = query.filter(VisitLog.created_at < end)
+    return query
+
+
+def endpoint_rules():
+    """Шаблоны URL маршрутов: {VisitEndpoint.id: rule}; таблица маленькая и читается целиком"""
+    return dict(db.session.query(VisitEndpoint.id, VisitEndpoint.rule))
+
+
+def route_filter(query, route):
+    """Записи маршрута: по идентификаторам endpoint, а записи без маршрута — по совпадению path"""
+    endpoint_ids = [endpoint_id for endpoint_id, rule in endpoint_rules().items() if rule == route]
+    return query.filter(or_(VisitLog.endpoint_id.in_(endpoint_ids),
+                            and_(VisitLog.endpoint_id.is_(None), VisitLog.path == route)))
+
+
+VISITS = db.func.sum(VisitLog.weight)
+
+
+def page_count_query(start=None, end=None, user_id=None, route=None):
+    query = hot_query(db.session.query(VisitLog.path, VISITS), start, end, user_id)
+    if route is not None:
+        query = route_filter(query, route)
+    return query.group_by(VisitLog.path)
+
+
+def route_count_query(start=None, end=None, user_id=None):
+    # Группировка по целому endpoint_id: групп столько, сколько маршрутов, а не адресов
+    return hot_query(db.session.query(VisitLog.endpoint_id, VISITS),
+                     start, end, user_id).group_by(VisitLog.endpoint_id)
+
+
+def user_count_query(start=None, end=None, user_id=None):
+    return hot_query(db.session.query(VisitLog.user_id, VISITS),
+                     start, end, user_id).group_by(VisitLog.user_id)
+
+
+def page_counts(start=None, end=None, user_id=None, route=None):
+    """Посещения страниц за диапазон: [(path, count)] по убыванию count.
+
+    Горячая часть считается запросом к visit_log, полные архивные месяцы —
+    по сохраненным итогам, частично попавшие в диапазон — чтением сегмента.
+    Итоги по страницам не разбиты по пользователям и маршрутам, поэтому с
+    фильтром user_id или route архивные месяцы читаются из сегментов.
+    """
+    counts = Counter(dict(page_count_query(start, end, user_id, route)))
+    for archive in archived_segments(start, end):
+        if user_id is None and route is None and covers(archive.month, start, end):
+            counts.update(dict(db.session.query(VisitArchivePage.path, VisitArchivePage.count)
+                               .filter_by(month=archive.month)))
+        else:
+            add_rows(counts, (row for row in segment_rows(archive, start, end, user_id)
+                              if route is None or route_key(row) == route), lambda row: row['path'])
+    return rounded(counts).most_common()
+
+
+def route_counts(start=None, end=None, user_id=None):
+    """Посещения маршрутов за диапазон: [(rule, count)] по убыванию count"""
+    counts = Counter()
+    rules = endpoint_rules()
+    for endpoint_id, count in route_count_query(start, end, user_id):
+        if endpoint_id is None:
+            counts.update(dict(page_count_query(start, end, user_id).filter(VisitLog.endpoint_id.is_(None))))
+        else:
+            counts[rules[endpoint_id]] += count
+    for archive in archived_segments(start, end):
+        if user_id is None and covers(archive.month, start, end):
+            counts.update(dict(db.session.query(VisitArchiveRoute.rule, VisitArchiveRoute.count)
+                               .filter_by(month=archive.month)))
+        else:
+            add_rows(counts, segment_rows(archive, start, end, user_id), route_key)
+    return rounded(counts).most_common()
+
+
+def user_counts(start=None, end=None, user_id=None):
+    """Посещения по пользователям за диапазон: {user_id или None: count}"""
+    counts = Counter(dict(user_count_query(start, end, user_id)))
+    for archive in archived_segments(start, end):
+        if covers(archive.month, start, end):
+            totals = db.session.query(VisitArchiveUser.user_id, VisitArchiveUser.count).filter_by(
+                month=archive.month)
+            if user_id is not None:
+                totals = totals.filter_by(user_id=user_id)
+            for archived_user_id, count in totals:
+                counts[archived_user_id] += count
+        else:
+            add_rows(counts, segment_rows(archive, start, end, user_id), lambda row: row['user_id'])
+    return rounded(counts)
+
+
+def write_segment(path, rows, previous=None):
+    """Пишет сегмент во временный файл и атомарно подменяет им старый; возвращает итоги"""
+    pages, routes, users, total = Counter(), Counter(), Counter(), 0
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        for source in ((previous or ()), rows):
+            for row in source:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n')
+                weight = row.get('weight', 1)
+                pages[row['path']] += weight
+                routes[route_key(row)] += weight
+                users[row['user_id']] += weight
+                total += 1
+    os.replace(tmp_path, path)
+    return rounded(pages), rounded(routes), rounded(users), total
+
+
+def archive_month(key, batch_size=5000):
+    """Переносит месяц из visit_log в сегмент; строки удаляются после записи файла.
+
+    Каждый перенос пишет новое поколение сегмента под своим именем, а база
+    переключается на него той же транзакцией, что удаляет строки из visit_log.
+    Если фиксация не удалась, отчеты продолжают читать прежний файл, и записи
+    не считаются дважды; прежнее поколение удаляется только после фиксации.
+    """
+    start, end = month_range(key)
+    query = hot_query(db.session.query(VisitLog.id, VisitLog.path, VisitEndpoint.rule, VisitLog.user_id,
+                                       VisitLog.weight, VisitLog.created_at).outerjoin(VisitEndpoint),
+                      start, end).order_by(VisitLog.id)
+    last_id = db.session.query(db.func.max(VisitLog.id)).filter(
+        VisitLog.created_at >= start, VisitLog.created_at < end).scalar()
+    if last_id is None:
+        return 0
+    rows = ({'id': row.id, 'path': row.path, 'route': row.rule, 'user_id': row.user_id, 'weight': row.weight,
+             'created_at': row.created_at.isoformat()} for row in query.filter(VisitLog.id <= last_id).yield_per(batch_size))
+    archive = db.session.get(VisitArchive, key)
+    # Запоздавшие записи уже архивного месяца дописываются к его сегменту
+    previous = read_segment(archive) if archive else None
+    archived_at = datetime.utcnow()
+    file_name = f'visits-{key}-{archived_at:%Y%m%d%H%M%S%f}.jsonl.gz'
+    path = os.path.join(archive_dir(), file_name)
+    os.makedirs(archive_dir(), exist_ok=True)
+    pages, routes, users, total = write_segment(path, rows, previous)
+
+    old_path = segment_path(archive) if archive else None
+    if archive is None:
+        archive = VisitArchive(month=key)
+        db.session.add(archive)
+    archive.file_name = file_name
+    archive.rows = total
+    archive.archived_at = archived_at
+    VisitArchivePage.query.filter_by(month=key).delete()
+    VisitArchiveRoute.query.filter_by(month=key).delete()
+    VisitArchiveUser.query.filter_by(month=key).delete()
+    db.session.flush()
+    db.session.execute(db.insert(VisitArchivePage), [
+        {'month': key, 'path': path, 'count': count} for path, count in pages.items()])
+    db.session.execute(db.insert(VisitArchiveRoute), [
+        {'month': key, 'rule': rule, 'count': count} for rule, count in routes.items()])
+    db.session.execute(db.insert(VisitArchiveUser), [
+        {'month': key, 'user_id': user_id, 'count': count} for user_id, count in users.items()])
+    moved = hot_query(VisitLog.query, start, end).filter(VisitLog.id <= last_id).delete(
+        synchronize_session=False)
+    try:
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        os.remove(path)
+        raise
+    if old_path is not None:
+        try:
+            os.remove(old_path)
+        except FileNotFoundError:
+            pass
+    return moved
+
+
+def archive_old_visits(hot_months=None, now=None):
+    """Архивирует месяцы старше горячей части; возвращает {месяц: перенесено записей}"""
+    hot_months = current_app.config['VISIT_LOG_HOT_MONTHS'] if hot_months is None else hot_months
+    cutoff = add_months(month_start(now or datetime.utcnow()), 1 - max(hot_months, 1))
+    oldest = db.session.query(db.func.min(VisitLog.created_at)).filter(VisitLog.created_at < cutoff).scalar()
+    moved = {}
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        key = month_key(month)
+        count = archive_month(key)
+        if count:
+            moved[key] = count
+        month = add_months(month, 1)
+    return moved
+
+
+def prune_archive(archive_months=None, now=None):
+    """Удаляет сегменты и итоги месяцев старше срока хранения архива; возвращает удаленные месяцы"""
+    archive_months = (current_app.config['VISIT_LOG_ARCHIVE_MONTHS']
+                      if archive_months is None else archive_months)
+    if not archive_months:
+        return []
+    cutoff = month_key(add_months(month_start(now or datetime.utcnow()), 1 - archive_months))
+    pruned = []
+    for archive in VisitArchive.query.filter(VisitArchive.month < cutoff).order_by(VisitArchive.month):
+        VisitArchivePage.query.filter_by(month=archive.month).delete()
+        VisitArchiveRoute.query.filter_by(month=archive.month).delete()
+        VisitArchiveUser.query.filter_by(month=archive.month).delete()
+        db.session.delete(archive)
+        db.session.commit()
+        # Файл удаляется после фиксации: если удаление не удалось, остается лишний файл, а не дыра в отчетах
+        try:
+            os.remove(segment_path(archive))
+        except FileNotFoundError:
+            pass
+        pruned.append(archive.month)
+    return pruned
+
+
+def match_rule(adapter, path):
+    """Правило приложения для сохраненного пути или None"""
+    try:
+        return adapter.match(path, return_rule=True)[0]
+    except MethodNotAllowed as error:
+        # Например, POST-маршрут удаления: путь тот же, метод любой из разрешенных
+        return adapter.match(path, method=sorted(error.valid_methods)[0], return_rule=True)[0]
+    except HTTPException:
+        return None
+
+
+# Столбцы visit_log, появившиеся после первых версий базы
+VISIT_LOG_COLUMNS = {
+    'endpoint_id': 'INTEGER REFERENCES visit_endpoint (id)',
+    'weight': "FLOAT NOT NULL DEFAULT '1'",
+}
+
+
+def add_visit_log_columns():
+    """Добавляет недостающие столбцы visit_log в существующую базу; возвращает их имена"""
+    existing = {column['name'] for column in db.inspect(db.engine).get_columns('visit_log')}
+    added = [name for name in VISIT_LOG_COLUMNS if name not in existing]
+    VisitEndpoint.__table__.create(db.engine, checkfirst=True)
+    with db.engine.begin() as connection:
+        for name in added:
+            connection.exec_driver_sql(f'ALTER TABLE visit_log ADD COLUMN {name} {VISIT_LOG_COLUMNS[name]}')
+    return added
+
+
+def fill_visit_endpoints():
+    """Проставляет маршрут записям visit_log без него по правилам приложения; возвращает их число"""
+    adapter = current_app.url_map.bind('localhost')
+    filled = 0
+    paths = db.session.scalars(db.select(VisitLog.path).where(VisitLog.endpoint_id.is_(None)).distinct()).all()
+    for path in paths:
+        rule = match_rule(adapter, path)
+        if rule is None:
+            continue
+        endpoint_id = endpoint_cache.get_id(rule.rule, rule.endpoint)
+        filled += VisitLog.query.filter(VisitLog.endpoint_id.is_(None), VisitLog.path == path).update(
+            {VisitLog.endpoint_id: endpoint_id}, synchronize_session=False)
+    db.session.commit()
+    return filled
+
+
+def compact():
+    """Возвращает место, освобожденное удалением строк, и обновляет статистику планировщика"""
+    # VACUUM не выполняется внутри транзакции и ждет, пока другие соединения отпустят базу
+    db.session.remove()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM')
+        connection.exec_driver_sql('ANALYZE')
+
+
+# Команды группы выполняются в контексте приложения: flask --app app visits ...
+visits_cli = AppGroup('visits', help='Обслуживание журнала посещений.')
+
+
+@visits_cli.command('status')
+def status_command():
+    """Горячая часть и архивные сегменты журнала."""
+    hot = db.session.query(db.func.count(VisitLog.id), db.func.min(VisitLog.created_at)).one()
+    click.echo(f'visit_log: {hot[0]} записей' + (f', с {hot[1]:%Y-%m-%d}' if hot[1] else ''))
+    for archive in VisitArchive.query.order_by(VisitArchive.month):
+        size = os.path.getsize(segment_path(archive)) if os.path.exists(segment_path(archive)) else 0
+        click.echo(f'  {archive.month}: {archive.rows} записей, {size / 1024:.1f} КБ ({archive.file_name})')
+
+
+@visits_cli.command('archive')
+@click.option('--hot-months', type=click.IntRange(min=1),
+              help='Сколько месяцев оставить в visit_log (по умолчанию VISIT_LOG_HOT_MONTHS).')
+def archive_command(hot_months):
+    """Переносит старые месяцы из visit_log в сжатые сегменты."""
+    moved = archive_old_visits(hot_months)
+    for key, count in moved.items():
+        click.echo(f'  {key}: перенесено {count} записей')
+    click.echo(f'✓ Архивировано месяцев: {len(moved)}')
+
+
+@visits_cli.command('prune')
+@click.option('--archive-months', type=click.IntRange(min=0),
+              help='Срок хранения архива в месяцах (по умолчанию VISIT_LOG_ARCHIVE_MONTHS, 0 — бессрочно).')
+def prune_command(archive_months):
+    """Удаляет архивные сегменты старше срока хранения."""
+    pruned = prune_archive(archive_months)
+    click.echo(f'✓ Удалено сегментов: {len(pruned)}' + (f" ({', '.join(pruned)})" if pruned else ''))
+
+
+@visits_cli.command('routes')
+def routes_command():
+    """Проставляет маршрут записям журнала, сделанным до появления маршрутов."""
+    add_visit_log_columns()
+    click.echo(f'✓ Записей с найденным маршрутом: {fill_visit_endpoints()}')
+
+
+@visits_cli.command('compact')
+def compact_command():
+    """VACUUM и ANALYZE базы после архивирования."""
+    compact()
+    click.echo('✓ База сжата, статистика обновлена')
@@ -0,0 +1,87 @@
+import fnmatch
+import re
+from functools import lru_cache
+
+# Клиенты, чьи запросы не попадают в журнал: поисковые роботы, мониторинг, утилиты
+BOT_PATTERN = (r'bot\b|crawl|spider|slurp|facebookexternalhit|curl/|wget/|python-requests|httpx|'
+               r'go-http-client|okhttp|uptime|pingdom|monitor|headless')
+
+# Что не записывается по умолчанию: статика, сами отчеты (их открывают и опрашивают
+# панели, а не посетители сайта), служебные счетчики и проверки доступности
+DEFAULT_EXCLUDE = ('static', '*.static', 'reports.*', 'login_throttle_stats', '*health*')
+# Попытки входа при переборе паролей идут потоком, в журнал попадает каждая десятая с весом 10
+DEFAULT_SAMPLE_RATES = {'POST login': 0.1}
+
+
+def compile_patterns(patterns):
+    """Список шаблонов «endpoint» или «МЕТОД endpoint» (glob) -> [(метод или None, выражение)]"""
+    compiled = []
+    for pattern in patterns:
+        method, _, endpoint = pattern.rpartition(' ')
+        compiled.append((method.upper() or None, re.compile(fnmatch.translate(endpoint))))
+    return compiled
+
+
+def matches(compiled, method, endpoint):
+    return any((rule_method is None or rule_method == method) and regex.match(endpoint)
+               for rule_method, regex in compiled)
+
+
+class VisitRules:
+    """Какие запросы и с какой вероятностью записываются в журнал посещений.
+
+    Правила задаются шаблонами endpoint (`reports.*`, `POST login`): include —
+    если не пуст, записываются только подходящие запросы; exclude — не
+    записываются никогда; sample_rates — доля записываемых запросов, первое
+    подходящее правило. Решение для пары (метод, endpoint) вычисляется один раз
+    и запоминается: endpoint конечны, поэтому проверка запроса — поиск в словаре
+    и, для User-Agent, кешированное регулярное выражение.
+    """
+
+    def __init__(self, include=(), exclude=DEFAULT_EXCLUDE, sample_rates=DEFAULT_SAMPLE_RATES, skip_bots=True,
+                 bot_pattern=BOT_PATTERN):
+        self.configure(include, exclude, sample_rates, skip_bots, bot_pattern)
+
+    def configure(self, include, exclude, sample_rates, skip_bots, bot_pattern):
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.sample_rates = dict(sample_rates or {})
+        self.skip_bots = skip_bots
+        self.bot_pattern = bot_pattern
+        self._include = compile_patterns(self.include)
+        self._exclude = compile_patterns(self.exclude)
+        self._rates = [(rule, rate) for rule, rate in zip(compile_patterns(self.sample_rates),
+                                                           self.sample_rates.values())]
+        self._decisions = {}
+        search = re.compile(bot_pattern, re.IGNORECASE).search
+        self.is_bot = lru_cache(maxsize=4096)(lambda user_agent: search(user_agent) is not None)
+
+    def init_app(self, app):
+        app.config.setdefault('VISIT_LOG_INCLUDE', list(self.include))
+        app.config.setdefault('VISIT_LOG_EXCLUDE', list(self.exclude))
+        app.config.setdefault('VISIT_LOG_SAMPLE_RATES', self.sample_rates)
+        app.config.setdefault('VISIT_LOG_SKIP_BOTS', self.skip_bots)
+        app.config.setdefault('VISIT_LOG_BOT_PATTERN', self.bot_pattern)
+        self.configure(app.config['VISIT_LOG_INCLUDE'], app.config['VISIT_LOG_EXCLUDE'],
+                       app.config['VISIT_LOG_SAMPLE_RATES'], app.config['VISIT_LOG_SKIP_BOTS'],
+                       app.config['VISIT_LOG_BOT_PATTERN'])
+
+    def _decide(self, method, endpoint):
+        if self._include and not matches(self._include, method, endpoint):
+            return 0.0
+        if matches(self._exclude, method, endpoint):
+            return 0.0
+        for (rule_method, regex), rate in self._rates:
+            if (rule_method is None or rule_method == method) and regex.match(endpoint):
+                return min(max(float(rate), 0.0), 1.0)
+        return 1.0
+
+    def rate(self, method, endpoint, user_agent=''):
+        """Доля записываемых запросов этого вида: 0 — не записывать, 1 — записывать все"""
+        key = (method, endpoint)
+        rate = self._decisions.get(key)
+        if rate is None:
+            rate = self._decisions[key] = self._decide(method, endpoint)
+        if rate and self.skip_bots and user_agent and self.is_bot(user_agent):
+            return 0.0
+        return rate
@@ -0,0 +1,455 @@
+import atexit
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Потоковая статистика посещений в памяти процесса: частые страницы (Space-Saving)
+# и число различных посетителей (HyperLogLog) без запросов к visit_log. Каждый
+# процесс сервера считает свои запросы и периодически сохраняет их в свой файл
+# снимка; отчет объединяет свое состояние со снимками остальных процессов, а
+# снимки остановленных процессов забирает запустившийся. Даты — в UTC.
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class SpaceSaving:
+    """Частые элементы потока на capacity счетчиках (алгоритм Space-Saving).
+
+    Для элемента хранятся счетчик и ошибка: истинное число вхождений лежит в
+    [count - error, count], а error не больше total / capacity. Элемент,
+    встретившийся больше total / capacity раз, гарантированно есть в таблице.
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, item, count=1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            # Новый элемент занимает счетчик наименьшего и наследует его значение как ошибку
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+
+    def floor(self):
+        """Наибольшее число вхождений элемента, которого нет в таблице"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def top(self, n):
+        """[(элемент, count, error)] по убыванию count"""
+        items = sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+        return [(item, self.counts[item], self.errors[item]) for item in items]
+
+    @classmethod
+    def merge(cls, sketches, capacity):
+        """Объединение сводок (например, поминутных) с той же оценкой ошибки total / capacity"""
+        result = cls(capacity)
+        items = set().union(*(sketch.counts for sketch in sketches))
+        for sketch in sketches:
+            result.total += sketch.total
+            floor = sketch.floor()
+            for item in items:
+                result.counts[item] = result.counts.get(item, 0) + sketch.counts.get(item, floor)
+                result.errors[item] = result.errors.get(item, 0) + sketch.errors.get(item, floor)
+        for item in sorted(result.counts, key=result.counts.get)[:max(0, len(result.counts) - capacity)]:
+            del result.counts[item], result.errors[item]
+        return result
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'total': self.total,
+                'items': [[item, count, self.errors[item]] for item, count in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['capacity'])
+        sketch.total = data['total']
+        for item, count, error in data['items']:
+            sketch.counts[item] = count
+            sketch.errors[item] = error
+        return sketch
+
+
+class HyperLogLog:
+    """Оценка числа различных элементов по 2**precision однобайтовым регистрам.
+
+    Стандартная ошибка 1.04 / sqrt(2**precision): 1,6 % при precision=12
+    (4 КБ на сводку), 3,3 % при precision=10 (1 КБ).
+    """
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value):
+        x = hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(
+            number * 2.0 ** -rank for rank, number in Counter(self.registers).items())
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Малые значения точнее оценивает линейный подсчет по пустым регистрам
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+    def merge(self, other):
+        """Добавляет сводку с той же точностью: оценка станет оценкой объединения множеств"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @staticmethod
+    def error(precision):
+        return 1.04 / math.sqrt(1 << precision)
+
+    def to_str(self):
+        return base64.b64encode(self.registers).decode('ascii')
+
+    @classmethod
+    def from_str(cls, precision, value):
+        return cls(precision, base64.b64decode(value))
+
+
+class DaySketch:
+    """Сводки за сутки: частые страницы, посетители сайта и посетители каждого маршрута"""
+
+    def __init__(self, capacity, precision, route_precision):
+        self.visits = 0
+        self.pages = SpaceSaving(capacity)
+        self.visitors = HyperLogLog(precision)
+        self.route_precision = route_precision
+        # Маршрутов столько, сколько правил в приложении, поэтому сводок на маршрут немного
+        self.routes = {}
+
+    def add(self, path, route, visitor):
+        self.visits += 1
+        self.pages.add(path)
+        self.visitors.add(visitor)
+        sketch = self.routes.get(route)
+        if sketch is None:
+            sketch = self.routes[route] = HyperLogLog(self.route_precision)
+        sketch.add(visitor)
+
+    def merge(self, other):
+        """Добавляет сводки тех же суток из другого процесса"""
+        self.visits += other.visits
+        self.pages = SpaceSaving.merge([self.pages, other.pages], self.pages.capacity)
+        self.visitors.merge(other.visitors)
+        for route, sketch in other.routes.items():
+            if route in self.routes:
+                self.routes[route].merge(sketch)
+            else:
+                self.routes[route] = HyperLogLog(sketch.precision, sketch.registers)
+
+    def to_dict(self):
+        return {'visits': self.visits, 'pages': self.pages.to_dict(), 'visitors': self.visitors.to_str(),
+                'routes': {route: sketch.to_str() for route, sketch in self.routes.items()}}
+
+    @classmethod
+    def from_dict(cls, data, precision, route_precision):
+        day = cls(data['pages']['capacity'], precision, route_precision)
+        day.visits = data['visits']
+        day.pages = SpaceSaving.from_dict(data['pages'])
+        day.visitors = HyperLogLog.from_str(precision, data['visitors'])
+        day.routes = {route: HyperLogLog.from_str(route_precision, value)
+                      for route, value in data['routes'].items()}
+        return day
+
+
+def process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # Сигнала 0 на Windows нет; сервер разработки там работает одним процессом
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class VisitSketches:
+    """Статистика посещений для живых панелей: «частые страницы сейчас» и «посетители за сутки».
+
+    record() вызывается из журнала посещений и стоит микросекунды: обновляет
+    поминутную сводку частых страниц и сводки текущих суток. Последние
+    window_minutes минут объединяются при запросе, суточные сводки хранятся
+    days дней. Раз в snapshot_interval секунд и при завершении процесса
+    состояние записывается в снимок процесса: snapshot_path с номером процесса
+    (visit_sketches.1234.json). stats() добавляет к своему состоянию снимки
+    работающих процессов, а первое посещение в новом процессе забирает снимки
+    остановленных, поэтому статистика переживает перезапуск и не считается дважды.
+    """
+
+    def __init__(self, capacity=200, precision=12, route_precision=10, window_minutes=15, days=7,
+                 snapshot_path=None, snapshot_interval=60):
+        self.configure(capacity, precision, route_precision, window_minutes, days, snapshot_path,
+                       snapshot_interval)
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._minutes = {}
+        self._days = {}
+        self._saved_at = time.time()
+        # Процесс, которому принадлежит состояние; после fork дочерний процесс начинает со своего
+        self._pid = None
+
+    def configure(self, capacity, precision, route_precision, window_minutes, days, snapshot_path,
+                  snapshot_interval):
+        self.capacity = capacity
+        self.precision = precision
+        self.route_precision = route_precision
+        self.window_minutes = window_minutes
+        self.days = days
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+
+    def init_app(self, app):
+        app.config.setdefault('VISIT_SKETCH_CAPACITY', self.capacity)
+        app.config.setdefault('VISIT_SKETCH_PRECISION', self.precision)
+        app.config.setdefault('VISIT_SKETCH_ROUTE_PRECISION', self.route_precision)
+        app.config.setdefault('VISIT_SKETCH_WINDOW_MINUTES', self.window_minutes)
+        app.config.setdefault('VISIT_SKETCH_DAYS', self.days)
+        app.config.setdefault('VISIT_SKETCH_SNAPSHOT_PATH',
+                              self.snapshot_path or os.path.join(app.instance_path, 'visit_sketches.json'))
+        app.config.setdefault('VISIT_SKETCH_SNAPSHOT_INTERVAL', self.snapshot_interval)
+        self.configure(app.config['VISIT_SKETCH_CAPACITY'], app.config['VISIT_SKETCH_PRECISION'],
+                       app.config['VISIT_SKETCH_ROUTE_PRECISION'], app.config['VISIT_SKETCH_WINDOW_MINUTES'],
+                       app.config['VISIT_SKETCH_DAYS'], app.config['VISIT_SKETCH_SNAPSHOT_PATH'],
+                       app.config['VISIT_SKETCH_SNAPSHOT_INTERVAL'])
+        if self.snapshot_interval:
+            atexit.register(self.snapshot)
+
+    def _ensure_process(self):
+        # Снимки читаются в процессе, который обслуживает запросы, а не в родителе до fork
+        if self._pid == os.getpid():
+            return
+        with self._process_lock:
+            if self._pid != os.getpid():
+                with self._lock:
+                    self._minutes = {}
+                    self._days = {}
+                self.load()
+
+    def record(self, path, route, visitor, now=None):
+        self._ensure_process()
+        now = now or time.time()
+        minute = int(now // 60)
+        day = datetime.utcfromtimestamp(now).date().isoformat()
+        with self._lock:
+            sketch = self._minutes.get(minute)
+            if sketch is None:
+                sketch = self._minutes[minute] = SpaceSaving(self.capacity)
+                self._expire(minute, day)
+            sketch.add(path)
+            day_sketch = self._days.get(day)
+            if day_sketch is None:
+                day_sketch = self._days[day] = DaySketch(self.capacity, self.precision, self.route_precision)
+            day_sketch.add(path, route, visitor)
+            # Снимок пишет один поток: срок следующего сдвигается под блокировкой
+            due = self.snapshot_interval and now - self._saved_at >= self.snapshot_interval
+            if due:
+                self._saved_at = now
+        if due:
+            self.snapshot(now)
+
+    def _expire(self, minute, day):
+        for key in [key for key in self._minutes if key <= minute - self.window_minutes]:
+            del self._minutes[key]
+        for key in sorted(self._days)[:-self.days or None]:
+            if key != day:
+                del self._days[key]
+
+    def _window(self, minute, peers):
+        sketches = [sketch for minutes in [self._minutes, *(peer[0] for peer in peers)]
+                    for key, sketch in minutes.items() if key > minute - self.window_minutes]
+        return SpaceSaving.merge(sketches, self.capacity)
+
+    def top_now(self, n=10, now=None):
+        """Частые страницы за последние window_minutes минут: (сводка, [(path, count, error)])"""
+        self._ensure_process()
+        minute = int((now or time.time()) // 60)
+        peers = self._peers()
+        with self._lock:
+            merged = self._window(minute, peers)
+        return merged, merged.top(n)
+
+    def stats(self, n=10, now=None):
+        """Сводка для JSON по всем процессам: частые страницы сейчас, сутки и границы ошибок"""
+        self._ensure_process()
+        now = now or time.time()
+        peers = self._peers()
+        with self._lock:
+            window = self._window(int(now // 60), peers)
+            days = {}
+            for source in [self._days, *(peer[1] for peer in peers)]:
+                for key, sketch in source.items():
+                    if key not in days:
+                        days[key] = DaySketch(self.capacity, self.precision, self.route_precision)
+                    days[key].merge(sketch)
+        days = dict(sorted(days.items(), reverse=True)[:self.days])
+        return {
+            'generated_at': datetime.utcfromtimestamp(now).isoformat(timespec='seconds'),
+            'now': {
+                'minutes': self.window_minutes,
+                'visits': window.total,
+                'max_error': window.total // self.capacity,
+                'top_pages': [{'path': path, 'count': count, 'error': error}
+                              for path, count, error in window.top(n)],
+            },
+            'days': [{
+                'date': key,
+                'visits': sketch.visits,
+                'unique_visitors': sketch.visitors.count(),
+                'max_error': sketch.visits // self.capacity,
+                'top_pages': [{'path': path, 'count': count, 'error': error}
+                              for path, count, error in sketch.pages.top(n)],
+                'routes': sorted(({'route': route, 'unique_visitors': visitors.count()}
+                                  for route, visitors in sketch.routes.items()),
+                                 key=lambda row: row['unique_visitors'], reverse=True),
+            } for key, sketch in days.items()],
+            'error_bounds': {
+                'top_pages': f'истинное число в [count - error, count], error ≤ visits / {self.capacity}',
+                'unique_visitors': round(HyperLogLog.error(self.precision), 4),
+                'route_unique_visitors': round(HyperLogLog.error(self.route_precision), 4),
+            },
+        }
+
+    def _process_path(self, pid):
+        root, ext = os.path.splitext(self.snapshot_path)
+        return f'{root}.{pid}{ext}'
+
+    def _snapshots(self):
+        """[(номер процесса, путь)] снимков в каталоге; у снимка без номера (прежний формат) — None"""
+        directory = os.path.dirname(self.snapshot_path) or '.'
+        root, ext = os.path.splitext(os.path.basename(self.snapshot_path))
+        pattern = re.compile(re.escape(root) + r'\.(\d+)' + re.escape(ext))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        found = [(None, self.snapshot_path)] if os.path.basename(self.snapshot_path) in names else []
+        for name in names:
+            match = pattern.fullmatch(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(directory, name)))
+        return found
+
+    def _read(self, path):
+        """(поминутные, суточные сводки) снимка; None, если его нет или он снят с другими параметрами"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get('version'), data.get('capacity'), data.get('precision'), data.get('route_precision')) != (
+                1, self.capacity, self.precision, self.route_precision):
+            return None
+        return ({int(key): SpaceSaving.from_dict(value) for key, value in data['minutes'].items()},
+                {key: DaySketch.from_dict(value, self.precision, self.route_precision)
+                 for key, value in data['days'].items()})
+
+    def _peers(self):
+        """Снимки других работающих процессов"""
+        if not self.snapshot_path:
+            return []
+        peers = []
+        for pid, path in self._snapshots():
+            if pid is not None and pid != self._pid and process_alive(pid):
+                data = self._read(path)
+                if data is not None:
+                    peers.append(data)
+        return peers
+
+    def snapshot(self, now=None):
+        """Записывает состояние процесса во временный файл и атомарно подменяет им его снимок"""
+        if not self.snapshot_path or self._pid != os.getpid():
+            return
+        with self._lock:
+            self._saved_at = now or time.time()
+            data = {
+                'version': 1,
+                'capacity': self.capacity,
+                'precision': self.precision,
+                'route_precision': self.route_precision,
+                'minutes': {str(key): sketch.to_dict() for key, sketch in self._minutes.items()},
+                'days': {key: sketch.to_dict() for key, sketch in self._days.items()},
+            }
+        path = self._process_path(self._pid)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """Забирает в состояние процесса снимки остановленных процессов; возвращает, забран ли хоть один.
+
+        Снимок перед слиянием переименовывается, поэтому два одновременно
+        запущенных процесса не заберут его оба. Снимки с другими параметрами
+        сводок пропускаются. Вызывается один раз при старте процесса.
+        """
+        pid = os.getpid()
+        claimed = []
+        for owner, path in (self._snapshots() if self.snapshot_path else []):
+            if owner is not None and owner != pid and process_alive(owner):
+                continue
+            data = self._read(path)
+            if data is None:
+                continue
+            claim = f'{path}.{pid}.claimed'
+            try:
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue
+            minutes, days = data
+            with self._lock:
+                for key, sketch in minutes.items():
+                    own = self._minutes.get(key)
+                    self._minutes[key] = sketch if own is None else SpaceSaving.merge([own, sketch], self.capacity)
+                for key, sketch in days.items():
+                    if key in self._days:
+                        self._days[key].merge(sketch)
+                    else:
+                        self._days[key] = sketch
+            claimed.append(claim)
+        self._pid = pid
+        if claimed:
+            # Забранное сначала сохраняется в свой снимок, и только потом удаляются чужие
+            self.snapshot()
+            for claim in claimed:
+                os.remove(claim)
+        return bool(claimed)
+
+    def reset(self):
+        with self._lock:
+            self._minutes.clear()
+            self._days.clear()
+        self._pid = os.getpid()
@@ -3,7 +3,10 @@ from flask_migrate import Migrate
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.models import db
+from app.login_throttle import login_throttle
+from app.password_hasher import password_hasher
 from app.auth import bp as auth_bp, init_login_manager
+from app.cli import init_cli
 from app.courses import bp as courses_bp
 from app.routes import bp as main_bp
 
@@ -15,14 +18,19 @@ def handle_sqlalchemy_error(err):
 def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=False)
     app.config.from_pyfile('config.py')
+    # Переопределение настроек через окружение, например FLASK_SQLALCHEMY_ECHO=false
+    app.config.from_prefixed_env()
 
     if test_config:
         app.config.from_mapping(test_config)
 
     db.init_app(app)
+    password_hasher.init_app(app)
+    login_throttle.init_app(app)
     migrate = Migrate(app, db)
 
     init_login_manager(app)
+    init_cli(app)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(courses_bp)
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import LoginManager, login_user, logout_user, login_required
 
 from app.models import db
+from app.login_throttle import login_throttle
+from app.password_hasher import password_hasher
 from app.repositories import UserRepository
 
 user_repository = UserRepository(db)
@@ -25,8 +27,14 @@ def login():
         login = request.form.get('login')
         password = request.form.get('password')
         if login and password:
+            # Лишние попытки отклоняются с 429 еще до поиска пользователя и хеширования
+            login_throttle.check(login, request.remote_addr)
             user = user_repository.get_user_by_login(login)
-            if user and user.check_password(password):
+            valid, new_hash = password_hasher.verify(user.password_hash, password) if user else (False, None)
+            if valid:
+                # Хеш со старыми параметрами пересчитывается при успешном входе
+                if new_hash:
+                    user_repository.update_password_hash(user, new_hash)
                 login_user(user)
                 flash('Вы успешно аутентифицированы.', 'success')
                 next = request.args.get('next')
@@ -0,0 +1,309 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app.models import db
+from app.generator import DatasetGenerator
+from app.repositories import UserRepository, CourseRepository, CategoryRepository, ImageRepository, ReviewRepository
+
+user_repository = UserRepository(db)
+course_repository = CourseRepository(db)
+category_repository = CategoryRepository(db)
+image_repository = ImageRepository(db)
+review_repository = ReviewRepository(db)
+
+FORMATS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'jsonl',
+    '.csv': 'csv',
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt, skip=0):
+    """Построчно читает JSON Lines или CSV, не загружая файл в память.
+
+    Первые skip записей пропускаются без разбора.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), 1):
+                if number > skip:
+                    yield {k: (v if v != '' else None) for k, v in row.items()}
+        else:
+            number = 0
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                number += 1
+                if number > skip:
+                    yield json.loads(line)
+
+
+def checkpoint_path(path):
+    return path + '.progress'
+
+
+def read_checkpoint(path):
+    try:
+        with open(checkpoint_path(path), encoding='utf-8') as f:
+            return json.load(f).get('rows', 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def write_checkpoint(path, rows):
+    tmp_path = checkpoint_path(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'rows': rows, 'updated_at': datetime.now().isoformat()}, f)
+    os.replace(tmp_path, checkpoint_path(path))
+
+
+def parse_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def required(row, key):
+    value = row.get(key)
+    if value is None or str(value).strip() == '':
+        raise RowError(f'не заполнено поле {key}')
+    return value
+
+
+def resolve(row, id_key, name_key, mapping, known_ids=None):
+    """Возвращает внешний ключ по id или по естественному ключу из словаря"""
+    if row.get(id_key) is not None:
+        value = int(row[id_key])
+        if known_ids is not None and value not in known_ids:
+            raise RowError(f'{id_key}={value} не найден')
+        return value
+    name = row.get(name_key)
+    if name is None:
+        raise RowError(f'не заполнено поле {id_key} или {name_key}')
+    if name not in mapping:
+        raise RowError(f'{name_key}={name!r} не найден')
+    return mapping[name]
+
+
+class UserImporter:
+    def __init__(self):
+        self.logins = user_repository.get_login_map()
+
+    def convert(self, row):
+        login = required(row, 'login')
+        if login in self.logins:
+            raise RowError(f'пользователь {login!r} уже существует')
+        password_hash = row.get('password_hash') or generate_password_hash(required(row, 'password'))
+        # Резервируем логин, чтобы дубликаты внутри файла тоже отсекались
+        self.logins[login] = None
+        return {
+            'login': login,
+            'password_hash': password_hash,
+            'first_name': required(row, 'first_name'),
+            'last_name': required(row, 'last_name'),
+            'middle_name': row.get('middle_name'),
+            'created_at': parse_datetime(row.get('created_at')) or datetime.now(),
+        }
+
+    def save(self, rows):
+        user_repository.bulk_add_users(rows)
+
+
+class CourseImporter:
+    def __init__(self, default_image_id):
+        self.default_image_id = default_image_id
+        self.categories = category_repository.get_name_map()
+        self.category_ids = set(self.categories.values())
+        self.authors = user_repository.get_login_map()
+        self.author_ids = set(self.authors.values())
+        self.image_ids = image_repository.get_all_ids()
+        self.course_ids = course_repository.get_all_ids()
+
+    def convert(self, row):
+        image_id = row.get('background_image_id') or self.default_image_id
+        if image_id not in self.image_ids:
+            raise RowError(f'изображение {image_id!r} не найдено')
+        course = {
+            'name': required(row, 'name'),
+            'short_desc': required(row, 'short_desc'),
+            'full_desc': row.get('full_desc') or row['short_desc'],
+            'category_id': resolve(row, 'category_id', 'category', self.categories, self.category_ids),
+            'author_id': resolve(row, 'author_id', 'author_login', self.authors, self.author_ids),
+            'background_image_id': image_id,
+            'created_at': parse_datetime(row.get('created_at')) or datetime.now(),
+        }
+        # Сохраняем идентификатор из внешней системы, чтобы на него могли ссылаться отзывы
+        if row.get('id') is not None:
+            course['id'] = int(row['id'])
+            if course['id'] in self.course_ids:
+                raise RowError(f'курс id={course["id"]} уже существует')
+            self.course_ids.add(course['id'])
+        return course
+
+    def save(self, rows):
+        course_repository.bulk_add_courses(rows)
+
+
+class ReviewImporter:
+    def __init__(self):
+        self.course_ids = course_repository.get_all_ids()
+        self.users = user_repository.get_login_map()
+        self.user_ids = set(self.users.values())
+        self.reviewed = review_repository.get_reviewed_pairs()
+
+    def convert(self, row):
+        rating = int(required(row, 'rating'))
+        if rating < 0 or rating > 5:
+            raise RowError('оценка должна быть от 0 до 5')
+        text = str(required(row, 'text')).strip()
+        course_id = int(required(row, 'course_id'))
+        if course_id not in self.course_ids:
+            raise RowError(f'course_id={course_id} не найден')
+        user_id = resolve(row, 'user_id', 'user_login', self.users, self.user_ids)
+        # Пользователь оставляет не больше одного отзыва на курс, как и в веб-форме
+        if (course_id, user_id) in self.reviewed:
+            raise RowError(f'отзыв пользователя {user_id} на курс {course_id} уже существует')
+        self.reviewed.add((course_id, user_id))
+        return {
+            'rating': rating,
+            'text': text,
+            'course_id': course_id,
+            'user_id': user_id,
+            'created_at': parse_datetime(row.get('created_at')) or datetime.now(),
+        }
+
+    def save(self, rows):
+        review_repository.bulk_add_reviews(rows)
+
+
+def run_import(importer, path, fmt, batch_size, resume):
+    skip = read_checkpoint(path) if resume else 0
+    if skip:
+        click.echo(f'Продолжаем импорт с записи {skip + 1}')
+
+    processed = skip
+    imported = 0
+    errors = 0
+    batch = []
+    started = time.perf_counter()
+
+    def reject(number, err):
+        nonlocal errors
+        errors += 1
+        click.echo(f'  запись {number} пропущена: {err}', err=True)
+
+    def flush():
+        nonlocal imported
+        try:
+            importer.save([record for _, record in batch])
+            imported += len(batch)
+        except IntegrityError:
+            # Проверки convert не видят записей, добавленных в базу параллельно:
+            # повторяем пачку по одной записи и пропускаем только нарушающие ограничения
+            for number, record in batch:
+                try:
+                    importer.save([record])
+                    imported += 1
+                except IntegrityError as err:
+                    reject(number, err.orig)
+        batch.clear()
+        # Контрольная точка пишется только после фиксации транзакции
+        write_checkpoint(path, processed)
+        elapsed = time.perf_counter() - started
+        click.echo(f'  обработано {processed}, импортировано {imported} '
+                   f'({imported / elapsed if elapsed else 0:.0f} записей/с)')
+
+    for number, row in enumerate(read_rows(path, fmt, skip), skip + 1):
+        processed = number
+        try:
+            batch.append((number, importer.convert(row)))
+        except (RowError, ValueError, TypeError, KeyError) as err:
+            reject(number, err)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    os.remove(checkpoint_path(path))
+    return imported, errors
+
+
+@click.command('import')
+@click.argument('entity', type=click.Choice(['users', 'courses', 'reviews']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']),
+              help='Формат файла (по умолчанию определяется по расширению).')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Количество записей в одной транзакции.')
+@click.option('--resume/--no-resume', default=True, show_default=True,
+              help='Продолжить с последней контрольной точки.')
+@click.option('--recalculate/--no-recalculate', default=True, show_default=True,
+              help='Пересчитать рейтинги курсов после импорта отзывов.')
+@click.option('--default-image', default='default_bg', show_default=True,
+              help='Фоновое изображение для курсов без background_image_id.')
+@with_appcontext
+def import_command(entity, path, fmt, batch_size, resume, recalculate, default_image):
+    """Массовый импорт пользователей, курсов или отзывов из JSON Lines/CSV."""
+    if fmt is None:
+        fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise click.UsageError('Не удалось определить формат файла, укажите --format.')
+
+    # Журналирование SQL на миллионах строк съедает больше времени, чем сама вставка
+    db.engine.echo = False
+
+    if entity == 'users':
+        importer = UserImporter()
+    elif entity == 'courses':
+        importer = CourseImporter(default_image)
+    else:
+        importer = ReviewImporter()
+
+    imported, errors = run_import(importer, path, fmt, batch_size, resume)
+    click.echo(f'✓ Импортировано записей: {imported}, пропущено: {errors}')
+
+    if entity == 'reviews' and recalculate:
+        review_repository.recalculate_all_ratings()
+        click.echo('✓ Рейтинги курсов пересчитаны')
+
+
+@click.command('generate')
+@click.option('--seed', default=42, show_default=True, help='Зерно генератора случайных чисел.')
+@click.option('--users', default=1000, show_default=True, type=click.IntRange(min=1))
+@click.option('--categories', default=20, show_default=True, type=click.IntRange(min=1))
+@click.option('--category-depth', default=3, show_default=True, type=click.IntRange(min=1),
+              help='Максимальная глубина вложенности категорий.')
+@click.option('--courses', default=500, show_default=True, type=click.IntRange(min=0))
+@click.option('--max-reviews', default=1000, show_default=True, type=click.IntRange(min=0),
+              help='Количество отзывов у самого популярного курса.')
+@click.option('--zipf', 'zipf_s', default=1.1, show_default=True,
+              help='Показатель распределения Ципфа для числа отзывов на курс.')
+@click.option('--batch-size', default=10000, show_default=True)
+@with_appcontext
+def generate_command(seed, users, categories, category_depth, courses, max_reviews, zipf_s, batch_size):
+    """Заполнение базы синтетическими данными."""
+    db.engine.echo = False
+    stats = DatasetGenerator(
+        seed=seed, users=users, categories=categories, category_depth=category_depth,
+        courses=courses, max_reviews=max_reviews, zipf_s=zipf_s, batch_size=batch_size,
+        progress=click.echo
+    ).generate()
+    click.echo(f"🎉 Сгенерировано за {stats['seconds']:.1f} с")
+
+
+def init_cli(app):
+    app.cli.add_command(import_command)
+    app.cli.add_command(generate_command)
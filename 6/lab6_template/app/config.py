@@ -7,6 +7,24 @@ SQLALCHEMY_DATABASE_URI = 'sqlite:///project.db'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_ECHO = True
 
+# Хеширование паролей в пуле процессов; при переполнении очереди вход отвечает 503
+PASSWORD_HASH_METHOD = 'scrypt'
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE = 4
+PASSWORD_HASH_TIMEOUT = 10
+
+# Ограничение попыток входа: корзина на BURST попыток, пополняется на PER_MINUTE в минуту.
+# LOGIN_THROTTLE_REDIS_URL — хранить корзины в Redis, общем для всех процессов
+LOGIN_THROTTLE_ENABLED = True
+LOGIN_THROTTLE_LOGIN_BURST = 5
+LOGIN_THROTTLE_LOGIN_PER_MINUTE = 5
+LOGIN_THROTTLE_IP_BURST = 30
+LOGIN_THROTTLE_IP_PER_MINUTE = 30
+LOGIN_THROTTLE_MAX_KEYS = 100000
+LOGIN_THROTTLE_REDIS_URL = None
+# Адреса, с которых доступны счетчики /login-throttle-stats
+LOGIN_THROTTLE_STATS_ALLOWED = ['127.0.0.1', '::1']
+
 UPLOAD_FOLDER = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), 
     '..',
@@ -0,0 +1,172 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+from faker import Faker
+from werkzeug.security import generate_password_hash
+
+from app.models import db, User, Category, Course, Image
+from app.repositories import UserRepository, CourseRepository, CategoryRepository, ReviewRepository
+
+user_repository = UserRepository(db)
+course_repository = CourseRepository(db)
+category_repository = CategoryRepository(db)
+review_repository = ReviewRepository(db)
+
+DEFAULT_PASSWORD = 'qwerty'
+POOL_SIZE = 1000
+PERIOD = timedelta(days=730)
+# Фиксированная точка отсчета, чтобы даты тоже зависели только от seed
+BASE_DATE = datetime(2025, 1, 1)
+
+
+def max_id(model):
+    return db.session.execute(db.select(db.func.max(model.id))).scalar() or 0
+
+
+def zipf_sizes(count, max_size, s):
+    """Размеры по закону Ципфа: k-й по популярности элемент получает max_size / k^s"""
+    return [int(max_size / rank ** s) for rank in range(1, count + 1)]
+
+
+class DatasetGenerator:
+    def __init__(self, seed=42, users=1000, categories=20, category_depth=3,
+                 courses=500, max_reviews=1000, zipf_s=1.1, batch_size=10000,
+                 progress=None):
+        self.seed = seed
+        self.users = users
+        self.categories = categories
+        self.category_depth = category_depth
+        self.courses = courses
+        self.max_reviews = min(max_reviews, users)
+        self.zipf_s = zipf_s
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+
+        self.rng = random.Random(seed)
+        self.now = BASE_DATE
+
+        # Faker медленный, поэтому заранее набираем пулы значений и дальше выбираем из них
+        fake = Faker('ru_RU')
+        fake.seed_instance(seed)
+        self.first_names = [fake.first_name_male() for _ in range(POOL_SIZE)]
+        self.last_names = [fake.last_name_male() for _ in range(POOL_SIZE)]
+        self.middle_names = [fake.middle_name_male() for _ in range(POOL_SIZE)]
+        self.words = [fake.word() for _ in range(POOL_SIZE)]
+        self.sentences = [fake.sentence(nb_words=10) for _ in range(POOL_SIZE)]
+        self.paragraphs = [fake.paragraph(nb_sentences=5) for _ in range(POOL_SIZE // 10)]
+
+    def random_date(self):
+        return self.now - timedelta(seconds=self.rng.randrange(int(PERIOD.total_seconds())))
+
+    def generate(self):
+        started = time.perf_counter()
+        user_ids = self.generate_users()
+        category_ids = self.generate_categories()
+        stats = self.generate_courses_and_reviews(user_ids, category_ids)
+        stats.update(users=len(user_ids), categories=len(category_ids),
+                     seconds=time.perf_counter() - started)
+        return stats
+
+    def generate_users(self):
+        first_id = max_id(User) + 1
+        # Один хеш на всех: вычисление KDF для миллиона пользователей заняло бы часы
+        password_hash = generate_password_hash(DEFAULT_PASSWORD)
+        rows = []
+        for user_id in range(first_id, first_id + self.users):
+            rows.append({
+                'id': user_id,
+                'login': f'user{user_id}',
+                'password_hash': password_hash,
+                'first_name': self.rng.choice(self.first_names),
+                'last_name': self.rng.choice(self.last_names),
+                'middle_name': self.rng.choice(self.middle_names),
+                'created_at': self.random_date(),
+            })
+            if len(rows) >= self.batch_size:
+                user_repository.bulk_add_users(rows)
+                rows = []
+        user_repository.bulk_add_users(rows)
+        self.progress(f'✓ Пользователи: {self.users}')
+        return list(range(first_id, first_id + self.users))
+
+    def generate_categories(self):
+        first_id = max_id(Category) + 1
+        depths = {}
+        rows = []
+        for category_id in range(first_id, first_id + self.categories):
+            parents = [c for c, depth in depths.items() if depth < self.category_depth - 1]
+            # Примерно треть категорий — корневые, остальные вкладываются в уже созданные
+            parent_id = None
+            if parents and self.rng.random() > 0.3:
+                parent_id = self.rng.choice(parents)
+            depths[category_id] = depths[parent_id] + 1 if parent_id else 0
+            rows.append({
+                'id': category_id,
+                'name': ' '.join(self.rng.sample(self.words, 2)).capitalize(),
+                'parent_id': parent_id,
+            })
+        category_repository.bulk_add_categories(rows)
+        self.progress(f'✓ Категории: {self.categories}')
+        return list(depths)
+
+    def background_image_id(self):
+        image_id = db.session.execute(db.select(Image.id).limit(1)).scalar()
+        return image_id or 'default_bg'
+
+    def generate_courses_and_reviews(self, user_ids, category_ids):
+        first_id = max_id(Course) + 1
+        course_ids = list(range(first_id, first_id + self.courses))
+        # Популярность не должна совпадать с порядком идентификаторов
+        ranked = course_ids[:]
+        self.rng.shuffle(ranked)
+        sizes = dict(zip(ranked, zipf_sizes(self.courses, self.max_reviews, self.zipf_s)))
+        image_id = self.background_image_id()
+
+        total_reviews = 0
+        for offset in range(0, self.courses, self.batch_size):
+            courses = []
+            reviews = []
+            for course_id in course_ids[offset:offset + self.batch_size]:
+                course_reviews = self.course_reviews(course_id, sizes[course_id], user_ids)
+                courses.append({
+                    'id': course_id,
+                    'name': self.rng.choice(self.sentences)[:100],
+                    'short_desc': self.rng.choice(self.sentences),
+                    'full_desc': self.rng.choice(self.paragraphs),
+                    'rating_sum': sum(r['rating'] for r in course_reviews),
+                    'rating_num': len(course_reviews),
+                    'category_id': self.rng.choice(category_ids),
+                    'author_id': self.rng.choice(user_ids),
+                    'background_image_id': image_id,
+                    'created_at': self.now - PERIOD,
+                })
+                reviews.extend(course_reviews)
+            # Курсы вставляются раньше своих отзывов, чтобы не нарушать внешние ключи
+            course_repository.bulk_add_courses(courses)
+            for start in range(0, len(reviews), self.batch_size):
+                review_repository.bulk_add_reviews(reviews[start:start + self.batch_size])
+            total_reviews += len(reviews)
+            self.progress(f'  курсов: {offset + len(courses)}, отзывов: {total_reviews}')
+        self.progress(f'✓ Курсы: {self.courses}, отзывы: {total_reviews}')
+        return {'courses': self.courses, 'reviews': total_reviews}
+
+    def course_reviews(self, course_id, size, user_ids):
+        # Подряд идущие пользователи со случайным сдвигом: один отзыв на пользователя без выборки множества
+        start = self.rng.randrange(len(user_ids))
+        quality = self.rng.uniform(1.5, 5)
+        reviews = []
+        for i in range(size):
+            rating = min(5, max(0, round(self.rng.gauss(quality, 1.2))))
+            reviews.append({
+                'rating': rating,
+                'text': self.rng.choice(self.sentences),
+                'course_id': course_id,
+                'user_id': user_ids[(start + i) % len(user_ids)],
+                'created_at': self.random_date(),
+            })
+        return reviews
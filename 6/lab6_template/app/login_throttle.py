@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import abort, jsonify, request
+
+try:
+    import redis
+except ImportError:  # Redis необязателен, по умолчанию корзины хранятся в памяти процесса
+    redis = None
+
+# Ограничение длины ключа: логин из формы может быть сколь угодно длинным
+MAX_KEY_LENGTH = 128
+
+
+class TooManyAttempts(Exception):
+    """Попытки входа исчерпаны, запрос отклоняется до проверки пароля"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class MemoryBucketStore:
+    """Корзины токенов в памяти процесса, не больше max_keys (вытесняются давно не использованные)"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, burst, rate, now):
+        """Забирает токен; возвращает (разрешено ли, остаток токенов)"""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                # Вытесненная корзина за время простоя почти наверняка уже наполнилась
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Пополнение и списание в одном скрипте, чтобы процессы сервера не гонялись за одну корзину
+TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Корзины токенов в Redis (или совместимом сервере), общие для всех процессов"""
+
+    def __init__(self, url, prefix='login-throttle:'):
+        if redis is None:
+            raise RuntimeError('Для LOGIN_THROTTLE_REDIS_URL нужен пакет redis')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(match=self.prefix + '*'))
+
+    def take(self, key, burst, rate, now):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[burst, rate, now])
+        return bool(allowed), float(tokens)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+class LoginThrottle:
+    """Ограничение попыток входа корзинами токенов по логину и по IP-адресу.
+
+    Корзина вмещает burst попыток и пополняется на per_minute попыток в минуту.
+    check() вызывается до поиска пользователя и проверки пароля, поэтому
+    перебор паролей не превращается в неограниченное число вычислений хеша.
+    """
+
+    def __init__(self, login_burst=5, login_per_minute=5, ip_burst=30, ip_per_minute=30,
+                 max_keys=100000, redis_url=None, enabled=True, stats_allowed=('127.0.0.1', '::1')):
+        self.stats_allowed = set(stats_allowed)
+        self.configure(login_burst, login_per_minute, ip_burst, ip_per_minute,
+                       max_keys, redis_url, enabled)
+
+    def configure(self, login_burst=5, login_per_minute=5, ip_burst=30, ip_per_minute=30,
+                  max_keys=100000, redis_url=None, enabled=True):
+        self.limits = {
+            'login': (login_burst, login_per_minute / 60),
+            'ip': (ip_burst, ip_per_minute / 60),
+        }
+        self.max_keys = max_keys
+        self.redis_url = redis_url
+        self.enabled = enabled
+        self.store = RedisBucketStore(redis_url) if redis_url else MemoryBucketStore(max_keys)
+        self._counters = {'allowed': 0, 'throttled_login': 0, 'throttled_ip': 0}
+        self._counters_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_THROTTLE_ENABLED', self.enabled)
+        app.config.setdefault('LOGIN_THROTTLE_LOGIN_BURST', self.limits['login'][0])
+        app.config.setdefault('LOGIN_THROTTLE_LOGIN_PER_MINUTE', self.limits['login'][1] * 60)
+        app.config.setdefault('LOGIN_THROTTLE_IP_BURST', self.limits['ip'][0])
+        app.config.setdefault('LOGIN_THROTTLE_IP_PER_MINUTE', self.limits['ip'][1] * 60)
+        app.config.setdefault('LOGIN_THROTTLE_MAX_KEYS', self.max_keys)
+        app.config.setdefault('LOGIN_THROTTLE_REDIS_URL', self.redis_url)
+        app.config.setdefault('LOGIN_THROTTLE_STATS_ALLOWED', list(self.stats_allowed))
+        self.configure(app.config['LOGIN_THROTTLE_LOGIN_BURST'], app.config['LOGIN_THROTTLE_LOGIN_PER_MINUTE'],
+                       app.config['LOGIN_THROTTLE_IP_BURST'], app.config['LOGIN_THROTTLE_IP_PER_MINUTE'],
+                       app.config['LOGIN_THROTTLE_MAX_KEYS'], app.config['LOGIN_THROTTLE_REDIS_URL'],
+                       app.config['LOGIN_THROTTLE_ENABLED'])
+        app.register_error_handler(TooManyAttempts, throttled_response)
+        self.stats_allowed = set(app.config['LOGIN_THROTTLE_STATS_ALLOWED'])
+        app.add_url_rule('/login-throttle-stats', 'login_throttle_stats', self.stats_view)
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def _take(self, kind, value, now):
+        burst, rate = self.limits[kind]
+        allowed, tokens = self.store.take(f'{kind}:{value[:MAX_KEY_LENGTH]}', burst, rate, now)
+        if not allowed:
+            self._count('throttled_' + kind)
+            raise TooManyAttempts((1 - tokens) / rate)
+
+    def check(self, login, ip):
+        """Учитывает попытку входа или бросает TooManyAttempts"""
+        if not self.enabled:
+            return
+        now = time.time()
+        # Сначала IP: перебор логинов с одного адреса не тратит корзины чужих учетных записей
+        self._take('ip', ip or '-', now)
+        self._take('login', login or '', now)
+        self._count('allowed')
+
+    def stats(self):
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['keys'] = len(self.store)
+        return stats
+
+    def stats_view(self):
+        # Счетчики подсказывают, когда перебор упирается в лимит, поэтому видны только с LOGIN_THROTTLE_STATS_ALLOWED
+        if request.remote_addr not in self.stats_allowed:
+            abort(404)
+        return jsonify(self.stats())
+
+    def reset(self):
+        self.store.clear()
+        with self._counters_lock:
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+def throttled_response(err):
+    retry_after = max(1, math.ceil(err.retry_after))
+    return ('Слишком много попыток входа, повторите попытку позже.', 429,
+            {'Retry-After': str(retry_after)})
+
+
+login_throttle = LoginThrottle()
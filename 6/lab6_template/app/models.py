@@ -2,7 +2,7 @@ import os
 from typing import Optional
 from datetime import datetime
 import sqlalchemy as sa
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import generate_password_hash
 from flask_login import UserMixin
 from flask import url_for
 from flask_sqlalchemy import SQLAlchemy
@@ -10,6 +10,8 @@ from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy import String, ForeignKey, Text, Integer, MetaData, DateTime
 
+from app.password_hasher import password_hasher
+
 
 class Base(DeclarativeBase):
   metadata = MetaData(naming_convention={
@@ -46,10 +48,11 @@ class User(Base, UserMixin):
     reviews: Mapped[list["Review"]] = relationship(back_populates="user")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # Вызывается из скриптов и тестов, а не из запросов, поэтому хеш считается на месте
+        self.password_hash = generate_password_hash(password, password_hasher.method)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
 
     @property
     def full_name(self):
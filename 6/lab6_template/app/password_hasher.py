@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Очередь хеширования заполнена, запрос отклоняется без вычисления хеша"""
+
+
+class PasswordHasher:
+    """Хеширование паролей в ограниченном пуле процессов.
+
+    KDF нагружает процессор и держит поток сервера, поэтому вычисления
+    уходят в отдельные процессы, а одновременно ожидающих задач не больше
+    max_pending: лишние запросы сразу получают HasherBusy (ответ 503).
+    При workers=0 хеши считаются в текущем потоке.
+    """
+
+    def __init__(self, method='scrypt', workers=None, max_pending=None, timeout=10):
+        self.configure(method, workers, max_pending, timeout)
+
+    def configure(self, method='scrypt', workers=None, max_pending=None, timeout=10):
+        self.method = method
+        self.workers = max(1, (os.cpu_count() or 2) // 2) if workers is None else workers
+        self.max_pending = max_pending or 2 * max(self.workers, 1)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._prefix = None
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', self.method)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', self.workers)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', self.max_pending)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'],
+                       app.config['PASSWORD_HASH_QUEUE'], app.config['PASSWORD_HASH_TIMEOUT'])
+        app.register_error_handler(HasherBusy, busy_response)
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: дочерние процессы не наследуют потоки и блокировки сервера
+                self._pool = ProcessPoolExecutor(self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusy()
+        future = None
+        try:
+            future = self._executor().submit(func, *args)
+            # Слот занят, пока процесс считает хеш, даже если запрос перестал ждать результат
+            future.add_done_callback(lambda _: slots.release())
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HasherBusy()
+        except BrokenProcessPool:
+            # Упавший пул не восстанавливается сам, следующий вызов создаст новый
+            with self._pool_lock:
+                self._pool = None
+            raise
+        finally:
+            if future is None:
+                slots.release()
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Хеш посчитан с другими параметрами, чем настроенные сейчас"""
+        if self._prefix is None:
+            # Полные параметры метода (например, scrypt:32768:8:1) известны только werkzeug
+            self._prefix = self._run(generate_password_hash, '', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
+
+    def verify(self, pwhash, password):
+        """Проверяет пароль; возвращает (совпал ли, новый хеш или None, если обновлять не нужно)"""
+        if not self.check(pwhash, password):
+            return False, None
+        if self.needs_rehash(pwhash):
+            return True, self.generate(password)
+        return True, None
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def busy_response(err):
+    return 'Сервер перегружен входами в систему, повторите попытку через несколько секунд.', 503, {'Retry-After': '1'}
+
+
+password_hasher = PasswordHasher()
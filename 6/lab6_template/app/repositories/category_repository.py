@@ -1,3 +1,4 @@
+from sqlalchemy import insert
 from app.models import Category
 
 class CategoryRepository:
@@ -5,4 +6,17 @@ class CategoryRepository:
         self.db = db
 
     def get_all_categories(self):
-        return self.db.session.execute(self.db.select(Category)).scalars()
\ No newline at end of file
+        return self.db.session.execute(self.db.select(Category)).scalars()
+
+    def get_name_map(self):
+        return dict(self.db.session.execute(self.db.select(Category.name, Category.id)).all())
+
+    def bulk_add_categories(self, rows):
+        if not rows:
+            return
+        try:
+            self.db.session.execute(insert(Category), rows)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            raise e
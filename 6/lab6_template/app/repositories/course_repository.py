@@ -1,3 +1,4 @@
+from sqlalchemy import insert
 from app.models import Course
 
 class CourseRepository:
@@ -48,3 +49,16 @@ class CourseRepository:
             raise e  # Пробрасываем любое другое исключение
         
         return course
+
+    def get_all_ids(self):
+        return set(self.db.session.execute(self.db.select(Course.id)).scalars())
+
+    def bulk_add_courses(self, rows):
+        if not rows:
+            return
+        try:
+            self.db.session.execute(insert(Course), rows)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            raise e
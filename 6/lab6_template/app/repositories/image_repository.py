@@ -12,6 +12,9 @@ class ImageRepository:
     def get_by_id(self, image_id):
         return self.db.session.get(Image, image_id)
 
+    def get_all_ids(self):
+        return set(self.db.session.execute(self.db.select(Image.id)).scalars())
+
     def add_image(self, file):
         self.img = self.__find_by_md5_hash(file)
         if self.img is not None:
@@ -1,5 +1,5 @@
-from app.models import Review
-from sqlalchemy import desc, asc
+from app.models import Review, Course
+from sqlalchemy import desc, asc, func, insert, update
 
 class ReviewRepository:
     def __init__(self, db):
@@ -42,18 +42,28 @@ class ReviewRepository:
         self.db.session.commit()
         return review
 
+    def get_reviewed_pairs(self):
+        """Множество пар (course_id, user_id), для которых отзыв уже оставлен"""
+        return {tuple(row) for row in self.db.session.execute(self.db.select(Review.course_id, Review.user_id))}
+
+    def bulk_add_reviews(self, rows):
+        """Добавить пачку отзывов одной транзакцией (без пересчета рейтинга)"""
+        if not rows:
+            return
+        try:
+            self.db.session.execute(insert(Review), rows)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            raise e
+
     def update_course_rating(self, course_id):
         """Пересчитать рейтинг курса на основе отзывов"""
-        from app.models import Course
-        
-        # Получаем все отзывы для курса
-        reviews = self.db.session.execute(
-            self.db.select(Review).filter_by(course_id=course_id)
-        ).scalars()
-        
-        rating_sum = sum(review.rating for review in reviews)
-        rating_num = sum(1 for review in reviews)
-        
+        rating_sum, rating_num = self.db.session.execute(
+            self.db.select(func.coalesce(func.sum(Review.rating), 0), func.count(Review.id))
+            .filter_by(course_id=course_id)
+        ).one()
+
         # Обновляем курс
         course = self.db.session.get(Course, course_id)
         if course:
@@ -61,3 +71,23 @@ class ReviewRepository:
             course.rating_num = rating_num
             self.db.session.commit()
 
+    def recalculate_all_ratings(self):
+        """Пересчитать рейтинги всех курсов одним агрегирующим запросом"""
+        stats = self.db.select(
+            Review.course_id,
+            func.sum(Review.rating).label('rating_sum'),
+            func.count(Review.id).label('rating_num')
+        ).group_by(Review.course_id).subquery()
+
+        try:
+            # Курсы без отзывов должны получить нулевой рейтинг
+            self.db.session.execute(update(Course).values(rating_sum=0, rating_num=0))
+            self.db.session.execute(
+                update(Course)
+                .where(Course.id == stats.c.course_id)
+                .values(rating_sum=stats.c.rating_sum, rating_num=stats.c.rating_num)
+            )
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            raise e
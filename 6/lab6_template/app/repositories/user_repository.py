@@ -1,3 +1,4 @@
+from sqlalchemy import insert
 from app.models import User
 
 class UserRepository:
@@ -11,4 +12,21 @@ class UserRepository:
         return self.db.session.execute(self.db.select(User).filter_by(id=user_id)).scalar()
 
     def get_user_by_login(self, login):
-        return self.db.session.execute(self.db.select(User).filter_by(login=login)).scalar()
\ No newline at end of file
+        return self.db.session.execute(self.db.select(User).filter_by(login=login)).scalar()
+
+    def update_password_hash(self, user, password_hash):
+        user.password_hash = password_hash
+        self.db.session.commit()
+
+    def get_login_map(self):
+        return dict(self.db.session.execute(self.db.select(User.login, User.id)).all())
+
+    def bulk_add_users(self, rows):
+        if not rows:
+            return
+        try:
+            self.db.session.execute(insert(User), rows)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            raise e
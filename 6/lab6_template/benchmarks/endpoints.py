@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки эндпоинтов приложения на большой синтетической базе
+
+Запуск:
+    python -m benchmarks.endpoints run --output results.json
+    python -m benchmarks.endpoints compare baseline.json results.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.models import db, User, Course, Category, Image
+from app.generator import DatasetGenerator
+
+DEFAULT_SEED_DB = os.path.join(tempfile.gettempdir(), 'lab6_bench_seed.db')
+# Метрики, по которым ищутся регрессии
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+class StatementCounter:
+    """Считает SQL-запросы, отправленные в базу во время запроса"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def make_app(db_path):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'SQLALCHEMY_ECHO': False,
+        'SECRET_KEY': 'bench-secret-key',
+    })
+
+
+def seed_database(path, options):
+    """Создает заполненную базу, если ее еще нет (генерация дорогая, поэтому база переиспользуется)"""
+    meta_path = path + '.json'
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            if json.load(f) == options:
+                return
+    for stale in (path, meta_path):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    print(f'🔄 Генерация базы {path}...')
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Image(id='default_bg', file_name='default.jpg',
+                             mime_type='image/jpeg', md5_hash='default_hash'))
+        db.session.commit()
+        DatasetGenerator(**options, progress=print).generate()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(options, f)
+
+
+class Scenario:
+    def __init__(self, name, method, url_factory, data=None, login=False):
+        self.name = name
+        self.method = method
+        self.url_factory = url_factory
+        self.data = data
+        self.login = login
+
+
+def build_scenarios(app):
+    with app.app_context():
+        # Самый популярный курс — худший случай для страниц отзывов
+        course_id = db.session.execute(
+            db.select(Course.id).order_by(Course.rating_num.desc()).limit(1)
+        ).scalar()
+        category_id = db.session.execute(db.select(Category.id).limit(1)).scalar()
+        name = db.session.execute(db.select(Course.name).limit(1)).scalar().split()[0]
+        course_ids = db.session.execute(db.select(Course.id).order_by(Course.id)).scalars().all()
+
+    def review_url(i):
+        return f'/courses/{course_ids[i % len(course_ids)]}/reviews/create'
+
+    scenarios = [
+        Scenario('main.index', 'GET', lambda i: '/'),
+        Scenario('courses.index', 'GET', lambda i: '/courses/'),
+        Scenario('courses.index[name]', 'GET', lambda i: f'/courses/?name={name}'),
+        Scenario('courses.index[category]', 'GET', lambda i: f'/courses/?category_ids={category_id}'),
+        Scenario('courses.show', 'GET', lambda i: f'/courses/{course_id}'),
+    ]
+    for sort_by in ('newest', 'positive', 'negative'):
+        scenarios.append(Scenario(
+            f'courses.reviews[{sort_by}]', 'GET',
+            lambda i, sort_by=sort_by: f'/courses/{course_id}/reviews?sort_by={sort_by}'
+        ))
+    scenarios.append(Scenario('courses.create_review', 'POST', review_url,
+                              data={'rating': 4, 'text': 'Отзыв из бенчмарка'}, login=True))
+    scenarios.append(Scenario('main.image', 'GET', lambda i: '/images/default_bg'))
+    return scenarios, len(course_ids)
+
+
+def create_bench_user(app):
+    """Пользователь без отзывов: каждый POST создает новый отзыв, а не упирается в дубликат"""
+    with app.app_context():
+        user = User(first_name='Бенчмарк', last_name='Бенчмарков',
+                    login=f'bench{time.time_ns()}', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def run_scenario(app, client, counter, scenario, requests, warmup):
+    latencies = []
+    statements = []
+    statuses = {}
+    for i in range(warmup + requests):
+        url = scenario.url_factory(i)
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(url, method=scenario.method, data=scenario.data)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        statements.append(counter.count)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    p50, p95, p99 = percentiles(latencies)
+    return {
+        'requests': requests,
+        'rps': requests / (sum(latencies) / 1000) if latencies else 0.0,
+        'mean_ms': statistics.fmean(latencies) if latencies else 0.0,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'max_ms': max(latencies, default=0.0),
+        'sql_per_request': statistics.fmean(statements) if statements else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def run(args):
+    options = dict(seed=args.seed, users=args.users, categories=args.categories,
+                   category_depth=args.category_depth, courses=args.courses,
+                   max_reviews=args.max_reviews, zipf_s=args.zipf)
+    seed_database(args.seed_db, options)
+
+    # Сценарии пишут в базу, поэтому каждый прогон идет на свежей копии
+    work_dir = tempfile.mkdtemp()
+    db_path = os.path.join(work_dir, 'bench.db')
+    shutil.copyfile(args.seed_db, db_path)
+
+    try:
+        app = make_app(db_path)
+        scenarios, courses_count = build_scenarios(app)
+        bench_user_id = create_bench_user(app)
+        results = {}
+        with app.app_context():
+            counter = StatementCounter(db.engine)
+        for scenario in scenarios:
+            if args.only and not any(pattern in scenario.name for pattern in args.only):
+                continue
+            requests = args.requests
+            if scenario.method == 'POST':
+                requests = min(requests, courses_count - args.warmup)
+            client = app.test_client()
+            if scenario.login:
+                with client.session_transaction() as sess:
+                    sess['_user_id'] = str(bench_user_id)
+                    sess['_fresh'] = True
+            result = run_scenario(app, client, counter, scenario, requests, args.warmup)
+            results[scenario.name] = result
+            print(f"{scenario.name:<28} {result['rps']:>8.1f} req/s  "
+                  f"p50 {result['p50_ms']:>7.2f} ms  p95 {result['p95_ms']:>7.2f} ms  "
+                  f"p99 {result['p99_ms']:>7.2f} ms  SQL {result['sql_per_request']:>5.1f}  "
+                  f"{result['statuses']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'dataset': options,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'\n✓ Результаты сохранены в {args.output}')
+    return report
+
+
+def compare_reports(baseline, current, threshold):
+    """Возвращает список регрессий: рост задержки больше порога или рост числа SQL-запросов"""
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if old[metric] > 0 and new[metric] > old[metric] * (1 + threshold):
+                regressions.append((name, metric, old[metric], new[metric]))
+        if new['sql_per_request'] > old['sql_per_request']:
+            regressions.append((name, 'sql_per_request', old['sql_per_request'], new['sql_per_request']))
+    return regressions
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f'{name:<28} нет в базовом прогоне')
+            continue
+        change = (new['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0.0
+        print(f"{name:<28} p50 {old['p50_ms']:>7.2f} → {new['p50_ms']:>7.2f} ms ({change:+.1f}%)  "
+              f"SQL {old['sql_per_request']:.1f} → {new['sql_per_request']:.1f}")
+
+    regressions = compare_reports(baseline, current, args.threshold)
+    if regressions:
+        print(f'\n❌ Найдены регрессии (порог {args.threshold:.0%}):')
+        for name, metric, old, new in regressions:
+            print(f'  {name}: {metric} {old:.2f} → {new:.2f}')
+        return 1
+    print('\n✓ Регрессий не найдено')
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарки эндпоинтов лабораторной работы №6')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='прогнать бенчмарки')
+    run_parser.add_argument('--seed-db', default=DEFAULT_SEED_DB,
+                            help='путь к заполненной базе (создается при отсутствии)')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--users', type=int, default=20000)
+    run_parser.add_argument('--categories', type=int, default=50)
+    run_parser.add_argument('--category-depth', type=int, default=3)
+    run_parser.add_argument('--courses', type=int, default=5000)
+    run_parser.add_argument('--max-reviews', type=int, default=20000)
+    run_parser.add_argument('--zipf', type=float, default=1.1)
+    run_parser.add_argument('--requests', type=int, default=200,
+                            help='количество измеряемых запросов на сценарий')
+    run_parser.add_argument('--warmup', type=int, default=10)
+    run_parser.add_argument('--only', nargs='*', help='запускать только сценарии, содержащие подстроку')
+    run_parser.add_argument('--output', help='файл для сохранения результатов в JSON')
+
+    compare_parser = subparsers.add_parser('compare', help='сравнить два прогона')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='допустимый относительный рост задержки (0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'run':
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@
 Скрипт для инициализации базы данных и создания тестовых данных
 """
 
+import argparse
 import os
 import shutil
 import sys
@@ -13,8 +14,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app
 from app.models import db, User, Category, Course, Image, Review
+from app.generator import DatasetGenerator
 
-def init_database():
+def init_database(generate_options=None):
     """Инициализация базы данных"""
     app = create_app()
     
@@ -92,10 +94,34 @@ def init_database():
             db.session.add(course)
             db.session.commit()
             print("✓ Тестовый курс создан")
+
+        # Синтетические данные для нагрузочного тестирования
+        if generate_options is not None:
+            db.engine.echo = False
+            stats = DatasetGenerator(**generate_options, progress=print).generate()
+            print(f"✓ Синтетические данные сгенерированы за {stats['seconds']:.1f} с")
         
         print("\n🎉 База данных успешно инициализирована!")
         print("Для запуска приложения выполните: flask run")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Инициализация базы данных')
+    parser.add_argument('--generate', action='store_true',
+                        help='сгенерировать синтетический набор данных')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--category-depth', type=int, default=3)
+    parser.add_argument('--courses', type=int, default=500)
+    parser.add_argument('--max-reviews', type=int, default=1000,
+                        help='количество отзывов у самого популярного курса')
+    parser.add_argument('--zipf', dest='zipf_s', type=float, default=1.1,
+                        help='показатель распределения Ципфа для числа отзывов на курс')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    init_database()
+    args = vars(parse_args())
+    generate = args.pop('generate')
+    init_database(args if generate else None)
 
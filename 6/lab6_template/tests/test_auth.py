@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from werkzeug.security import generate_password_hash
+
+from app.models import db, User
+from app.password_hasher import password_hasher
+
+
+class TestLogin:
+    """Тесты входа и хеширования паролей"""
+
+    def create_user(self, app, password_hash):
+        with app.app_context():
+            user = User(first_name='Тест', last_name='Пользователь', login='testuser',
+                        password_hash=password_hash)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    def test_login_upgrades_outdated_hash(self, app, client):
+        """Тест пересчета хеша со старыми параметрами при входе"""
+        user_id = self.create_user(app, generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+
+        response = client.post('/auth/login', data={'login': 'testuser', 'password': 'secret'})
+
+        assert response.status_code == 302
+        with app.app_context():
+            password_hash = db.session.get(User, user_id).password_hash
+            assert not password_hasher.needs_rehash(password_hash)
+            assert password_hasher.check(password_hash, 'secret')
+
+    def test_login_rejected_when_hasher_busy(self, app, client):
+        """Тест быстрого отказа с 503, когда очередь хеширования заполнена"""
+        self.create_user(app, generate_password_hash('secret'))
+
+        with patch.object(password_hasher, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = client.post('/auth/login', data={'login': 'testuser', 'password': 'secret'})
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+    def test_login_throttled_before_hashing(self, app, client):
+        """Тест ответа 429 после исчерпания попыток входа без проверки пароля"""
+        self.create_user(app, generate_password_hash('secret'))
+        for _ in range(app.config['LOGIN_THROTTLE_LOGIN_BURST']):
+            response = client.post('/auth/login', data={'login': 'testuser', 'password': 'wrong'})
+            assert response.status_code == 200
+
+        with patch.object(password_hasher, 'verify') as verify:
+            response = client.post('/auth/login', data={'login': 'testuser', 'password': 'secret'})
+
+        assert response.status_code == 429
+        assert 'Retry-After' in response.headers
+        verify.assert_not_called()
+        assert client.get('/login-throttle-stats').get_json()['throttled_login'] == 1
+        assert client.get('/login-throttle-stats', environ_base={'REMOTE_ADDR': '203.0.113.5'}).status_code == 404
@@ -0,0 +1,30 @@
+from benchmarks.endpoints import compare_reports, percentiles
+
+
+def report(p50, p95, sql):
+    return {'results': {'courses.index': {'p50_ms': p50, 'p95_ms': p95, 'sql_per_request': sql}}}
+
+
+class TestBenchmarks:
+    """Тесты сравнения результатов бенчмарков"""
+
+    def test_percentiles(self):
+        """Тест расчета перцентилей"""
+        p50, p95, p99 = percentiles(list(range(1, 102)))
+        assert p50 == 51
+        assert p95 == 96
+        assert p99 == 100
+
+    def test_no_regression_within_threshold(self):
+        """Тест: рост задержки в пределах порога не считается регрессией"""
+        assert compare_reports(report(10, 20, 5), report(11, 21, 5), threshold=0.2) == []
+
+    def test_latency_regression(self):
+        """Тест: рост задержки выше порога считается регрессией"""
+        regressions = compare_reports(report(10, 20, 5), report(13, 20, 5), threshold=0.2)
+        assert regressions == [('courses.index', 'p50_ms', 10, 13)]
+
+    def test_sql_count_regression(self):
+        """Тест: любое увеличение числа SQL-запросов считается регрессией"""
+        regressions = compare_reports(report(10, 20, 5), report(10, 20, 6), threshold=0.2)
+        assert regressions == [('courses.index', 'sql_per_request', 5, 6)]
@@ -0,0 +1,79 @@
+from app.models import db, User, Category, Course, Review
+from app.generator import DatasetGenerator, zipf_sizes
+
+
+def snapshot(app):
+    with app.app_context():
+        users = db.session.execute(db.select(User.login, User.last_name)).all()
+        courses = db.session.execute(
+            db.select(Course.id, Course.name, Course.rating_sum, Course.rating_num).order_by(Course.id)
+        ).all()
+        reviews = db.session.execute(
+            db.select(Review.course_id, Review.user_id, Review.rating).order_by(Review.id)
+        ).all()
+        return users, courses, reviews
+
+
+class TestGenerator:
+    """Тесты генератора синтетических данных"""
+
+    options = dict(seed=7, users=50, categories=10, category_depth=3,
+                   courses=20, max_reviews=40, batch_size=16)
+
+    def test_zipf_sizes(self):
+        """Тест распределения Ципфа"""
+        assert zipf_sizes(4, 100, 1) == [100, 50, 33, 25]
+
+    def test_generate_counts_and_ratings(self, app):
+        """Тест согласованности rating_sum/rating_num с отзывами"""
+        with app.app_context():
+            stats = DatasetGenerator(**self.options).generate()
+
+            assert stats['users'] == 50
+            assert db.session.execute(db.select(db.func.count(Category.id))).scalar() == 10
+            assert db.session.execute(db.select(db.func.count(Review.id))).scalar() == stats['reviews']
+
+            aggregates = dict(
+                (course_id, (rating_sum, rating_num)) for course_id, rating_sum, rating_num in
+                db.session.execute(db.select(
+                    Review.course_id, db.func.sum(Review.rating), db.func.count(Review.id)
+                ).group_by(Review.course_id)).all()
+            )
+            for course in db.session.execute(db.select(Course)).scalars():
+                assert (course.rating_sum, course.rating_num) == aggregates.get(course.id, (0, 0))
+
+            duplicates = db.session.execute(
+                db.select(Review.course_id, Review.user_id)
+                .group_by(Review.course_id, Review.user_id)
+                .having(db.func.count(Review.id) > 1)
+            ).all()
+            assert duplicates == []
+
+    def test_generate_category_depth(self, app):
+        """Тест ограничения глубины вложенности категорий"""
+        with app.app_context():
+            DatasetGenerator(**self.options).generate()
+            parents = dict(db.session.execute(db.select(Category.id, Category.parent_id)).all())
+            for category_id in parents:
+                depth = 0
+                while parents[category_id] is not None:
+                    category_id = parents[category_id]
+                    depth += 1
+                assert depth < 3
+
+    def test_generate_is_deterministic(self, app, tmp_path):
+        """Тест воспроизводимости набора данных при одинаковом seed"""
+        from app import create_app
+
+        with app.app_context():
+            DatasetGenerator(**self.options).generate()
+
+        other = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "other.db"}',
+        })
+        with other.app_context():
+            db.create_all()
+            DatasetGenerator(**self.options).generate()
+
+        assert snapshot(app) == snapshot(other)
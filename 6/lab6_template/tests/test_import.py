@@ -0,0 +1,183 @@
+import json
+import os
+import pytest
+from app.models import db, User, Course, Category, Image, Review
+from app.repositories import ReviewRepository
+from app.cli import UserImporter, run_import
+
+
+def write_jsonl(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+@pytest.fixture
+def catalog(app):
+    """Категория, автор и курс, на которые ссылаются импортируемые данные"""
+    with app.app_context():
+        author = User(first_name='Иван', last_name='Иванов', login='author', password_hash='hash')
+        db.session.add_all([author, Category(name='Программирование'),
+                            Image(id='default_bg', file_name='default.jpg', mime_type='image/jpeg', md5_hash='default')])
+        db.session.commit()
+        course = Course(
+            name='Тестовый курс',
+            short_desc='Короткое описание',
+            full_desc='Полное описание',
+            category_id=1,
+            author_id=author.id,
+            background_image_id='default_bg'
+        )
+        db.session.add(course)
+        db.session.commit()
+
+
+class TestImport:
+    """Тесты массового импорта"""
+
+    def test_import_users_csv(self, app, runner, tmp_path):
+        """Тест импорта пользователей из CSV"""
+        path = tmp_path / 'users.csv'
+        path.write_text(
+            'login,first_name,last_name,middle_name,password_hash\n'
+            'user1,Петр,Петров,,hash1\n'
+            'user2,Анна,Сидорова,Ивановна,hash2\n',
+            encoding='utf-8'
+        )
+
+        result = runner.invoke(args=['import', 'users', str(path)])
+
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            users = db.session.execute(db.select(User).order_by(User.login)).scalars().all()
+            assert [u.login for u in users] == ['user1', 'user2']
+            assert users[0].middle_name is None
+            assert users[1].middle_name == 'Ивановна'
+        assert not os.path.exists(str(path) + '.progress')
+
+    def test_import_courses_resolves_foreign_keys(self, app, runner, tmp_path, catalog):
+        """Тест разрешения внешних ключей курсов по названию категории и логину автора"""
+        path = tmp_path / 'courses.jsonl'
+        write_jsonl(path, [
+            {'id': 100, 'name': 'Курс', 'short_desc': 'Описание',
+             'category': 'Программирование', 'author_login': 'author'},
+            {'name': 'Без категории', 'short_desc': 'Описание',
+             'category': 'Неизвестная', 'author_login': 'author'},
+        ])
+
+        result = runner.invoke(args=['import', 'courses', str(path)])
+
+        assert result.exit_code == 0, result.output
+        assert 'пропущено: 1' in result.output
+        with app.app_context():
+            course = db.session.get(Course, 100)
+            assert course is not None
+            assert course.category_id == 1
+            assert course.background_image_id == 'default_bg'
+
+    def test_import_reviews_recalculates_ratings(self, app, runner, tmp_path, catalog):
+        """Тест пакетного импорта отзывов с пересчетом рейтинга в конце"""
+        path = tmp_path / 'reviews.jsonl'
+        write_jsonl(path, [
+            {'course_id': 1, 'user_login': 'author', 'rating': 5, 'text': 'Отлично'},
+            {'course_id': 1, 'user_id': 2, 'rating': 2, 'text': 'Плохо'},
+            {'course_id': 1, 'user_login': 'author', 'rating': 7, 'text': 'Неверная оценка'},
+            {'course_id': 999, 'user_login': 'author', 'rating': 4, 'text': 'Нет курса'},
+        ])
+
+        with app.app_context():
+            db.session.add(User(first_name='Анна', last_name='Петрова', login='student', password_hash='hash'))
+            db.session.commit()
+
+        result = runner.invoke(args=['import', 'reviews', str(path), '--batch-size', '1'])
+
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            assert db.session.execute(db.select(db.func.count(Review.id))).scalar() == 2
+            course = db.session.get(Course, 1)
+            assert course.rating_sum == 7
+            assert course.rating_num == 2
+
+    def test_import_skips_duplicates_and_unknown_images(self, app, runner, tmp_path, catalog):
+        """Тест пропуска повторных отзывов, занятых id курсов и несуществующих изображений"""
+        courses = tmp_path / 'courses.jsonl'
+        write_jsonl(courses, [
+            {'id': 1, 'name': 'Занятый id', 'short_desc': 'Описание', 'category_id': 1, 'author_id': 1},
+            {'name': 'Без картинки', 'short_desc': 'Описание', 'category_id': 1, 'author_id': 1,
+             'background_image_id': 'missing'},
+            {'id': 2, 'name': 'Новый курс', 'short_desc': 'Описание', 'category_id': 1, 'author_id': 1},
+        ])
+        reviews = tmp_path / 'reviews.jsonl'
+        write_jsonl(reviews, [
+            {'course_id': 1, 'user_login': 'author', 'rating': 5, 'text': 'Первый'},
+            {'course_id': 1, 'user_login': 'author', 'rating': 1, 'text': 'Повтор в файле'},
+            {'course_id': 2, 'user_login': 'author', 'rating': 2, 'text': 'Повтор отзыва из базы'},
+        ])
+
+        result = runner.invoke(args=['import', 'courses', str(courses)])
+        assert result.exit_code == 0, result.output
+        assert 'пропущено: 2' in result.output
+        assert "изображение 'missing' не найдено" in result.output
+
+        with app.app_context():
+            db.session.add(Review(rating=4, text='Уже в базе', course_id=2, user_id=1))
+            db.session.commit()
+
+        result = runner.invoke(args=['import', 'reviews', str(reviews), '--batch-size', '1'])
+        assert result.exit_code == 0, result.output
+        assert 'Импортировано записей: 1, пропущено: 2' in result.output
+        assert 'отзыв пользователя 1 на курс 2 уже существует' in result.output
+        with app.app_context():
+            assert db.session.get(Course, 2).name == 'Новый курс'
+            texts = db.session.execute(db.select(Review.text).order_by(Review.id)).scalars().all()
+            assert texts == ['Уже в базе', 'Первый']
+
+    def test_import_skips_rows_violating_constraints(self, app, runner, tmp_path):
+        """Тест: нарушение ограничения базы пропускает одну запись, а не всю пачку"""
+        path = tmp_path / 'users.jsonl'
+        write_jsonl(path, [
+            {'login': login, 'first_name': 'Имя', 'last_name': 'Фамилия', 'password_hash': 'hash'}
+            for login in ('user1', 'user2', 'user3')
+        ])
+        with app.app_context():
+            importer = UserImporter()
+            # Пользователь появляется в базе уже после загрузки справочника логинов
+            db.session.add(User(first_name='Имя', last_name='Фамилия', login='user2', password_hash='hash'))
+            db.session.commit()
+
+            imported, errors = run_import(importer, str(path), 'jsonl', batch_size=10, resume=False)
+
+            assert (imported, errors) == (2, 1)
+            logins = db.session.execute(db.select(User.login).order_by(User.login)).scalars().all()
+            assert logins == ['user1', 'user2', 'user3']
+
+    def test_import_resumes_from_checkpoint(self, app, runner, tmp_path, catalog):
+        """Тест продолжения импорта с контрольной точки"""
+        path = tmp_path / 'reviews.jsonl'
+        write_jsonl(path, [
+            {'course_id': 1, 'user_login': 'author', 'rating': 5, 'text': 'Уже загружен'},
+            {'course_id': 1, 'user_login': 'author', 'rating': 3, 'text': 'Новый'},
+        ])
+        (tmp_path / 'reviews.jsonl.progress').write_text('{"rows": 1}', encoding='utf-8')
+
+        result = runner.invoke(args=['import', 'reviews', str(path)])
+
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            reviews = db.session.execute(db.select(Review)).scalars().all()
+            assert [r.text for r in reviews] == ['Новый']
+
+    def test_recalculate_all_ratings(self, app, catalog):
+        """Тест пересчета рейтингов всех курсов одним запросом"""
+        with app.app_context():
+            course = db.session.get(Course, 1)
+            course.rating_sum = 100
+            course.rating_num = 10
+            db.session.add(Review(rating=4, text='Хорошо', course_id=1, user_id=1))
+            db.session.commit()
+
+            ReviewRepository(db).recalculate_all_ratings()
+
+            course = db.session.get(Course, 1)
+            assert course.rating_sum == 4
+            assert course.rating_num == 1
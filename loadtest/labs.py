@@ -0,0 +1,102 @@
+"""
+Описание лабораторных работ для нагрузочного тестирования: где лежит приложение,
+как его запустить и какие пользовательские сценарии по нему гонять
+"""
+
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Step:
+    """Один HTTP-запрос сценария. path и data могут быть функциями от контекста пользователя"""
+
+    def __init__(self, name, path, method='GET', data=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+
+    def resolve(self, ctx):
+        path = self.path(ctx) if callable(self.path) else self.path
+        data = self.data(ctx) if callable(self.data) else self.data
+        return path, data
+
+
+class Lab:
+    def __init__(self, name, directory, app, journey, factory=False, prepare=None, env=None):
+        self.name = name
+        self.directory = os.path.join(ROOT, directory)
+        self.app = app
+        self.factory = factory
+        self.journey = journey
+        self.prepare = prepare
+        self.env = env or {}
+
+
+# Сценарии входят в систему в цикле с одного адреса, ограничение попыток входа
+# превратило бы нагрузку в поток ответов 429
+NO_LOGIN_THROTTLE = {'FLASK_LOGIN_THROTTLE_ENABLED': 'false'}
+
+# Количество сгенерированных пользователей и курсов для лабораторной №6
+LAB6_USERS = 2000
+LAB6_COURSES = 200
+
+
+def lab6_login(ctx):
+    # Пользователи генератора имеют логины user<id>, id начинаются с 2 (1 — пользователь init_db.py)
+    return {'login': f"user{2 + ctx['vu'] % LAB6_USERS}", 'password': 'qwerty'}
+
+
+def lab6_course(ctx):
+    ctx['course_id'] = ctx['rng'].randint(1, LAB6_COURSES + 1)
+    return f"/courses/{ctx['course_id']}"
+
+
+LABS = {
+    'lab1': Lab('lab1', os.path.join('1', 'lab1_template (2)', 'app'), 'app:app', [
+        Step('index', '/'),
+        Step('posts', '/posts'),
+        Step('post', lambda ctx: f"/posts/{ctx['rng'].randrange(5)}"),
+        Step('about', '/about'),
+    ]),
+    'lab2': Lab('lab2', '2', 'app:app', [
+        Step('index', '/'),
+        Step('url_params', '/url_params?name=John&age=25'),
+        Step('headers', '/headers'),
+        Step('phone_validation', '/phone_validation', 'POST',
+             lambda ctx: {'phone': f"+7 (9{ctx['rng'].randrange(10, 100)}) 456-75-90"}),
+    ]),
+    'lab3': Lab('lab3', '3', 'app:app', [
+        Step('index', '/'),
+        Step('counter', '/counter'),
+        Step('login', '/login', 'POST', {'username': 'user', 'password': 'qwerty'}),
+        Step('secret', '/secret'),
+        Step('logout', '/logout'),
+    ], env=NO_LOGIN_THROTTLE),
+    'lab4': Lab('lab4', '4', 'app:app', [
+        Step('login', '/login', 'POST', {'login': 'admin', 'password': 'admin123'}),
+        Step('index', '/'),
+        Step('view_user', '/user/1'),
+        Step('logout', '/logout'),
+    ], env=NO_LOGIN_THROTTLE),
+    'lab5': Lab('lab5', os.path.join('5', '4'), 'app:app', [
+        Step('login', '/login', 'POST', {'login': 'admin', 'password': 'admin123'}),
+        Step('index', '/'),
+        Step('view_user', '/user/1'),
+        Step('logout', '/logout'),
+    ], env=NO_LOGIN_THROTTLE),
+    'lab6': Lab('lab6', os.path.join('6', 'lab6_template'), 'app:create_app', [
+        Step('login', '/auth/login', 'POST', lab6_login),
+        Step('catalog', '/courses/'),
+        Step('catalog_page', lambda ctx: f"/courses/?page={ctx['rng'].randint(1, 10)}"),
+        Step('course', lab6_course),
+        Step('reviews', lambda ctx: f"/courses/{ctx['course_id']}/reviews?sort_by=positive"),
+        Step('create_review', lambda ctx: f"/courses/{ctx['course_id']}/reviews/create", 'POST',
+             lambda ctx: {'rating': ctx['rng'].randint(1, 5), 'text': 'Отзыв из нагрузочного теста'}),
+        Step('logout', '/auth/logout'),
+    ], factory=True, prepare=[
+        'init_db.py', '--generate', '--users', str(LAB6_USERS), '--courses', str(LAB6_COURSES),
+        '--max-reviews', '500',
+    ], env=dict(NO_LOGIN_THROTTLE, FLASK_SQLALCHEMY_ECHO='false')),
+}
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Нагрузочное тестирование лабораторных работ под настоящим WSGI-сервером
+
+Пример:
+    python -m loadtest.run lab6 --server waitress --threads 8 --levels 1 4 16 32 --duration 10
+    python -m loadtest.run lab4 --server gunicorn --workers 4 --threads 2 --output lab4.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from loadtest.labs import LABS
+
+LOCKED_MARKER = 'database is locked'
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Редиректы не выполняются: каждый запрос сценария измеряется отдельно"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def copy_lab(lab, work_dir):
+    """Копия лабораторной, чтобы нагрузка не портила базы в instance/"""
+    target = os.path.join(work_dir, lab.name)
+    shutil.copytree(lab.directory, target,
+                    ignore=shutil.ignore_patterns('__pycache__', '*.pyc', '.pytest_cache'))
+    return target
+
+
+def server_command(args, lab, port):
+    if args.server == 'gunicorn':
+        spec = lab.app + '()' if lab.factory else lab.app
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}', spec]
+    command = [sys.executable, '-m', 'waitress', '--host=127.0.0.1', f'--port={port}',
+               f'--threads={args.threads}']
+    if lab.factory:
+        command.append('--call')
+    return command + [lab.app]
+
+
+class Server:
+    def __init__(self, command, cwd, env, log_path):
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.log_path = log_path
+        self.process = None
+
+    def __enter__(self):
+        self.log = open(self.log_path, 'w', encoding='utf-8')
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        return self
+
+    def wait_ready(self, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Сервер завершился с кодом {self.process.returncode}, '
+                                   f'см. {self.log_path}')
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f'Сервер не запустился за {timeout} с, см. {self.log_path}')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+    def locked_errors(self):
+        with open(self.log_path, encoding='utf-8', errors='replace') as f:
+            return sum(line.count(LOCKED_MARKER) for line in f)
+
+
+class VirtualUser:
+    def __init__(self, vu, base_url, journey, seed, timeout):
+        self.base_url = base_url
+        self.journey = journey
+        self.timeout = timeout
+        self.ctx = {'vu': vu, 'rng': random.Random(seed * 100003 + vu)}
+
+    def run_journey(self, samples):
+        # Новые cookie на каждый проход: сценарий начинается с анонимного пользователя
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect
+        )
+        for step in self.journey:
+            path, data = step.resolve(self.ctx)
+            body = urllib.parse.urlencode(data).encode() if data is not None else None
+            request = urllib.request.Request(self.base_url + path, data=body, method=step.method)
+            started = time.perf_counter()
+            locked = False
+            try:
+                with opener.open(request, timeout=self.timeout) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as err:
+                status = err.code
+                locked = LOCKED_MARKER in err.read().decode('utf-8', errors='replace')
+            except OSError:
+                status = 0
+            samples.append((step.name, time.perf_counter() - started, status, locked))
+
+
+def run_level(lab, base_url, concurrency, duration, seed, timeout):
+    """Гонит сценарии concurrency пользователями в течение duration секунд"""
+    samples = []
+    deadline = time.monotonic() + duration
+
+    def worker(vu):
+        user = VirtualUser(vu, base_url, lab.journey, seed, timeout)
+        local = []
+        while time.monotonic() < deadline:
+            user.run_journey(local)
+        samples.extend(local)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(vu,)) for vu in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s[1] * 1000 for s in samples)
+    errors = sum(1 for s in samples if s[2] == 0 or s[2] >= 400)
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'locked': sum(1 for s in samples if s[3]),
+    }
+
+
+def run(args):
+    lab = LABS[args.lab]
+    work_dir = tempfile.mkdtemp(prefix=f'loadtest_{lab.name}_')
+    try:
+        cwd = copy_lab(lab, work_dir)
+        env = dict(os.environ, **lab.env)
+        if lab.prepare and not args.skip_prepare:
+            print(f'🔄 Подготовка данных: {" ".join(lab.prepare)}')
+            subprocess.run([sys.executable] + lab.prepare, cwd=cwd, env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        command = server_command(args, lab, port)
+        print(f'🚀 {" ".join(command)}')
+
+        levels = []
+        with Server(command, cwd, env, os.path.join(work_dir, 'server.log')) as server:
+            server.wait_ready(port)
+            for concurrency in args.levels:
+                samples, elapsed = run_level(lab, base_url, concurrency, args.duration,
+                                             args.seed, args.timeout)
+                summary = summarize(samples, elapsed)
+                summary['concurrency'] = concurrency
+                summary['steps'] = {
+                    step.name: summarize([s for s in samples if s[0] == step.name], elapsed)
+                    for step in lab.journey
+                }
+                levels.append(summary)
+                print(f"{concurrency:>4} VU  {summary['rps']:>8.1f} req/s  "
+                      f"p50 {summary['p50_ms']:>8.2f} ms  p95 {summary['p95_ms']:>8.2f} ms  "
+                      f"p99 {summary['p99_ms']:>8.2f} ms  ошибки {summary['error_rate']:>6.1%}  "
+                      f"locked {summary['locked']}")
+            server_locked = server.locked_errors()
+        print(f'Ошибок блокировки SQLite в журнале сервера: {server_locked}')
+
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'lab': lab.name,
+                'server': args.server,
+                'workers': args.workers if args.server == 'gunicorn' else 1,
+                'threads': args.threads,
+                'duration': args.duration,
+                'seed': args.seed,
+            },
+            'levels': levels,
+            'server_locked_errors': server_locked,
+        }
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f'✓ Отчет сохранен в {args.output}')
+        return report
+    finally:
+        if args.keep:
+            print(f'Рабочая копия сохранена: {work_dir}')
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочное тестирование лабораторных работ')
+    parser.add_argument('lab', choices=sorted(LABS))
+    parser.add_argument('--server', choices=['waitress', 'gunicorn'], default='waitress')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='количество процессов (только gunicorn)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='уровни конкурентности (число виртуальных пользователей)')
+    parser.add_argument('--duration', type=float, default=10, help='длительность уровня, с')
+    parser.add_argument('--timeout', type=float, default=30, help='таймаут запроса, с')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-prepare', action='store_true',
+                        help='не генерировать данные перед запуском')
+    parser.add_argument('--keep', action='store_true', help='не удалять рабочую копию')
+    parser.add_argument('--output', help='файл для отчета в JSON')
+    args = parser.parse_args(argv)
+    if args.server == 'waitress' and args.workers != 1:
+        parser.error('waitress работает в одном процессе, используйте --threads')
+    return args
+
+
+if __name__ == '__main__':
+    run(parse_args())